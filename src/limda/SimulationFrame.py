@@ -1,6 +1,5 @@
 import pandas as pd
 import numpy as np
-import random
 from copy import deepcopy
 import sys
 import os
@@ -9,6 +8,8 @@ from .import_frame import ImportFrame
 from .export_frame import ExportFrame
 from .calculate import Calculate
 from .analyze_frame import AnalyzeFrame
+from .analyze_mols import get_two_coloring_using_cython
+from .spatial_index import SpatialIndex, sum_in_slabs
 from . import const as C
 
 
@@ -121,17 +122,57 @@ class SimulationFrame(
             replicate_directions = [2, 3, 4] とする
 
         """
-        for i, dim in enumerate(['x', 'y', 'z']):
-            copy_atoms = self.atoms.copy()
-            for idx in range(1, replicate_directions[i]):
-                def replicate(d): return d[dim] + self.cell[i]*idx
-                append_atoms = copy_atoms.copy()
-                append_atoms[dim] = append_atoms.apply(replicate, axis=1)
-                self.atoms = pd.concat([self.atoms, append_atoms])
+        self.make_supercell(replicate_directions)
 
-        self.atoms.reset_index(drop=True, inplace=True)
-        for dim in range(3):
-            self.cell[dim] *= replicate_directions[dim]
+    def make_supercell(self, replicate_directions: list[int] = [1, 1, 1]) -> None:
+        """
+        x, y, z 方向にセルを複製する関数
+        出力の配列を一度に確保し、すべてのimageの座標をbroadcastで計算する.
+        atomsのすべてのcolumn(mask, 速度, fixx...)が複製される.
+
+        Parameters
+        ----------
+        replicate_directions : list
+            x, y, z方向(三斜晶のセルではcellの1, 2, 3行目の格子ベクトル方向)に何倍するかを指定する。
+            例えばx方向に2倍,y方向に3倍,z方向に4倍したい時は
+            replicate_directions = [2, 3, 4] とする
+        Note
+        ----
+            原子の順番はreplicate_atoms()と同じで、
+            元の原子の並びがx方向のimage, y方向のimage, z方向のimageの順に繰り返される.
+            cellはshape:[3]の直方体のセルとshape:(3, 3)の三斜晶のセルのどちらでもよい.
+        """
+        replicate_directions = np.array(replicate_directions, dtype=np.int64)
+        assert replicate_directions.shape == (3,), "Specify replicate_directions for the [x, y, z] direction"
+        assert np.all(replicate_directions >= 1), "replicate_directions must be positive"
+        cell = np.array(self.cell, dtype=np.float64)
+
+        # image_idx: shape (image_num, 3), x方向のimageが最も速く変わる
+        image_z, image_y, image_x = np.meshgrid(np.arange(replicate_directions[2]),
+                                                np.arange(replicate_directions[1]),
+                                                np.arange(replicate_directions[0]),
+                                                indexing="ij")
+        image_idx = np.stack(
+            [image_x.ravel(), image_y.ravel(), image_z.ravel()], axis=1)
+        if cell.ndim == 1:
+            shifts = image_idx * cell
+        else:
+            shifts = image_idx @ cell
+        image_num = len(shifts)
+
+        new_atoms = {}
+        for col in self.atoms.columns:
+            new_atoms[col] = np.tile(self.atoms[col].values, image_num)
+        pos = self.atoms[['x', 'y', 'z']].values.astype(np.float64)
+        new_pos = (shifts[:, np.newaxis, :] + pos[np.newaxis, :, :]).reshape(-1, 3)
+        for dim, col in enumerate(['x', 'y', 'z']):
+            new_atoms[col] = new_pos[:, dim]
+        self.atoms = pd.DataFrame(new_atoms)
+
+        if cell.ndim == 1:
+            self.cell = cell * replicate_directions
+        else:
+            self.cell = cell * replicate_directions[:, np.newaxis]
 
     def concat_atoms(self, outer_sf) -> None:
         """
@@ -245,7 +286,70 @@ class SimulationFrame(
             raise ValueError(
                 f'res_type: {res_type} is not supported. supported res_type : [series, dict]')
 
-    def shuffle_type(self, type_ratio: list[float], fix_type: list[int] = None):
+    def get_spatial_index(self, mesh_length: float = 3.0) -> SpatialIndex:
+        """原子の座標からSpatialIndexを作る
+        box, slab, sphereに含まれる原子の行番号を、領域にかかるmeshだけを調べて求められる.
+        原子の座標を変更した場合は作り直す必要があります.
+        Parameters
+        ----------
+            mesh_length: float
+                meshの大きさの目安
+        Example
+        -------
+            index = sf.get_spatial_index()
+            target_atoms = index.query_sphere([5.0, 5.0, 5.0], 3.0)
+            sf.atoms.iloc[target_atoms]
+        """
+        return SpatialIndex(
+            pos=self.atoms[["x", "y", "z"]].values,
+            atom_types=self.atoms["type"].values,
+            cell=self.cell,
+            mesh_length=mesh_length)
+
+    def density_profile(self,
+                        direction: str = "z",
+                        window: float = 5.0,
+                        step: float = 1.0,
+                        spatial_index: SpatialIndex = None) -> pd.DataFrame:
+        """direction方向にwindowの幅のslabをstepずつずらしながら密度を計算する
+        make_empty_spaceで作ったslabの密度分布を調べるときなどに使う.
+        全てのslabの原子の質量の和をまとめて計算するので、density()を繰り返し呼ぶより速い.
+        Parameters
+        ----------
+            direction: str
+                "x" or "y" or "z"
+            window: float
+                slabの幅
+            step: float
+                slabをずらす幅
+            spatial_index: SpatialIndex
+                sf.get_spatial_index()で作ったindex, 渡すと座標の並べ替えを使い回す
+                Noneならばmeshは作らず、direction方向の座標だけを並べ替える
+        Returns
+        -------
+            profile : pd.DataFrame
+                columnsは"lower", "upper", "density"
+                density()と同じくlower <= 座標 <= upperの原子を数え、単位はg/cm^3
+        """
+        assert direction == "x" or direction == "y" or direction == "z", "Incorrect direction"
+        assert 0 < window, "window must be positive"
+        assert 0 < step, "step must be positive"
+        dim = {"x": 0, "y": 1, "z": 2}[direction]
+        assert window <= self.cell[dim], "window must be smaller than the cell"
+        lowers = np.arange(0.0, self.cell[dim] - window + step * 1e-6, step)
+        uppers = lowers + window
+        atom_masses = self.atoms["type"].map(self.atom_type_to_mass).values
+        if spatial_index is None:
+            masses = sum_in_slabs(self.atoms[direction].values, lowers, uppers, atom_masses)
+        else:
+            masses = spatial_index.sum_in_slabs(direction, lowers, uppers, atom_masses)
+        # 体積(cm^3)
+        volume = window * np.prod(np.delete(self.cell, dim)) * (10 ** - 24)
+        return pd.DataFrame({"lower": lowers,
+                             "upper": uppers,
+                             "density": masses / C.AVOGADORO_CONST / volume})
+
+    def shuffle_type(self, type_ratio: list[float], fix_type: list[int] = None, seed: int = None):
         """sfのtypeをランダムにシャッフルする。
             atomsに座標を持たせてから使用。
         Parameters
@@ -255,37 +359,87 @@ class SimulationFrame(
 
             fix_type: list[int]
                 固定するタイプが入ったlist
+            seed: int
+                乱数seed値
         Example
         -------
             sf.shuffle_type([1,2,3,0])
                 原子数:6 -> sf.atoms["type"] = [1,2,2,3,3,3] をシャッフルしたもの
-                余りはtype_ratioに応じてランダムに入る
-        """
-        if fix_type is not None:
-            atoms_tmp = self.atoms.query('type in @fix_type')
-            self.atoms = self.atoms.query('type not in @fix_type')
-
-        tot_atoms = self.get_total_atoms()
-        tot_ratio = sum(type_ratio)
-        type_ratio = [(type_ratio[i]*tot_atoms/tot_ratio)
-                      for i in range(len(type_ratio))]
-        remain_weight = [type_ratio[i] -
-                         int(type_ratio[i]) for i in range(len(type_ratio))]
-        type_list = []
-        for idx, ratio in enumerate(type_ratio):
-            type_list.extend([idx+1 for _ in range(int(ratio))])
-
-        if len(type_list) != len(self):
-            remain_type = random.choices(
-                [i+1 for i in range(len(type_ratio))], k=tot_atoms-len(type_list), weights=remain_weight)
-            type_list.extend(remain_type)
-
-        random.shuffle(type_list)
-        self.atoms["type"] = type_list
-
-        if fix_type is not None:
-            self.atoms = pd.concat([self.atoms, atoms_tmp])
-            self.atoms.reset_index(drop=True, inplace=True)
+                余りは端数の大きいtypeから順に入る
+        """
+        self.make_random_alloy(type_ratio, fix_type=fix_type, seed=seed)
+
+    def make_random_alloy(self,
+                          type_ratio: list[float],
+                          segment_num: list[int] = None,
+                          fix_type: list[int] = None,
+                          seed: int = None):
+        """typeの割合がtype_ratioになるように、原子のtypeをランダムに割り振る。
+            atomsに座標を持たせてから使用。
+            segment_numを指定すると、xyzで区切られた領域ごとに割合がtype_ratioになるようにする。
+            numpyの乱数を用いて、全原子のtypeを一度に決める。
+        Parameters
+        ----------
+            type_ratio: list[float]
+                typeに対する割合が入ったlist, type_ratio[i]がtype i+1の割合
+            segment_num: list[int]
+                [x,y,z]方向に何個領域を区切るか, 指定しないときはセル全体を一つの領域とする
+            fix_type: list[int]
+                typeを変更しない(割り振りの対象にしない)タイプが入ったlist
+            seed: int
+                乱数seed値, 同じseedならば同じ結果になる
+        Note
+        ----
+            各領域の各typeの原子数は 領域の原子数 x 割合 の整数部分で、
+            余りは端数の大きいtypeから1つずつ割り振られる。(端数が同じときはランダム)
+            原子の並び順は変わらない。
+        """
+        rng = np.random.default_rng(seed)
+        type_ratio = np.array(type_ratio, dtype=np.float64)
+        assert np.all(type_ratio >= 0) and type_ratio.sum() > 0, "type_ratio is incorrect form"
+        type_num = len(type_ratio)
+
+        atom_types = self.atoms["type"].values.copy()
+        if fix_type is None:
+            target_idx = np.arange(len(atom_types))
+        else:
+            target_idx = np.flatnonzero(~np.isin(atom_types, fix_type))
+
+        if segment_num is None:
+            segment_num = [1, 1, 1]
+        segment_num = np.array(segment_num, dtype=np.int64)
+        assert segment_num.shape == (3,), "segment_num is incorrrect form"
+        if np.prod(segment_num) == 1:
+            which_segment = np.zeros(len(target_idx), dtype=np.int64)
+        else:
+            seg_length = np.array(self.cell, dtype=np.float64) / segment_num
+            pos = self.atoms[["x", "y", "z"]].values[target_idx]
+            seg_idx = np.floor(pos / seg_length).astype(np.int64)
+            seg_idx = np.clip(seg_idx, 0, segment_num - 1)
+            which_segment = seg_idx[:, 0] \
+                + seg_idx[:, 1] * segment_num[0] \
+                + seg_idx[:, 2] * segment_num[0] * segment_num[1]
+        total_segment_num = int(np.prod(segment_num))
+
+        # 各領域の各typeの原子数, shape:(segments, types)
+        segment_atom_num = np.bincount(which_segment, minlength=total_segment_num)
+        ideal_counts = segment_atom_num[:, np.newaxis] * type_ratio / type_ratio.sum()
+        type_counts = np.floor(ideal_counts).astype(np.int64)
+        remain_num = segment_atom_num - type_counts.sum(axis=1)
+        # 端数の大きい順(同じときはランダム)に余りを1つずつ割り振る
+        remain_order = np.lexsort(
+            (rng.random(ideal_counts.shape), -(ideal_counts - type_counts)), axis=-1)
+        remain_rank = np.empty_like(remain_order)
+        np.put_along_axis(remain_rank, remain_order,
+                          np.broadcast_to(np.arange(type_num), remain_order.shape), axis=-1)
+        type_counts += remain_rank < remain_num[:, np.newaxis]
+
+        # 領域ごと、領域内ではランダムな順に並べた原子にtypeを割り振る
+        sorted_types = np.repeat(
+            np.tile(np.arange(1, type_num + 1), total_segment_num), type_counts.ravel())
+        atom_order = np.lexsort((rng.random(len(target_idx)), which_segment))
+        atom_types[target_idx[atom_order]] = sorted_types
+        self.atoms["type"] = atom_types
 
     def make_magmom_str(self, initial_magmom: list[float]) -> str:
         """
@@ -387,7 +541,7 @@ class SimulationFrame(
         self.cell[dim[direction]] *= 2
         self.concat_atoms(sf_mirror)
 
-    def shuffle_type_by_part(self, segment_num: list[int], type_ratio: list[int]):
+    def shuffle_type_by_part(self, segment_num: list[int], type_ratio: list[int], seed: int = None):
         """
         xyzで区切られた領域に対して、原子タイプをシャッフルする。
         -> 大きい系で、原子タイプの比率が偏ることがないようにする。
@@ -398,30 +552,13 @@ class SimulationFrame(
                 [x,y,z]方向に何個領域を区切るか
             type_ratio:list[int]
                 原子タイプの割合
+            seed: int
+                乱数seed値
         """
         assert len(segment_num) == 3, "segment_num is incorrrect form"
         assert len(type_ratio) == len(
             self.atom_symbol_to_type), "type_ratio is incorrect form"
-
-        new_atoms = pd.DataFrame(columns=self.atoms.columns.to_list())
-
-        segment_num = np.array(segment_num, dtype=np.int32)
-        seg_length = self.cell / segment_num
-
-        which_segment = np.array([0 for _ in range(len(self))])
-        which_segment += self.atoms["x"] // seg_length[0]
-        which_segment += self.atoms["y"] // seg_length[1] * segment_num[0]
-        which_segment += self.atoms["z"] // seg_length[2] * \
-            segment_num[0] * segment_num[1]
-
-        for segment_id in range(np.prod(segment_num)):
-            shuffled_seg = deepcopy(self)
-            shuffled_seg.atoms = shuffled_seg.atoms[which_segment == segment_id]
-            shuffled_seg.shuffle_type(type_ratio)
-            new_atoms = pd.concat([new_atoms, shuffled_seg.atoms])
-
-        new_atoms = new_atoms.reset_index(drop=True)
-        self.atoms = new_atoms
+        self.make_random_alloy(type_ratio, segment_num=segment_num, seed=seed)
 
     def slide_atoms(self, slide_length: list[float], change_cellsize: bool = True):
         """
@@ -476,42 +613,27 @@ class SimulationFrame(
         ---------
             magmom_str: str
                 MAGMOMにこのstrを指定すればokです。
+        Note
+        ----
+            最近接の反磁性原子同士を辺とするグラフをBFSで2色に塗り分けます。
+            つながっていない部分格子はそれぞれ最初の原子を正として塗り分けます。
+            三角格子のように2色に塗り分けられない(同符号の最近接原子が残る)場合はwarningを出します。
         """
         assert(len(magnetic_atom_type) > 0)
+        neighbor_indptr, neighbor_indices = self.get_neighbor_csr(
+            mode="bond_length", bond_length=nearest_neighbor_distance)
+        atom_types = self.atoms["type"].values
         magmom_dict = np.zeros(len(self.atoms))
         for atomtype in magnetic_atom_type:
-            neighbor_list = self.get_neighbor_list(mode="bond_length", bond_length=nearest_neighbor_distance)
-            first_atom_num = self.atoms.loc[self.atoms["type"] == atomtype].index[0]
-            magmom_dict[first_atom_num] = initial_magmom[atomtype-1]
-            initial_magmom[atomtype-1] *= -1
-            #1つ目の対象の原子の再隣接原子をqueueに入れる
-            atoms_queue = []
-            for queue_neighbor_num in neighbor_list[first_atom_num]:
-                if queue_neighbor_num in self.atoms.loc[self.atoms["type"] == atomtype].index:
-                    if queue_neighbor_num not in atoms_queue:
-                        atoms_queue.append(queue_neighbor_num)
-            atoms_queue.append(-1)
-            #queueで隣の原子に符号が逆のmagmomを与える
-            loop_num = 0
-            while len(atoms_queue) > 0 and atoms_queue!= [-1]:
-                if atoms_queue[0] >= 0:
-                    if magmom_dict[atoms_queue[0]] == 0:
-                        magmom_dict[atoms_queue[0]] = initial_magmom[atomtype-1]
-                        #最近接同一原子かつmagmomが与えられていない原子の番号をqueueに入れる
-                        for queue_neighbor_num in neighbor_list[atoms_queue[0]]:
-                            if queue_neighbor_num in self.atoms.loc[self.atoms["type"] == atomtype].index:
-                                if magmom_dict[queue_neighbor_num] == 0 and queue_neighbor_num not in atoms_queue:
-                                    atoms_queue.append(queue_neighbor_num)
-                        atoms_queue.pop(0)
-                else:
-                    initial_magmom[atomtype-1] *= -1
-                    atoms_queue.pop(0)
-                    atoms_queue.append(-1)
-                if loop_num > 10*30:
-                    print("ERROR: Too much loop")
-                    break
-                loop_num += 1
-        assert (len(self.atoms.loc[self.atoms["type"] == atomtype].index) == len(list(filter(lambda x: x != 0, magmom_dict))))
+            target_atoms = (atom_types == atomtype)
+            sign, frustrated_bond_num, sublattice_num = get_two_coloring_using_cython(
+                neighbor_indptr, neighbor_indices, target_atoms.astype(np.uint8))
+            magmom_dict[target_atoms] = sign[target_atoms] * initial_magmom[atomtype-1]
+            if sublattice_num > 1:
+                print(f"warning : type {atomtype} atoms form {sublattice_num} disconnected sublattices")
+                print(f"warning : the first atom of each sublattice has positive magmom")
+            if frustrated_bond_num > 0:
+                print(f"warning : {frustrated_bond_num} nearest neighbor pairs of type {atomtype} have the same sign of magmom (frustrated)")
         self.atoms = self.atoms.assign(magmom=magmom_dict)
         magmom_str = ""
         for magmom_dict_element in magmom_dict:
@@ -10,6 +10,8 @@ from .import_frames import ImportFrames
 from .export_frames import ExportFrames
 from .SimulationFrame import SimulationFrame
 from .analyze_frames import AnalyzeFrames
+from .trajectory import Trajectory
+from .lazy_frames import LazyFrames
 
 
 class SimulationFrames(
@@ -22,24 +24,31 @@ class SimulationFrames(
 
     Attributes
     ----------
-    sf : list[SimulationFrame]
+    sf : Union[list[SimulationFrame], Trajectory, LazyFrames]
         シミュレーションしたデータを読み込み、書き込み、分析するためのクラス
+        pack_sfs()を実行した後はTrajectory(フレームを連続した配列として保持する)になる
+        lazy=Trueでimportした後はLazyFrames(アクセスされたときにフレームを読み込む)になる
     atom_symbol_to_type : dict[str, int]
         原子のシンボルをkey, 原子のtypeをvalueとするdict
     atom_type_to_symbol : dict[int, str]
         原子のtypeをkey, 原子のシンボルをvalueとするdict
     atom_type_to_mass : dict[int, float]
         原子のtypeをkey, 原子の質量(g/mol)をvalueとするdict
+    outcar_parsers : dict[str, tuple[OutcarParser, pd.Series, tuple[int, int, str], list[SimulationFrame]]]
+        import_vasp_incrementalで読んでいるOUTCARのpathをkey,
+        (parser, 原子のtype, (inode番号, 先頭のbyte数, 先頭のhash), そのOUTCARから追加したフレーム)をvalueとするdict
 
     """
-    sf: list[SimulationFrame]
+    sf: Union[list[SimulationFrame], Trajectory, LazyFrames]
     atom_symbol_to_type: dict[str, int]
     atom_type_to_symbol: dict[int, str]
     atom_type_to_mass: dict[int, float]
     limda_default: dict[str, Any]
+    outcar_parsers: dict[str, tuple]
 
     def __init__(self, para: str = ""):
         self.sf: list[SimulationFrame] = []
+        self.outcar_parsers: dict[str, tuple] = {}
         self.atom_symbol_to_type: dict[str, int] = None
         self.atom_type_to_symbol: dict[int, str] = None
         self.atom_type_to_mass: dict[int, float] = None
@@ -66,7 +75,57 @@ class SimulationFrames(
                 乱数seed値
         """
         random.seed(seed)
-        random.shuffle(self.sf)
+        if isinstance(self.sf, list):
+            random.shuffle(self.sf)
+        else:
+            frame_indices = list(range(len(self.sf)))
+            random.shuffle(frame_indices)
+            self.sf = self.sf.take(frame_indices)
+
+    def remove_duplicate_frames(self, tolerance: float = 1e-3) -> int:
+        """self.sfから重複した構造を除き、除いたフレーム数を返す
+        同じ構造のうち最初のフレームを残す. 判定はget_unique_frame_indicesを参照
+        Parameters
+        ----------
+            tolerance: float
+                座標とcellを量子化する幅(Å)
+        """
+        frame_indices = self.get_unique_frame_indices(tolerance)
+        removed_num = len(self.sf) - len(frame_indices)
+        if isinstance(self.sf, list):
+            self.sf = [self.sf[frame_idx] for frame_idx in frame_indices]
+        else:
+            self.sf = self.sf.take(frame_indices)
+        return removed_num
+
+    def pack_sfs(self, use_float32: bool = False):
+        """self.sfをTrajectoryに変換する.
+        座標などを(frames, atoms, 3)の一つの配列にまとめ、
+        typeのように全フレームで同じcolumnは一つの配列を共有する.
+        cell, potential_energyなどのフレームごとの値もフレーム方向の配列になる.
+        Parameters
+        ----------
+            use_float32: bool
+                Trueならば座標, 力, 速度をfloat32で保持する
+        Note
+        ----
+            全フレームの原子数とcolumnが同じである必要がある.
+            pack後のsfs[step_idx]はそのフレームのview(SimulationFrame)を返す.
+            sfs.sfがLazyFramesのときは、各フレームを一度ずつ読み込んでまとめる.
+            viewのatomsを変更してもsfsには反映されないので、構造を変更する場合はunpack_sfs()してから行う.
+            フレームの追加(import_vasp, import_xdatcarなど)やallegro()もunpack_sfs()してから行う.
+        """
+        if isinstance(self.sf, Trajectory):
+            return
+        self.sf = Trajectory.from_frames(
+            self.sf, para_source=self, use_float32=use_float32)
+
+    def unpack_sfs(self):
+        """pack_sfs()でTrajectoryにしたself.sf(またはLazyFrames)をlist[SimulationFrame]に戻す
+        """
+        if isinstance(self.sf, list):
+            return
+        self.sf = self.sf.get_frames()
 
     def concat_sfs(self, simulation_frames_list: list):
         """sfsを結合する
@@ -105,18 +164,7 @@ class SimulationFrames(
                 ->sfs_listは3つのsfsからなるlistで、
                     len(sfs_list[i]) = [4,3,3]
         """
-        sfs_list = [SimulationFrames() for _ in range(list_size)]
-        item_num_list = [int(len(self)/list_size) for _ in range(list_size)]
-        for i in range(len(self) % list_size):
-            item_num_list[i] += 1
-        for idx, item in enumerate(item_num_list):
-            for i in range(1, item+1):
-                sfs_list[idx].sf.append(i+sum(item_num_list[0:idx]))
-        for frames in sfs_list:
-            frames.atom_symbol_to_type = self.atom_symbol_to_type
-            frames.atom_type_to_symbol = self.atom_type_to_symbol
-            frames.atom_type_to_mass = self.atom_type_to_mass
-        return sfs_list
+        return self.shard_sfs(num_shards=list_size)
 
     def split_sfs(self, each_sfs_size: int, keep_remains: bool = False) -> list:
         """ sfsを複数のsfsに分け, sfsのlistを返す。
@@ -138,18 +186,78 @@ class SimulationFrames(
                 -> len(sfs_list[i]) = [3,3,3] (keep_remains = False)
                 len(sfs_list[i]) = [3,3,3,1] (keep_remains = True)
         """
-        list_size = int(len(self) / each_sfs_size)
-        main_sfs = SimulationFrames()
-        remain_sfs = SimulationFrames()
-        remain = len(self) % each_sfs_size
-        main_sfs.sf = self.sf[0:len(self)-remain]
-        remain_sfs.sf = self.sf[len(self)-remain:len(self)]
-        sfs_list = main_sfs.split_sframes_specify_list_size(list_size)
-        if keep_remains and remain != 0:
-            remain_sfs.atom_symbol_to_type = self.atom_symbol_to_type
-            remain_sfs.atom_type_to_symbol = self.atom_type_to_symbol
-            remain_sfs.atom_type_to_mass = self.atom_type_to_mass
-            sfs_list.append(remain_sfs)
+        sfs_list = self.shard_sfs(shard_size=each_sfs_size)
+        if not keep_remains and len(self) % each_sfs_size != 0:
+            sfs_list.pop()
+        return sfs_list
+
+    def shard_sfs(self, num_shards: int = None, shard_size: int = None, stride: bool = False) -> list:
+        """sfsをフレームをコピーせずに複数のsfs(shard)に分け, sfsのlistを返す。
+        それぞれのshardのsfは元のsfのview(sliceしたもの)なので、フレームはコピーされない。
+        Parameters
+        ----------
+            num_shards: int
+                shardの数
+            shard_size: int
+                1つのshardのフレーム数, num_shardsとどちらか一方を指定する
+            stride: bool
+                Falseならば連続したフレーム(sfs.sf[start:stop])を、
+                Trueならばnum_shards個おきのフレーム(sfs.sf[shard_idx::num_shards])をまとめる
+        Return val
+        ----------
+            sfs_list: list[SimulationFrames()]
+                shardから成るlist
+        Note
+        ----
+            sfs.sfがLazyFramesのとき、shardはfileのpathとbyte offsetのみを持つので、
+            pickleしても小さく、process poolのworkerに渡して並列に解析することができる.
+            sfs.sfがTrajectoryのとき、shardの配列は元の配列のviewになる.
+        Example
+        -------
+            def count_mols(shard):
+                return shard.count_mols()
+
+            sfs.import_dumpposes("md", lazy=True)
+            with ProcessPoolExecutor(8) as executor:
+                df_list = list(executor.map(count_mols, sfs.shard_sfs(num_shards=8)))
+        """
+        assert (num_shards is None) != (shard_size is None), \
+            "num_shardsかshard_sizeのどちらか一方を指定してください"
+        frame_num = len(self)
+        if shard_size is not None:
+            assert shard_size > 0, "shard_size must be positive"
+            num_shards = -(-frame_num // shard_size)
+            if num_shards == 0:
+                return []
+        assert num_shards > 0, "num_shards must be positive"
+
+        if stride:
+            frame_slices = [slice(shard_idx, frame_num, num_shards)
+                            for shard_idx in range(num_shards)]
+        else:
+            if shard_size is None:
+                # 余りは前のshardから1つずつ割り振る
+                shard_sizes = [frame_num // num_shards for _ in range(num_shards)]
+                for shard_idx in range(frame_num % num_shards):
+                    shard_sizes[shard_idx] += 1
+            else:
+                shard_sizes = [shard_size for _ in range(num_shards)]
+                shard_sizes[-1] = frame_num - shard_size * (num_shards - 1)
+            frame_slices = []
+            start = 0
+            for size in shard_sizes:
+                frame_slices.append(slice(start, start + size))
+                start += size
+
+        sfs_list = []
+        for frame_slice in frame_slices:
+            shard = SimulationFrames()
+            shard.sf = self.sf[frame_slice]
+            shard.atom_symbol_to_type = self.atom_symbol_to_type
+            shard.atom_type_to_symbol = self.atom_type_to_symbol
+            shard.atom_type_to_mass = self.atom_type_to_mass
+            shard.limda_default = self.limda_default
+            sfs_list.append(shard)
         return sfs_list
 
     def allegro(self,
@@ -172,7 +280,13 @@ class SimulationFrames(
             allegro_model: torch.jit._script.RecursiveScriptModule
                 frozenされたAllegroを読み込んだモデル
                 pathではないことに注意
+        Note
+        ----
+            結果はそれぞれのSimulationFrameに書き込むので、pack_sfs()やlazy=Trueで読み込んだsfsでは
+            unpack_sfs()してから使う(LazyFramesではcacheから外れたフレームの結果が失われる).
         """
+        assert isinstance(self.sf, list), \
+            "allegro() writes the results into each frame, run unpack_sfs() first"
         for frame_idx in range(len(self.sf)):
             self.sf[frame_idx].allegro(cut_off=cut_off,
                                        device=device,
@@ -305,6 +419,9 @@ class SimulationFrames(
     def get_step_nums(self) -> list[int]:
         """ステップ数のリストを作る
         """
+        if not isinstance(self.sf, list):
+            # Trajectory, LazyFramesはフレームを作らずにステップ数を返せる
+            return self.sf.get_step_nums()
         step_nums = []
         for frame_idx in range(len(self.sf)):
             if self.sf[frame_idx] is not None:
@@ -0,0 +1,522 @@
+import numpy as np
+import io
+import os
+import json
+import pathlib
+import pickle
+import torch
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from typing import Union, Iterable, Iterator, Callable
+
+META_FILE_NAME: str = "meta.json"
+MANIFEST_FILE_NAME: str = "manifest.json"
+# 原子ごとの配列(全フレーム分を連結して保存する), 名前: (dtype, 1原子あたりのshape)
+ATOM_COLUMNS: dict[str, tuple[type, tuple[int, ...]]] = {
+    "pos": (np.float32, (3,)),
+    "force": (np.float32, (3,)),
+    "atom_types": (np.int64, ()),
+}
+# edgeごとの配列(全フレーム分を連結して保存する), edge_indexはフレーム内の原子のindex
+EDGE_COLUMNS: dict[str, tuple[type, tuple[int, ...]]] = {
+    "edge_index": (np.int64, (2,)),
+    "shift": (np.float32, (3,)),
+}
+# フレームごとの配列
+FRAME_COLUMNS: dict[str, type] = {
+    "cell": np.float32,
+    "cut_off": np.float32,
+    "potential_energy": np.float32,
+    "virial": np.float32,
+}
+
+
+def make_allegro_data(sf, cut_off: float, exclude_too_small_cell: bool = True,
+                      exclude_too_large_force: bool = True, max_allowable_force: float = 50.0,
+                      triclinic: bool = False) -> dict:
+    """sfからallegro用のデータ(export_allegro_framesのpickleの1フレーム分のdict)を作る
+    除外するフレームのときはNoneを返す.
+    Parameters
+    ----------
+        sf: SimulationFrame
+        cut_off: float
+            cutoff距離
+        exclude_too_small_cell: bool
+            cutoff x 2 以下のセルサイズを持つフレームを除外するか
+        exclude_too_large_force: bool
+            forceが基準値(max_allowable_force)より大きいフレームを除外するか
+        max_allowable_force: float
+            フレームを除外する力の基準値
+        triclinic: bool
+            Trueならばcellをshape:(3, 3)の格子ベクトルとして扱い、edgeごとのshiftも作る
+    """
+    data = {}
+    data["cell"] = np.array(sf.cell, dtype=np.float32)
+    cell_lengths = np.diag(sf.cell) if triclinic else sf.cell
+    if exclude_too_small_cell and np.any(cell_lengths < 2 * cut_off):
+        print(
+            f"Exculuded frame : cellsize(={np.min(cell_lengths)}) is smaller than 2 x cutoff(= {cut_off*2})", flush=True)
+        return None
+    data["pos"] = np.array(sf.atoms[["x", "y", "z"]].values, dtype=np.float32)
+    data["force"] = np.array(sf.atoms[["fx", "fy", "fz"]].values, dtype=np.float32)
+    if exclude_too_large_force and np.abs(data['force']).max().item() > max_allowable_force:
+        print(
+            f"Exculuded frame : force(={np.abs(data['force']).max().item()}) is larger than reference value of force(={max_allowable_force})", flush=True)
+        return None
+    data["atom_types"] = np.array(sf.atoms["type"].values)
+    data["atom_types"] -= 1
+    data["cut_off"] = np.array(cut_off, dtype=np.float32)
+    data["potential_energy"] = np.array(sf.potential_energy, dtype=np.float32)
+    data["virial"] = np.array(sf.virial_tensor, dtype=np.float32)
+
+    if triclinic:
+        edge_index, shift = sf.get_edge_index_for_triclinic_cell(cut_off=cut_off)
+        data["edge_index"] = np.array(edge_index)
+        data["shift"] = np.array(shift, dtype=np.float32)
+    else:
+        data["edge_index"] = np.array(sf.get_edge_index(cut_off=cut_off))
+    return data
+
+
+def make_allegro_data_chunk(frames: list, cut_off: float, exclude_too_small_cell: bool,
+                            exclude_too_large_force: bool, max_allowable_force: float,
+                            triclinic: bool) -> list[dict]:
+    """framesのそれぞれにmake_allegro_dataを適用する. ProcessPoolExecutorのworkerで使う
+    """
+    return [make_allegro_data(sf, cut_off, exclude_too_small_cell, exclude_too_large_force,
+                              max_allowable_force, triclinic) for sf in frames]
+
+
+def iter_allegro_data(frames, cut_off: float, exclude_too_small_cell: bool = True,
+                      exclude_too_large_force: bool = True, max_allowable_force: float = 50.0,
+                      triclinic: bool = False, num_workers: int = 1, chunk_size: int = 16,
+                      frame_indices: list[int] = None,
+                      frame_filter: Callable[[int, object], bool] = None) -> Iterator[tuple[int, dict]]:
+    """frame_indicesの順番に(フレームのindex, make_allegro_dataの返り値)を返すgenerator
+    num_workersが2以上ならばchunk_sizeフレームずつプロセス並列でedge_indexを計算する.
+    結果はframe_indicesの順番で返し、計算済みで未出力のchunkは高々num_workers * 2個なので、
+    全フレームのデータがメモリに溜まることはない.
+    frame_indicesがNoneならば全フレーム.
+    frame_filterを指定したときは、各フレームを読み込んだ直後にframe_indicesの順番でframe_filter(index, sf)を
+    main processで呼び、Falseならばそのフレームは計算しない. フレームの読み込みは1回だけになる.
+    """
+    if frame_indices is None:
+        frame_indices = range(len(frames))
+    selected_frames = ((frame_idx, frames[frame_idx]) for frame_idx in frame_indices)
+    if frame_filter is not None:
+        selected_frames = ((frame_idx, sf) for frame_idx, sf in selected_frames if frame_filter(frame_idx, sf))
+    if num_workers <= 1:
+        for frame_idx, sf in selected_frames:
+            yield frame_idx, make_allegro_data(sf, cut_off, exclude_too_small_cell,
+                                               exclude_too_large_force, max_allowable_force, triclinic)
+        return
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = deque()
+        while True:
+            while len(futures) < num_workers * 2:
+                chunk = list(islice(selected_frames, chunk_size))
+                if len(chunk) == 0:
+                    break
+                futures.append(([frame_idx for frame_idx, _ in chunk],
+                                executor.submit(make_allegro_data_chunk, [sf for _, sf in chunk], cut_off,
+                                                exclude_too_small_cell, exclude_too_large_force,
+                                                max_allowable_force, triclinic)))
+            if len(futures) == 0:
+                return
+            chunk_frame_indices, future = futures.popleft()
+            yield from zip(chunk_frame_indices, future.result())
+
+
+class AllegroManifest:
+    """データセットに書き込んだ構造のsourceとhash(SimulationFrame.get_frame_hash)を記録するjson file
+    append modeでexportするときに、既に書き込んだ構造を読み飛ばすのに使う.
+    {"sources": {source: [hash, ...], ...}}の形式で保存する.
+
+    Attributes
+    ----------
+    manifest_path : pathlib.Path
+        jsonのpath
+    sources : dict[str, list[str]]
+        sourceごとの構造のhash
+    hashes : set[str]
+        全ての構造のhash
+    """
+    manifest_path: pathlib.Path
+    sources: dict[str, list[str]]
+    hashes: set[str]
+
+    def __init__(self, manifest_path: Union[str, pathlib.Path], load: bool = True):
+        """
+        Parameters
+        ----------
+            manifest_path: Union[str, pathlib.Path]
+                jsonのpath
+            load: bool
+                Trueかつfileが存在するならば読み込む. Falseならば空のmanifestにする
+        """
+        self.manifest_path = pathlib.Path(manifest_path)
+        self.sources = {}
+        if load and self.manifest_path.exists():
+            with open(self.manifest_path, "r") as f:
+                self.sources = json.load(f)["sources"]
+        self.hashes = {frame_hash for hashes in self.sources.values() for frame_hash in hashes}
+
+    def __contains__(self, frame_hash: str) -> bool:
+        return frame_hash in self.hashes
+
+    def add(self, frame_hash: str, source: str) -> None:
+        self.sources.setdefault(source, []).append(frame_hash)
+        self.hashes.add(frame_hash)
+
+    def save(self) -> None:
+        with open(self.manifest_path, "w") as f:
+            json.dump({"sources": self.sources}, f, indent=4)
+
+
+class AllegroPickleWriter:
+    """pickle.loadでlist[dict]として読めるpickle fileを1フレームずつ書き込むクラス
+    export_allegro_framesのpickleと同じく読めるが、listを作らずに書き込むので全フレームをメモリに乗せる必要はない.
+    要素は1つずつpickleし、listのAPPENDとしてつなげる.
+    with文で使うとcloseが呼ばれる.
+    Note
+    ----
+        protocol 4以降(pickle.dumpのデフォルト)のmemoは番号を書かずに読んだ順に振られるので、
+        別々にpickleした要素をつなげると番号がずれる. そのためmemoの番号を書くprotocol 3を使う.
+        要素ごとにmemoが分かれ、numpyのclassなどの参照をフレームごとに書くので、
+        pickle.dump(list)より1フレームあたり300 byte程度大きくなる(200原子のフレームで2%程度).
+    """
+    PROTOCOL: int = 3
+
+    def __init__(self, file_path: Union[str, pathlib.Path], append: bool = False):
+        """
+        Parameters
+        ----------
+            file_path: Union[str, pathlib.Path]
+                pickle fileのpath
+            append: bool
+                Trueかつfileが存在するならば、既存のlistの後ろにフレームを追加する
+                pickle.dump(list)で書き込んだpickle(export_allegro_framesの以前の出力)にも追加できる
+                Trueならば{file_path}.manifest.jsonにmanifestを書き込む
+        """
+        file_path = pathlib.Path(file_path)
+        self.save_manifest = append
+        append = append and file_path.exists()
+        self.manifest = AllegroManifest(f"{file_path}.manifest.json", load=append)
+        if append:
+            # listの要素を追加するopcodeはlistがstackの一番上にあれば使えるので、末尾のSTOPを除いて続きを書く
+            self.f = open(file_path, "r+b")
+            self.f.seek(-1, os.SEEK_END)
+            assert self.f.read(1) == pickle.STOP, f"{file_path} is not a complete pickle file"
+            self.f.seek(-1, os.SEEK_END)
+            self.f.truncate()
+        else:
+            self.f = open(file_path, "wb")
+            self.f.write(pickle.PROTO + bytes([self.PROTOCOL]) + pickle.EMPTY_LIST)
+
+    def append(self, data: dict, frame_hash: str = None, source: str = "") -> None:
+        """1フレーム分のデータを書き込む. frame_hashを指定したときはmanifestに記録する
+        """
+        buffer = io.BytesIO()
+        pickle.Pickler(buffer, protocol=self.PROTOCOL).dump(data)
+        # 先頭のPROTOと末尾のSTOPを除く
+        self.f.write(buffer.getbuffer()[2:-1])
+        self.f.write(pickle.APPEND)
+        if frame_hash is not None:
+            self.manifest.add(frame_hash, source)
+
+    def close(self) -> None:
+        if not self.f.closed:
+            self.f.write(pickle.STOP)
+            self.f.close()
+            if self.save_manifest:
+                self.manifest.save()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class AllegroDatasetWriter:
+    """allegro用のデータをcolumnar形式で1フレームずつdirectoryに書き込むクラス
+    原子ごとの配列(pos, force, atom_types)とedgeごとの配列(edge_index, shift)は全フレーム分を連結して
+    {name}.binに追記し、フレームごとの配列(cell, cut_off, potential_energy, virial)とフレームの先頭位置
+    (atom_offsets, edge_offsets)はclose時に.npyで保存する. dtypeとshapeはmeta.jsonに書く.
+    with文で使うとcloseが呼ばれる.
+
+    Attributes
+    ----------
+    output_dir : pathlib.Path
+        出力先のdirectory
+    frame_num : int
+        書き込んだフレーム数
+    """
+    output_dir: pathlib.Path
+    frame_num: int
+
+    def __init__(self, output_dir: Union[str, pathlib.Path], append: bool = False):
+        """
+        Parameters
+        ----------
+            output_dir: Union[str, pathlib.Path]
+                出力先のdirectory
+            append: bool
+                Trueかつdirectoryにデータセットが存在するならば、その後ろにフレームを追加する
+                Trueならばmanifest.jsonにmanifestを書き込む
+        """
+        self.output_dir = pathlib.Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.save_manifest = append
+        append = append and (self.output_dir / META_FILE_NAME).exists()
+        self.manifest = AllegroManifest(self.output_dir / MANIFEST_FILE_NAME, load=append)
+        self.files = {}
+        if append:
+            with open(self.output_dir / META_FILE_NAME, "r") as f:
+                meta = json.load(f)
+            self.frame_num = meta["frame_num"]
+            self.atom_offsets = np.load(self.output_dir / "atom_offsets.npy").tolist()
+            self.edge_offsets = np.load(self.output_dir / "edge_offsets.npy").tolist()
+            self.frame_values = {name: list(np.load(self.output_dir / f"{name}.npy")) for name in FRAME_COLUMNS}
+            self.has_shift = "shift" in meta["edge_columns"] if self.frame_num > 0 else None
+        else:
+            self.frame_num = 0
+            self.atom_offsets = [0]
+            self.edge_offsets = [0]
+            self.frame_values = {name: [] for name in FRAME_COLUMNS}
+            self.has_shift = None
+        self.append_mode = append
+
+    def open_files(self) -> None:
+        names = list(ATOM_COLUMNS) + ["edge_index"] + (["shift"] if self.has_shift else [])
+        for name in names:
+            file_path = self.output_dir / f"{name}.bin"
+            if self.append_mode and file_path.exists():
+                f = open(file_path, "r+b")
+                # 前回のexportが途中で止まったときに書き込まれた、meta.jsonに含まれない部分を除く
+                row_num = self.atom_offsets[-1] if name in ATOM_COLUMNS else self.edge_offsets[-1]
+                dtype, shape = {**ATOM_COLUMNS, **EDGE_COLUMNS}[name]
+                f.truncate(row_num * int(np.prod(shape, dtype=np.int64)) * np.dtype(dtype).itemsize)
+                f.seek(0, os.SEEK_END)
+            else:
+                f = open(file_path, "wb")
+            self.files[name] = f
+
+    def append(self, data: dict, frame_hash: str = None, source: str = "") -> None:
+        """1フレーム分のデータ(make_allegro_dataの返り値と同じkeyのdict)を書き込む
+        frame_hashを指定したときはmanifestに記録する
+        """
+        has_shift = "shift" in data
+        if self.has_shift is None:
+            self.has_shift = has_shift
+        assert has_shift == self.has_shift, "all frames must have shift or not"
+        if len(self.files) == 0:
+            self.open_files()
+
+        atom_num = len(data["atom_types"])
+        edge_index = np.asarray(data["edge_index"], dtype=np.int64).reshape(2, -1)
+        for name, (dtype, shape) in ATOM_COLUMNS.items():
+            array = np.ascontiguousarray(data[name], dtype=dtype)
+            assert array.shape == (atom_num,) + shape, f"unexpected shape of {name}: {array.shape}"
+            self.files[name].write(array.tobytes())
+        self.files["edge_index"].write(np.ascontiguousarray(edge_index.T).tobytes())
+        if has_shift:
+            shift = np.ascontiguousarray(data["shift"], dtype=np.float32).reshape(-1, 3)
+            assert len(shift) == edge_index.shape[1], "shift and edge_index must have the same length"
+            self.files["shift"].write(shift.tobytes())
+
+        for name, dtype in FRAME_COLUMNS.items():
+            self.frame_values[name].append(np.asarray(data[name], dtype=dtype))
+        self.atom_offsets.append(self.atom_offsets[-1] + atom_num)
+        self.edge_offsets.append(self.edge_offsets[-1] + edge_index.shape[1])
+        self.frame_num += 1
+        if frame_hash is not None:
+            self.manifest.add(frame_hash, source)
+
+    def close(self) -> None:
+        """binary fileを閉じ、フレームごとの配列とmeta.jsonを書き込む
+        """
+        for f in self.files.values():
+            f.close()
+        names = list(ATOM_COLUMNS) + ["edge_index"] + (["shift"] if self.has_shift else [])
+        for name in names:
+            if name not in self.files and not (self.append_mode and (self.output_dir / f"{name}.bin").exists()):
+                # 1フレームも書き込まれていない
+                open(self.output_dir / f"{name}.bin", "wb").close()
+        self.files = {}
+
+        np.save(self.output_dir / "atom_offsets.npy", np.array(self.atom_offsets, dtype=np.int64))
+        np.save(self.output_dir / "edge_offsets.npy", np.array(self.edge_offsets, dtype=np.int64))
+        for name, dtype in FRAME_COLUMNS.items():
+            values = self.frame_values[name]
+            np.save(self.output_dir / f"{name}.npy",
+                    np.array(values, dtype=dtype) if len(values) > 0 else np.empty(0, dtype=dtype))
+
+        columns = {name: [np.dtype(dtype).str, list(shape)]
+                   for name, (dtype, shape) in {**ATOM_COLUMNS, **EDGE_COLUMNS}.items() if name in names}
+        meta = {"frame_num": self.frame_num,
+                "atom_num": self.atom_offsets[-1],
+                "edge_num": self.edge_offsets[-1],
+                "atom_columns": list(ATOM_COLUMNS),
+                "edge_columns": [name for name in EDGE_COLUMNS if name in names],
+                "frame_columns": list(FRAME_COLUMNS),
+                "columns": columns}
+        with open(self.output_dir / META_FILE_NAME, "w") as f:
+            json.dump(meta, f, indent=4)
+        if self.save_manifest:
+            self.manifest.save()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def write_allegro_dataset(output_dir: Union[str, pathlib.Path], frames: Iterable[dict]) -> int:
+    """allegro用のデータ(export_allegro_framesのpickleの中身と同じdict)をcolumnar形式でoutput_dirに書き込む
+    pickleからの変換にも使える.
+    Return
+    ------
+        書き込んだフレーム数
+    """
+    with AllegroDatasetWriter(output_dir) as writer:
+        for data in frames:
+            writer.append(data)
+    return writer.frame_num
+
+
+class AllegroDataset:
+    """AllegroDatasetWriterで書き込んだdirectoryをnp.memmapで開き、フレームごとのデータやbatchを返すクラス
+    fileはmmapで開くだけなので、フレーム数によらず開くのは一瞬で、アクセスした部分だけが読まれる.
+    dataset[idx]はexport_allegro_framesのpickleの1フレーム分と同じkeyのdictで、配列はmemmapのviewになる.
+    edge_indexはshape:[2, edges]のview(転置)になる.
+
+    Attributes
+    ----------
+    dataset_dir : pathlib.Path
+        読み込んだdirectory
+    atom_offsets : np.ndarray[int], shape:[frames + 1]
+        各フレームの先頭原子の位置
+    edge_offsets : np.ndarray[int], shape:[frames + 1]
+        各フレームの先頭edgeの位置
+    columns : dict[str, np.ndarray]
+        pos, force, atom_types, edge_index(shape:[edges, 2]), shift(あれば)の連結された配列
+    frame_values : dict[str, np.ndarray]
+        cell, cut_off, potential_energy, virialのフレームごとの配列
+    """
+    dataset_dir: pathlib.Path
+    atom_offsets: np.ndarray
+    edge_offsets: np.ndarray
+    columns: dict[str, np.ndarray]
+    frame_values: dict[str, np.ndarray]
+
+    def __init__(self, dataset_dir: Union[str, pathlib.Path], mmap_mode: str = "c"):
+        """
+        Parameters
+        ----------
+            dataset_dir: Union[str, pathlib.Path]
+                AllegroDatasetWriterで書き込んだdirectory
+            mmap_mode: str
+                np.memmapのmode, デフォルトの"c"(copy-on-write)ならばfileは書き換えられず、
+                torch.from_numpyでそのままtensorにできる. Noneならば全ての配列をメモリに読み込む
+        """
+        self.dataset_dir = pathlib.Path(dataset_dir)
+        with open(self.dataset_dir / META_FILE_NAME, "r") as f:
+            meta = json.load(f)
+        self.atom_offsets = np.load(self.dataset_dir / "atom_offsets.npy")
+        self.edge_offsets = np.load(self.dataset_dir / "edge_offsets.npy")
+        self.columns = {}
+        for name in meta["atom_columns"] + meta["edge_columns"]:
+            dtype_str, shape = meta["columns"][name]
+            row_num = meta["atom_num"] if name in meta["atom_columns"] else meta["edge_num"]
+            self.columns[name] = self.load_column(name, np.dtype(dtype_str), (row_num,) + tuple(shape), mmap_mode)
+        self.frame_values = {name: np.load(self.dataset_dir / f"{name}.npy", mmap_mode=mmap_mode)
+                             for name in meta["frame_columns"]}
+
+    def load_column(self, name: str, dtype: np.dtype, shape: tuple[int, ...], mmap_mode: str) -> np.ndarray:
+        file_path = self.dataset_dir / f"{name}.bin"
+        if mmap_mode is None:
+            return np.fromfile(file_path, dtype=dtype).reshape(shape)
+        if shape[0] == 0:
+            # 長さ0のfileはmmapできない
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(file_path, dtype=dtype, mode=mmap_mode, shape=shape)
+
+    def __len__(self) -> int:
+        return len(self.atom_offsets) - 1
+
+    def __getitem__(self, frame_idx: int) -> dict:
+        return self.get_frame(frame_idx)
+
+    def __iter__(self):
+        for frame_idx in range(len(self)):
+            yield self.get_frame(frame_idx)
+
+    def get_frame(self, frame_idx: int) -> dict:
+        """frame_idx番目のフレームのデータを返す. 配列はコピーせずにmemmapのviewを返す
+        """
+        if frame_idx < 0:
+            frame_idx += len(self)
+        assert 0 <= frame_idx < len(self), f"frame index {frame_idx} is out of range"
+        atom_start, atom_end = self.atom_offsets[frame_idx], self.atom_offsets[frame_idx + 1]
+        edge_start, edge_end = self.edge_offsets[frame_idx], self.edge_offsets[frame_idx + 1]
+        data = {name: self.frame_values[name][frame_idx] for name in self.frame_values}
+        for name in ("pos", "force", "atom_types"):
+            data[name] = self.columns[name][atom_start:atom_end]
+        data["edge_index"] = self.columns["edge_index"][edge_start:edge_end].T
+        if "shift" in self.columns:
+            data["shift"] = self.columns["shift"][edge_start:edge_end]
+        return data
+
+    def get_batch(self, frame_indices: Union[list[int], np.ndarray, range],
+                  device: Union[str, torch.device] = None) -> dict[str, torch.Tensor]:
+        """frame_indicesのフレームをまとめたbatchをtorch.Tensorのdictで返す
+        pos, force, atom_types, shiftは全フレーム分を連結し、edge_indexはbatch内の原子のindexにする.
+        frame_indicesが連続したフレームのときは、原子ごとの配列はコピーせずにmemmapをそのままtensorにする.
+        Parameters
+        ----------
+            frame_indices: Union[list[int], np.ndarray, range]
+                batchにするフレームのindex
+            device: Union[str, torch.device]
+                指定したときはtensorをそのdeviceに送る
+        Return
+        ------
+            batch: dict[str, torch.Tensor]
+                pos, force, atom_types, edge_index(shape:[2, edges]), shift(あれば),
+                cell, cut_off, potential_energy, virial(shape:[frames, ...]),
+                batch(原子ごとのbatch内のフレーム番号), ptr(batch内の各フレームの先頭原子の位置, shape:[frames + 1])
+        """
+        frame_indices = np.asarray(frame_indices, dtype=np.int64)
+        assert len(frame_indices) > 0, "frame_indices is empty"
+        atom_starts = self.atom_offsets[frame_indices]
+        atom_nums = self.atom_offsets[frame_indices + 1] - atom_starts
+        edge_starts = self.edge_offsets[frame_indices]
+        edge_nums = self.edge_offsets[frame_indices + 1] - edge_starts
+        ptr = np.concatenate(([0], np.cumsum(atom_nums)))
+
+        contiguous = np.all(np.diff(frame_indices) == 1)
+        arrays = {}
+        for name in self.columns:
+            if name in ("pos", "force", "atom_types"):
+                starts, nums = atom_starts, atom_nums
+            else:
+                starts, nums = edge_starts, edge_nums
+            column = self.columns[name]
+            if contiguous:
+                arrays[name] = column[starts[0]:starts[-1] + nums[-1]]
+            else:
+                arrays[name] = np.concatenate([column[start:start + num] for start, num in zip(starts, nums)])
+        # フレーム内の原子のindexをbatch内の原子のindexにする
+        arrays["edge_index"] = (arrays["edge_index"] + np.repeat(ptr[:-1], edge_nums)[:, None]).T
+        for name, values in self.frame_values.items():
+            arrays[name] = values[frame_indices]
+        arrays["batch"] = np.repeat(np.arange(len(frame_indices)), atom_nums)
+        arrays["ptr"] = ptr
+
+        batch = {name: torch.from_numpy(array) for name, array in arrays.items()}
+        if device is not None:
+            batch = {name: tensor.to(device) for name, tensor in batch.items()}
+        return batch
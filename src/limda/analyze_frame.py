@@ -1,9 +1,10 @@
 import numpy as np
+import hashlib
 from collections import deque
 import ase
 from ase.neighborlist import neighbor_list
 
-from .neighbor import get_neighbor_list_using_cython
+from .neighbor import get_neighbor_list_using_cython, get_neighbor_csr_using_cython
 from .analyze_mols import get_mols_list_using_cython
 
 
@@ -26,6 +27,67 @@ class AnalyzeFrame:
             bond_length: list[list[float]]
                 結合の長さ
         """
+        bond_length, mesh_length = self.get_neighbor_search_params(
+            mode=mode, cut_off=cut_off, bond_length=bond_length)
+        neighbor_list = get_neighbor_list_using_cython(
+            atoms_type=self.atoms["type"],
+            atoms_pos=[self.atoms["x"], self.atoms["y"], self.atoms["z"]],
+            mesh_length=mesh_length,
+            atom_num=len(self),
+            bond_length=bond_length,
+            cell=self.cell,
+        )
+        return neighbor_list
+
+    def get_neighbor_csr(
+        self, mode: str, cut_off: float = None, bond_length: list[list[float]] = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """neighbor list をCSR形式で作成する
+        原子iの近接原子は indices[indptr[i]:indptr[i+1]] に入る
+        list[list[int]]を作らないので、大きな系ではget_neighbor_listより速い
+        Parameters
+        ----------
+            mode: str
+                "bond_length"または"cut_off"
+                mode = "bond_length"とした場合はneighbor listを結合種の長さ(bond_length)によって作成する
+                mode = "cut_off"とした場合はneighbor listをカットオフによって作成する
+            cut_off: float
+                カットオフ半径
+            bond_length: list[list[float]]
+                結合の長さ
+        Returns
+        -------
+            indptr: np.ndarray[int], shape:[atoms+1]
+            indices: np.ndarray[int], shape:[indptr[-1]]
+        """
+        bond_length, mesh_length = self.get_neighbor_search_params(
+            mode=mode, cut_off=cut_off, bond_length=bond_length)
+        return get_neighbor_csr_using_cython(
+            atoms_type=self.atoms["type"],
+            atoms_pos=[self.atoms["x"], self.atoms["y"], self.atoms["z"]],
+            mesh_length=mesh_length,
+            atom_num=len(self),
+            bond_length=bond_length,
+            cell=self.cell,
+        )
+
+    def get_neighbor_search_params(
+        self, mode: str, cut_off: float = None, bond_length: list[list[float]] = None
+    ) -> tuple[list[list[float]], float]:
+        """neighbor listの作成に使うbond_lengthとmeshの大きさを決める
+        Parameters
+        ----------
+            mode: str
+                "bond_length"または"cut_off"
+            cut_off: float
+                カットオフ半径
+            bond_length: list[list[float]]
+                結合の長さ
+        Returns
+        -------
+            bond_length: list[list[float]]
+            mesh_length: float
+        """
         assert mode == "bond_length" or mode == "cut_off", "Please configure mode"
         atom_type_num = len(self.atom_symbol_to_type)
         if mode == "bond_length":
@@ -52,15 +114,7 @@ class AnalyzeFrame:
         if mesh_length * 3 > min(self.cell):
             mesh_length = min(self.cell) / 3
 
-        neighbor_list = get_neighbor_list_using_cython(
-            atoms_type=self.atoms["type"],
-            atoms_pos=[self.atoms["x"], self.atoms["y"], self.atoms["z"]],
-            mesh_length=mesh_length,
-            atom_num=len(self),
-            bond_length=bond_length,
-            cell=self.cell,
-        )
-        return neighbor_list
+        return bond_length, mesh_length
 
     def get_mols_list(
         self,
@@ -272,6 +326,85 @@ class AnalyzeFrame:
         shift = shift[mask]
         return edge_index, shift
 
+    def get_frame_hash(self) -> str:
+        """cell, type, 座標, 力, potential_energyから構造の内容のhash(sha1の16進数文字列)を作る
+        同じ構造を別の経路でimportしても同じhashになるように、typeはint64, それ以外はfloat64にしてからhashを取る.
+        データセットに既に入っている構造を判定するのに使う.
+        """
+        h = hashlib.sha1()
+        h.update(np.ascontiguousarray(self.cell, dtype=np.float64).tobytes())
+        for column in ["type", "x", "y", "z", "fx", "fy", "fz"]:
+            if column in self.atoms:
+                dtype = np.int64 if column == "type" else np.float64
+                h.update(column.encode())
+                h.update(np.ascontiguousarray(self.atoms[column].values, dtype=dtype).tobytes())
+        if self.potential_energy is not None:
+            h.update(np.float64(self.potential_energy).tobytes())
+        return h.hexdigest()
+
+    def get_fingerprint(self, cut_off: float, bin_num: int = 32) -> np.ndarray:
+        """原子種のペアごとの距離のhistogramを構造の特徴量(fingerprint)として返す
+        get_neighbor_csrでcut_off以内の原子のペアを求め、ペアの距離を[0, cut_off)のbin_num個のbinで数え、原子数で割る.
+        原子種のペア(type_i <= type_j)の順番に並べるので、shapeは[原子種のペア数 * bin_num]になる.
+        Parameters
+        ----------
+            cut_off: float
+                カットオフ半径
+            bin_num: int
+                histogramのbinの数
+        """
+        indptr, indices = self.get_neighbor_csr(mode="cut_off", cut_off=cut_off)
+        atom_type_num = len(self.atom_symbol_to_type)
+        pair_num = atom_type_num * (atom_type_num + 1) // 2
+        atom_idxs = np.repeat(np.arange(len(self)), np.diff(indptr))
+        is_upper = atom_idxs < indices  # i -> j と j -> i が入っているので片方だけ数える
+        atom_idxs, neighbor_atom_idxs = atom_idxs[is_upper], indices[is_upper]
+
+        pos = self.atoms[["x", "y", "z"]].values
+        cell = np.asarray(self.cell, dtype=np.float64)
+        diff = pos[neighbor_atom_idxs] - pos[atom_idxs]
+        diff -= cell * np.round(diff / cell)
+        distances = np.linalg.norm(diff, axis=1)
+
+        atom_types = self.atoms["type"].values.astype(np.int64) - 1
+        type_i = np.minimum(atom_types[atom_idxs], atom_types[neighbor_atom_idxs])
+        type_j = np.maximum(atom_types[atom_idxs], atom_types[neighbor_atom_idxs])
+        pair_idxs = type_i * atom_type_num - type_i * (type_i - 1) // 2 + (type_j - type_i)
+        bin_idxs = np.minimum((distances / cut_off * bin_num).astype(np.int64), bin_num - 1)
+        histogram = np.bincount(pair_idxs * bin_num + bin_idxs, minlength=pair_num * bin_num)
+        return (histogram / len(self)).astype(np.float32)
+
+    def get_structure_hash(self, tolerance: float = 1e-3) -> str:
+        """type, cell, 座標をtoleranceで量子化した値から構造のhash(sha1の16進数文字列)を作る
+        座標はcell内に戻してから量子化するので、周期境界をまたいで折り返された原子も同じ値になる.
+        同じ構造(restartしたVASPの計算の最初の構造や、重複してimportしたOUTCARのフレームなど)は同じhashになる.
+        Parameters
+        ----------
+            tolerance: float
+                座標とcellを量子化する幅(Å)
+        Note
+        ----
+            原子の順番が違う構造は別のhashになる.
+            量子化の境界をまたいだ差がある構造は、tolerance以下の差でも別のhashになることがある.
+        """
+        cell = np.asarray(self.cell, dtype=np.float64)
+        pos = self.atoms[["x", "y", "z"]].values.astype(np.float64)
+        if cell.ndim == 1:
+            lengths = cell
+            frac_pos = pos / cell
+        else:
+            lengths = np.linalg.norm(cell, axis=1)
+            frac_pos = pos @ np.linalg.inv(cell)
+        # 各方向のcellをtolerance程度の幅でmesh_nums個に分け、座標をmeshの番号にする
+        mesh_nums = np.maximum(np.round(lengths / tolerance), 1).astype(np.int64)
+        quantized_pos = np.round(frac_pos * mesh_nums).astype(np.int64) % mesh_nums
+
+        h = hashlib.sha1()
+        h.update(np.ascontiguousarray(self.atoms["type"].values, dtype=np.int64).tobytes())
+        h.update(np.round(cell / tolerance).astype(np.int64).tobytes())
+        h.update(np.ascontiguousarray(quantized_pos).tobytes())
+        return h.hexdigest()
+
     def get_sum_of_momentums(self) -> np.ndarray[float]:
         """
         各方向の運動量の合計を計算する.
@@ -1,4 +1,7 @@
 import pandas as pd
+import numpy as np
+from tqdm import trange
+from .sampling import farthest_point_sampling
 
 
 class AnalyzeFrames:
@@ -103,3 +106,64 @@ class AnalyzeFrames:
         df_count_bonds = pd.DataFrame(count_bonds_lists).fillna(0).astype(int)
         df_count_bonds.index = self.get_step_nums()
         return df_count_bonds
+
+    def get_unique_frame_indices(self, tolerance: float = 1e-3) -> list[int]:
+        """重複した構造を除いたフレームのindexを返す
+        各フレームのget_structure_hashをdictに入れながら1度だけ走査するので、フレーム数に比例した時間で終わる.
+        同じhashを持つフレームのうち、最初のフレームのindexを残す.
+        Parameters
+        ----------
+            tolerance: float
+                座標とcellを量子化する幅(Å), SimulationFrame.get_structure_hashを参照
+        """
+        first_frame_idx_of_hash = {}
+        for frame_idx in range(len(self.sf)):
+            structure_hash = self.sf[frame_idx].get_structure_hash(tolerance)
+            first_frame_idx_of_hash.setdefault(structure_hash, frame_idx)
+        return sorted(first_frame_idx_of_hash.values())
+
+    def get_fingerprints(self, cut_off: float, bin_num: int = 32) -> np.ndarray:
+        """全フレームのfingerprint(SimulationFrame.get_fingerprint)をshape:[frames, features]の配列で返す
+        Parameters
+        ----------
+            cut_off: float
+                カットオフ半径
+            bin_num: int
+                histogramのbinの数
+        """
+        fingerprints = None
+        for frame_idx in trange(len(self.sf), desc="[getting fingerprints]"):
+            fingerprint = self.sf[frame_idx].get_fingerprint(cut_off, bin_num)
+            if fingerprints is None:
+                fingerprints = np.empty((len(self.sf), len(fingerprint)), dtype=np.float32)
+            fingerprints[frame_idx] = fingerprint
+        return fingerprints
+
+    def get_farthest_point_frame_indices(self, sample_num: int, fingerprints: np.ndarray = None,
+                                         cut_off: float = None, bin_num: int = 32, first_frame_idx: int = 0,
+                                         chunk_size: int = 65536) -> list[int]:
+        """fingerprintの空間でfarthest point samplingを行い、多様な構造のフレームをsample_num個選んでindexを返す
+        skip_numで一定間隔に間引くのと違い、似た構造が続く部分からは少なく、珍しい構造は漏れなく選ばれる.
+        Parameters
+        ----------
+            sample_num: int
+                選ぶフレーム数
+            fingerprints: np.ndarray, shape:[frames, features]
+                get_fingerprintsで作った特徴量(np.memmapでもよい), Noneならばcut_off, bin_numで作る
+            cut_off: float
+                fingerprintsがNoneのときのカットオフ半径
+            bin_num: int
+                fingerprintsがNoneのときのhistogramのbinの数
+            first_frame_idx: int
+                最初に選ぶフレームのindex
+            chunk_size: int
+                一度に距離を計算するフレーム数
+        Note
+        ----
+            選んだ順番(前ほど多様性への寄与が大きい)で返す.
+        """
+        if fingerprints is None:
+            assert cut_off is not None, "specify fingerprints or cut_off"
+            fingerprints = self.get_fingerprints(cut_off, bin_num)
+        assert len(fingerprints) == len(self.sf), "fingerprints must have one row per frame"
+        return farthest_point_sampling(fingerprints, sample_num, first_frame_idx, chunk_size)
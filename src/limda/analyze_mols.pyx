@@ -1,6 +1,7 @@
 # distutils: language = c++
 
 import numpy as np
+cimport numpy as cnp
 import queue
 from libc.stdlib cimport malloc
 from libcpp.vector cimport vector
@@ -40,3 +41,39 @@ cdef vector[vector[int]] get_mols_list(vector[vector[int]] neighbor_list, int at
 
 def get_mols_list_using_cython(vector[vector[int]] neighbor_list, int atom_num):
     return get_mols_list(neighbor_list, atom_num)
+
+
+def get_two_coloring_using_cython(cnp.int64_t[:] indptr, cnp.int64_t[:] indices, cnp.uint8_t[:] target):
+    # CSR形式のneighbor listのうち、target[i] == 1の原子同士の結合のみを辺とするグラフを
+    # BFSで+1, -1の2色に塗り分けます。target外の原子は0になります。
+    # 連結成分ごとに最初の原子を+1とし、同じ色の原子同士の結合(frustrated bond)の数を数えます。
+    cdef:
+        int atom_num = target.shape[0]
+        cnp.int8_t[:] color_view
+        queue[int] que
+        int start_atom_idx, now, nex
+        long k
+        long frustrated_bond_num = 0
+        int component_num = 0
+
+    color = np.zeros(atom_num, dtype=np.int8)
+    color_view = color
+    for start_atom_idx in range(atom_num):
+        if not target[start_atom_idx] or color_view[start_atom_idx] != 0:
+            continue
+        component_num += 1
+        color_view[start_atom_idx] = 1
+        que.push(start_atom_idx)
+        while not que.empty():
+            now = que.front()
+            que.pop()
+            for k in range(indptr[now], indptr[now + 1]):
+                nex = indices[k]
+                if not target[nex]:
+                    continue
+                if color_view[nex] == 0:
+                    color_view[nex] = -color_view[now]
+                    que.push(nex)
+                elif color_view[nex] == color_view[now] and now < nex:
+                    frustrated_bond_num += 1
+    return color, frustrated_bond_num, component_num
@@ -0,0 +1,362 @@
+import pandas as pd
+import numpy as np
+import json
+import mmap
+import os
+import pathlib
+import struct
+import zlib
+from typing import Union
+from .SimulationFrame import SimulationFrame
+from .trajectory import Trajectory, VECTOR_COLUMNS, make_frame_sharing_para
+
+MAGIC: bytes = b"LIMDATRJ"
+VERSION: int = 1
+# file末尾: footer(json)の長さ(uint64) + MAGIC
+TAIL_FORMAT: str = "<Q8s"
+TAIL_SIZE: int = struct.calcsize(TAIL_FORMAT)
+HEAD_FORMAT: str = "<8sI"
+HEAD_SIZE: int = struct.calcsize(HEAD_FORMAT)
+# フレームごとの値とそのdtype, shape
+FRAME_VALUE_DTYPES: dict[str, str] = {"cell": "<f8", "potential_energy": "<f8",
+                                      "virial_tensor": "<f8", "step_num": "<i8"}
+# atomsのcolumnのうち保存できるdtypeのkind(bool, 整数, 浮動小数点数, 複素数)
+SAVABLE_DTYPE_KINDS: str = "biufc"
+
+
+class BinaryTrajectory:
+    """limdaのbinary trajectory file(.ltrj)を読み書きするクラス
+    全フレームの原子数とcolumnが同じである必要がある.
+
+    fileの構成
+        header : MAGIC + version
+        chunk  : chunk_size個のフレームの配列(atomsの各column, cell, potential_energy, virial_tensor, step_num)を
+                 つなげたbyte列をzlibで圧縮したもの. 最後のchunkはchunk_size個より少ないことがある
+        footer : chunkのbyte offsetなどが入ったjson
+        tail   : footerの長さ + MAGIC
+    chunk_sizeが固定なので、frame_idx番目のフレームはframe_idx // chunk_size番目のchunkにあり、
+    footerのindexから1回のseekで読める.
+    atomsのcolumnのうち、数値とbool以外(symbolなどのobject)は保存しない.
+
+    Attributes
+    ----------
+    file_path : str
+        fileのpath
+    meta : dict
+        footerの内容
+        "chunk_size", "frame_num", "atom_num", "columns"(atomsのcolumnとdtype), "frame_values"(保存したフレームごとの値),
+        "compress_level", "chunks"(chunkごとの[byte offset, byte長, フレーム数])
+    """
+    file_path: str
+    meta: dict
+
+    def __init__(self, file_path: Union[str, pathlib.Path]):
+        self.file_path = str(file_path)
+        self.meta = read_meta(self.file_path)
+        self.cached_chunk_idx = None
+        self.cached_chunk = None
+
+    def __len__(self) -> int:
+        return self.meta["frame_num"]
+
+    def read_chunk(self, chunk_idx: int) -> dict[str, np.ndarray]:
+        """chunk_idx番目のchunkを読み、配列のdictを返す. 直前に読んだchunkは保持しておく
+        """
+        if chunk_idx == self.cached_chunk_idx:
+            return self.cached_chunk
+        offset, length, frame_num = self.meta["chunks"][chunk_idx]
+        with open(self.file_path, "rb") as f:
+            f.seek(offset)
+            data = f.read(length)
+        self.cached_chunk = decode_chunk(data, self.meta, frame_num)
+        self.cached_chunk_idx = chunk_idx
+        return self.cached_chunk
+
+    def read_arrays(self, frame_indices=None) -> dict[str, np.ndarray]:
+        """frame_indicesのフレームの配列をまとめて返す
+        Returns
+        -------
+            arrays: dict[str, np.ndarray]
+                atomsのcolumnはshape:(frames, atoms), cellなどはshape:(frames, ...)
+        """
+        frame_num = len(self)
+        if frame_indices is None:
+            frame_indices = np.arange(frame_num)
+        frame_indices = np.asarray(frame_indices, dtype=np.int64)
+        frame_indices = np.where(frame_indices < 0, frame_indices + frame_num, frame_indices)
+        if np.any((frame_indices < 0) | (frame_indices >= frame_num)):
+            raise IndexError("frame index is out of range")
+
+        chunk_size = self.meta["chunk_size"]
+        names = [column for column, _ in self.meta["columns"]] + self.meta["frame_values"]
+        arrays = {}
+        chunk_indices = frame_indices // chunk_size
+        for chunk_idx in np.unique(chunk_indices):
+            chunk = self.read_chunk(int(chunk_idx))
+            is_in_chunk = chunk_indices == chunk_idx
+            local_indices = frame_indices[is_in_chunk] - chunk_idx * chunk_size
+            for name in names:
+                if name not in arrays:
+                    arrays[name] = np.empty((len(frame_indices),) + chunk[name].shape[1:],
+                                            dtype=chunk[name].dtype)
+                arrays[name][is_in_chunk] = chunk[name][local_indices]
+        return arrays
+
+    def read_frame(self, frame_idx: int, para_source) -> SimulationFrame:
+        """frame_idx番目のフレームをSimulationFrameとして返す
+        """
+        arrays = self.read_arrays([frame_idx])
+        return make_frames(arrays, self.meta, para_source)[0]
+
+
+def read_meta(file_path: str) -> dict:
+    """fileのfooterを読む
+    """
+    return read_footer(file_path)[0]
+
+
+def parse_tail(data, tail_end: int) -> dict:
+    """dataのtail_endで終わるtailとその前のfooterを読む. 壊れていればNone
+    """
+    if tail_end - TAIL_SIZE < HEAD_SIZE:
+        return None
+    footer_length, magic = struct.unpack(TAIL_FORMAT, data[tail_end - TAIL_SIZE:tail_end])
+    footer_start = tail_end - TAIL_SIZE - footer_length
+    if magic != MAGIC or footer_start < HEAD_SIZE:
+        return None
+    try:
+        meta = json.loads(bytes(data[footer_start:tail_end - TAIL_SIZE]))
+    except ValueError:
+        return None
+    if not isinstance(meta, dict) or "chunks" not in meta:
+        return None
+    return meta
+
+
+def read_footer(file_path: str) -> tuple[dict, int]:
+    """fileのfooterと、footerの後ろのtailの終わりのbyte offsetを返す
+    append中に中断されて末尾が書き込み途中のときは、その前の完全なfooterを探して返す.
+    そのfooterの位置までが有効なデータで、それより後ろは次のappendで上書きされる.
+    """
+    with open(file_path, "rb") as f:
+        magic, version = struct.unpack(HEAD_FORMAT, f.read(HEAD_SIZE))
+        assert magic == MAGIC, f"{file_path} is not a limda binary trajectory"
+        assert version <= VERSION, f"unsupported version {version}"
+        file_size = f.seek(0, os.SEEK_END)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            meta = parse_tail(data, file_size)
+            if meta is not None:
+                return meta, file_size
+            # 末尾のtailが壊れているときは、後ろからMAGICを探す
+            magic_idx = data.rfind(MAGIC, HEAD_SIZE)
+            while magic_idx >= 0:
+                meta = parse_tail(data, magic_idx + len(MAGIC))
+                if meta is not None:
+                    print(f"warning : the end of {file_path} is broken (interrupted append?)")
+                    print(f"warning : {file_size - magic_idx - len(MAGIC)} bytes after the last footer are ignored")
+                    return meta, magic_idx + len(MAGIC)
+                magic_idx = data.rfind(MAGIC, HEAD_SIZE, magic_idx + len(MAGIC) - 1)
+    raise AssertionError(f"{file_path} is broken (footer is not found)")
+
+
+def get_array_layout(meta: dict) -> list[tuple[str, np.dtype, tuple]]:
+    """chunk内の配列の(名前, dtype, 1フレームあたりのshape)を並び順に返す
+    """
+    layout = [(column, np.dtype(dtype), (meta["atom_num"],)) for column, dtype in meta["columns"]]
+    for name in meta["frame_values"]:
+        layout.append((name, np.dtype(FRAME_VALUE_DTYPES[name]), tuple(meta["frame_value_shapes"][name])))
+    return layout
+
+
+def encode_chunk(arrays: dict[str, np.ndarray], meta: dict) -> bytes:
+    data = b"".join(np.ascontiguousarray(arrays[name], dtype=dtype).tobytes()
+                    for name, dtype, _ in get_array_layout(meta))
+    return zlib.compress(data, meta["compress_level"])
+
+
+def decode_chunk(data: bytes, meta: dict, frame_num: int) -> dict[str, np.ndarray]:
+    data = zlib.decompress(data)
+    arrays = {}
+    offset = 0
+    for name, dtype, shape in get_array_layout(meta):
+        count = frame_num * int(np.prod(shape))
+        arrays[name] = np.frombuffer(data, dtype=dtype, count=count, offset=offset).reshape((frame_num,) + shape)
+        offset += count * dtype.itemsize
+    return arrays
+
+
+def frames_to_arrays(frames, meta: dict) -> dict[str, np.ndarray]:
+    """SimulationFrameのlistをchunkに書き込む配列のdictにする
+    """
+    arrays = {}
+    for column, dtype in meta["columns"]:
+        arrays[column] = np.empty((len(frames), meta["atom_num"]), dtype=dtype)
+    for name in meta["frame_values"]:
+        arrays[name] = np.empty((len(frames),) + tuple(meta["frame_value_shapes"][name]),
+                                dtype=FRAME_VALUE_DTYPES[name])
+    for frame_idx, frame in enumerate(frames):
+        assert frame.get_total_atoms() == meta["atom_num"], \
+            "all frames must have the same number of atoms"
+        assert [column for column, _ in meta["columns"]] == get_savable_columns(frame.atoms), \
+            "all frames must have the same columns"
+        for column, _ in meta["columns"]:
+            arrays[column][frame_idx] = frame.atoms[column].values
+        for name in meta["frame_values"]:
+            assert getattr(frame, name) is not None, f"{name} is not defined in some frames"
+            arrays[name][frame_idx] = getattr(frame, name)
+    return arrays
+
+
+def get_savable_columns(atoms: pd.DataFrame) -> list[str]:
+    """atomsのcolumnのうち保存できるもの(数値とbool)を返す
+    """
+    return [column for column in atoms.columns if atoms[column].dtype.kind in SAVABLE_DTYPE_KINDS]
+
+
+def make_meta(first_frame: SimulationFrame, chunk_size: int, compress_level: int) -> dict:
+    """最初のフレームからfooterの雛形を作る
+    cellなどのフレームごとの値は、最初のフレームで値があるもののみ保存する
+    atomsのcolumnのうち数値とbool以外は、byte列にできないので保存しない
+    """
+    columns = get_savable_columns(first_frame.atoms)
+    for column in first_frame.atoms.columns:
+        if column not in columns:
+            print(f"warning : column '{column}' ({first_frame.atoms[column].dtype}) is not numeric")
+            print(f"warning : column '{column}' is not saved to binary trajectory")
+    frame_values = []
+    frame_value_shapes = {}
+    for name in FRAME_VALUE_DTYPES:
+        if getattr(first_frame, name) is not None:
+            frame_values.append(name)
+            frame_value_shapes[name] = list(np.shape(getattr(first_frame, name)))
+    return {"version": VERSION,
+            "chunk_size": chunk_size,
+            "frame_num": 0,
+            "atom_num": first_frame.get_total_atoms(),
+            "columns": [[column, first_frame.atoms[column].dtype.str] for column in columns],
+            "frame_values": frame_values,
+            "frame_value_shapes": frame_value_shapes,
+            "compress_level": compress_level,
+            "chunks": []}
+
+
+def write_binary_trajectory(file_path: Union[str, pathlib.Path], frames, chunk_size: int = 100,
+                            compress_level: int = 6, append: bool = False) -> None:
+    """framesをbinary trajectory fileに書き込む
+    Parameters
+    ----------
+        file_path: Union[str, pathlib.Path]
+            出力先
+        frames: Union[list[SimulationFrame], Trajectory, LazyFrames]
+            書き込むフレーム
+        chunk_size: int
+            1つのchunkに入れるフレーム数, append=Trueで既存のfileに追記するときは既存のfileの値を使う
+        compress_level: int
+            zlibの圧縮レベル(0-9), 0ならば圧縮しない
+        append: bool
+            Trueならば既存のfileの後ろにフレームを追加する
+            最後のchunkがchunk_size個に満たないときは、そのchunkを読み直して新しいフレームと合わせて書き直す
+    Note
+    ----
+        appendでは既存のbyte列を上書きせず、新しいchunkとfooterをfileの末尾に書き足してから古いfooterを無効にする.
+        途中で中断されても古いfooterが残るので、appendする前の状態として読める.
+        書き直した最後のchunkと古いfooterはfile内に残るので、appendのたびにその分fileが大きくなる.
+    """
+    assert len(frames) > 0, "frames is empty"
+    file_path = str(file_path)
+    if append and os.path.exists(file_path):
+        meta, footer_end = read_footer(file_path)
+        new_meta = make_meta(frames[0], meta["chunk_size"], meta["compress_level"])
+        assert new_meta["atom_num"] == meta["atom_num"], "the number of atoms is different from the file"
+        assert [column for column, _ in new_meta["columns"]] == [column for column, _ in meta["columns"]], \
+            "columns are different from the file"
+        assert new_meta["frame_values"] == meta["frame_values"], \
+            "cell, potential_energy, virial_tensor or step_num is different from the file"
+        chunk_size = meta["chunk_size"]
+        mode = "r+b"
+    else:
+        meta = make_meta(frames[0], chunk_size, compress_level)
+        mode = "wb"
+
+    with open(file_path, mode) as f:
+        pending_arrays = None
+        if mode == "wb":
+            f.write(struct.pack(HEAD_FORMAT, MAGIC, VERSION))
+            write_offset = HEAD_SIZE
+        else:
+            # 既存のchunkとfooterは上書きせず、有効なfooterの後ろから書き足す
+            write_offset = footer_end
+            # 最後のchunkがchunk_size個に満たなければ読み直し、新しいフレームと合わせて末尾に書き直す
+            if meta["chunks"] and meta["chunks"][-1][2] < chunk_size:
+                offset, length, frame_num = meta["chunks"].pop()
+                f.seek(offset)
+                pending_arrays = decode_chunk(f.read(length), meta, frame_num)
+                meta["frame_num"] -= frame_num
+
+        f.seek(write_offset)
+        pending_frame_num = 0 if pending_arrays is None else len(pending_arrays[get_array_layout(meta)[0][0]])
+        # 読み直したフレームと合わせてchunk_size個ずつ書き込む
+        start = 0
+        while start < len(frames):
+            end = min(start + chunk_size - pending_frame_num, len(frames))
+            arrays = frames_to_arrays([frames[frame_idx] for frame_idx in range(start, end)], meta)
+            if pending_arrays is not None:
+                arrays = {name: np.concatenate([pending_arrays[name], arrays[name]]) for name in arrays}
+                pending_arrays = None
+            data = encode_chunk(arrays, meta)
+            frame_num = pending_frame_num + end - start
+            meta["chunks"].append([write_offset, len(data), frame_num])
+            meta["frame_num"] += frame_num
+            f.write(data)
+            write_offset += len(data)
+            pending_frame_num = 0
+            start = end
+
+        footer = json.dumps(meta).encode()
+        f.write(footer)
+        f.write(struct.pack(TAIL_FORMAT, len(footer), MAGIC))
+        # 中断されたappendの残りがあれば切り捨てる
+        f.truncate()
+
+
+def make_frames(arrays: dict[str, np.ndarray], meta: dict, para_source) -> list[SimulationFrame]:
+    """read_arraysの結果をSimulationFrameのlistにする
+    """
+    columns = [column for column, _ in meta["columns"]]
+    frame_num = len(arrays[columns[0]]) if columns else len(arrays[meta["frame_values"][0]])
+    frames = []
+    for frame_idx in range(frame_num):
+        sf = make_frame_sharing_para(para_source)
+        sf.atoms = pd.DataFrame({column: arrays[column][frame_idx] for column in columns})
+        if "cell" in arrays:
+            sf.cell = arrays["cell"][frame_idx].copy()
+        if "potential_energy" in arrays:
+            sf.potential_energy = float(arrays["potential_energy"][frame_idx])
+        if "virial_tensor" in arrays:
+            sf.virial_tensor = arrays["virial_tensor"][frame_idx].copy()
+        if "step_num" in arrays:
+            sf.step_num = int(arrays["step_num"][frame_idx])
+        frames.append(sf)
+    return frames
+
+
+def make_trajectory(arrays: dict[str, np.ndarray], meta: dict, para_source) -> Trajectory:
+    """read_arraysの結果からDataFrameを作らずにTrajectoryを作る
+    """
+    columns = [column for column, _ in meta["columns"]]
+    atom_arrays = {}
+    grouped_columns = set()
+    for name, vector_columns in VECTOR_COLUMNS.items():
+        if all(column in columns for column in vector_columns):
+            atom_arrays[name] = np.stack([arrays[column] for column in vector_columns], axis=-1)
+            grouped_columns.update(vector_columns)
+    shared_arrays = {}
+    for column in columns:
+        if column in grouped_columns:
+            continue
+        if np.all(arrays[column] == arrays[column][:1]):
+            shared_arrays[column] = arrays[column][0].copy()
+        else:
+            atom_arrays[column] = arrays[column]
+    frame_arrays = {name: arrays[name] for name in meta["frame_values"]}
+    return Trajectory(atom_arrays, shared_arrays, frame_arrays, columns, para_source)
@@ -0,0 +1,121 @@
+import bz2
+import gzip
+import io
+import lzma
+import pathlib
+from typing import Union, IO
+
+# 拡張子と圧縮形式
+COMPRESSION_SUFFIXES: dict[str, str] = {".gz": "gzip", ".bz2": "bz2", ".xz": "xz", ".zst": "zstd"}
+# gzipコマンドのデフォルト, gzip.openのデフォルト(9)は数倍遅い
+GZIP_COMPRESS_LEVEL: int = 6
+
+
+def get_compression(file_path: Union[str, pathlib.Path]) -> str:
+    """file_pathの拡張子から圧縮形式("gzip", "bz2", "xz", "zstd")を返す. 圧縮されていなければNone
+    """
+    return COMPRESSION_SUFFIXES.get(pathlib.Path(file_path).suffix)
+
+
+def strip_compression_suffix(file_name: str) -> str:
+    """file名から圧縮の拡張子を取り除く
+    dump.pos.1000.gz -> dump.pos.1000, OUTCAR.zst -> OUTCAR
+    """
+    for suffix in COMPRESSION_SUFFIXES:
+        if file_name.endswith(suffix):
+            return file_name[:-len(suffix)]
+    return file_name
+
+
+def find_file(file_path: Union[str, pathlib.Path]) -> pathlib.Path:
+    """file_pathが存在しなければ、圧縮された同名のfile(OUTCAR.gz, OUTCAR.zstなど)を探して返す
+    どれも存在しなければfile_pathをそのまま返す
+    """
+    file_path = pathlib.Path(file_path)
+    if file_path.exists():
+        return file_path
+    for suffix in COMPRESSION_SUFFIXES:
+        compressed_path = file_path.with_name(file_path.name + suffix)
+        if compressed_path.exists():
+            return compressed_path
+    return file_path
+
+
+class ZstdRawReader(io.RawIOBase):
+    """.zstのfileを展開しながら読むraw stream, io.BufferedReaderで包んで使う
+    zstandardのstreamはreadlineを持たず、seekable()がFalseなので、そのままではBufferedReaderでseekできない.
+    前方へのseekは読み飛ばす部分を展開して捨て、後方へのseekはgzipなどと同じく先頭から展開し直す.
+    """
+
+    def __init__(self, file_path: Union[str, pathlib.Path]):
+        self.file_path = file_path
+        self.reader = self.open_reader()
+
+    def open_reader(self):
+        import zstandard
+        return zstandard.open(self.file_path, "rb")
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        return self.reader.readinto(buffer)
+
+    def tell(self) -> int:
+        return self.reader.tell()
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self.reader.tell()
+        elif whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("SEEK_END is not supported for zstd stream")
+        if offset < self.reader.tell():
+            self.reader.close()
+            self.reader = self.open_reader()
+        return self.reader.seek(offset)
+
+    def close(self) -> None:
+        if not self.closed:
+            self.reader.close()
+        super().close()
+
+
+def open_file(file_path: Union[str, pathlib.Path], mode: str = "r", buffering: int = -1) -> IO:
+    """拡張子が.gz, .bz2, .xz, .zstのfileは圧縮streamとして、それ以外は通常のfileとして開く
+    一時fileに展開せず、読み書きしながら(解)圧縮する. .zstにはzstandard packageが必要.
+    Parameters
+    ----------
+        file_path: Union[str, pathlib.Path]
+            開くfileのpath
+        mode: str
+            openと同じ("r", "w", "a", "rb", "wb", "ab")
+        buffering: int
+            openと同じ, 圧縮されていないfileのときのみ使う
+    Note
+    ----
+        圧縮fileの後方へのseekは先頭から展開し直すので遅い.
+    """
+    compression = get_compression(file_path)
+    if compression is None:
+        return open(file_path, mode, buffering)
+
+    binary_mode = mode.replace("t", "")
+    if "b" not in binary_mode:
+        binary_mode += "b"
+    if compression == "gzip":
+        f = gzip.open(file_path, binary_mode, compresslevel=GZIP_COMPRESS_LEVEL)
+    elif compression == "bz2":
+        f = bz2.open(file_path, binary_mode)
+    elif compression == "xz":
+        f = lzma.open(file_path, binary_mode)
+    elif "r" in binary_mode:
+        f = io.BufferedReader(ZstdRawReader(file_path))
+    else:
+        import zstandard
+        f = zstandard.open(file_path, binary_mode)
+    if "b" in mode:
+        return f
+    return io.TextIOWrapper(f)
@@ -95,3 +95,5 @@ ATOM_SYMBOL_TO_MASS: dict[str, float] = {
 }
 
 AVOGADORO_CONST: float = 6.02214076 * (10 ** 23)  # avogadro constant
+
+EV_PER_ANGSTROM3_TO_KBAR: float = 1602.1766208  # 1 eV/Å^3 = 1602.1766208 kB
@@ -0,0 +1,272 @@
+import io
+import pandas as pd
+import numpy as np
+import os
+import pathlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Union, Iterator
+from .SimulationFrame import SimulationFrame
+from .trajectory import make_frame_sharing_para
+from .compression import open_file
+
+# atomsのcolumnのうち整数として読み込むもの
+INT_COLUMNS = ("type", "mask")
+
+
+def get_dump_index_path(file_path: Union[str, pathlib.Path]) -> pathlib.Path:
+    """dump fileのindexを保存するsidecar fileのpathを返す
+    md.pos -> md.pos.idx.npz
+    """
+    file_path = pathlib.Path(file_path)
+    return file_path.with_name(file_path.name + ".idx.npz")
+
+
+def scan_dump_offsets(file_path: Union[str, pathlib.Path]) -> tuple[np.ndarray, np.ndarray]:
+    """dump fileを一度だけ走査し、各フレームの"ITEM: TIMESTEP"の行のbyte offsetとstep数を返す
+    Returns
+    -------
+        offsets: np.ndarray[int], shape:[frames]
+        step_nums: np.ndarray[int], shape:[frames]
+    """
+    offsets = []
+    step_nums = []
+    offset = 0
+    with open_file(file_path, "rb") as f:
+        while True:
+            line = f.readline()
+            if not line:
+                break
+            if line.startswith(b"ITEM: TIMESTEP"):
+                offsets.append(offset)
+                offset += len(line)
+                line = f.readline()
+                step_nums.append(int(line))
+                offset += len(line)
+                line = f.readline()  # ITEM: NUMBER OF ATOMS
+                offset += len(line)
+                line = f.readline()
+                offset += len(line)
+                # 原子の行は読み飛ばす(5行のheader + 原子数)
+                atom_num = int(line)
+                for _ in range(atom_num + 5):
+                    offset += len(f.readline())
+                continue
+            offset += len(line)
+    return np.array(offsets, dtype=np.int64), np.array(step_nums, dtype=np.int64)
+
+
+def index_dump(file_path: Union[str, pathlib.Path], use_index_file: bool = True) -> tuple[np.ndarray, np.ndarray]:
+    """dump fileのフレームのbyte offsetとstep数を返す
+    use_index_file=Trueのときは、sidecar file(md.pos.idx.npz)があればそれを使い、なければ作る.
+    dump fileのsizeか更新時刻が変わっていたらindexを作り直す.
+    """
+    file_path = pathlib.Path(file_path)
+    stat = os.stat(file_path)
+    index_path = get_dump_index_path(file_path)
+    if use_index_file and index_path.exists():
+        with np.load(index_path) as index:
+            if int(index["file_size"]) == stat.st_size and int(index["mtime_ns"]) == stat.st_mtime_ns:
+                return index["offsets"], index["step_nums"]
+
+    offsets, step_nums = scan_dump_offsets(file_path)
+    if use_index_file:
+        try:
+            with open(index_path, "wb") as f:
+                np.savez(f, offsets=offsets, step_nums=step_nums,
+                         file_size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        except OSError:
+            print(f"warning : cannot write index file {index_path}")
+    return offsets, step_nums
+
+
+def decode_atom_columns(lines: list[bytes], columns: list[str]) -> dict[str, np.ndarray]:
+    """dump fileの原子の行をcolumnごとの配列にする
+    import_dumppos(pd.read_csv)と同じく、整数だけのcolumn(id, molなど)はint、それ以外の数値はfloatになる.
+    数値でないcolumn(elementなど)があるときはpd.read_csvで読む.
+    """
+    tokens = b" ".join(lines).split()
+    try:
+        float_values = np.array(tokens, dtype=np.float64).reshape(len(lines), len(columns))
+    except ValueError:
+        atoms = pd.read_csv(io.BytesIO(b"".join(lines)), sep=r"\s+", names=columns, header=None)
+        return {column: atoms[column].to_numpy() for column in columns}
+
+    values = {}
+    for column_idx, column in enumerate(columns):
+        values[column] = float_values[:, column_idx]
+        # 1行目が整数のcolumnのみ、全ての行が整数かを確かめる
+        if len(lines) == 0 or not tokens[column_idx].lstrip(b"+-").isdigit():
+            continue
+        try:
+            values[column] = np.array(tokens[column_idx::len(columns)], dtype=np.int64)
+        except ValueError:
+            pass
+    return values
+
+
+def decode_dump_frame_arrays(f, offset: int) -> tuple:
+    """開いているdump fileのoffsetから1フレームを読み、配列として返す
+    Returns
+    -------
+        (step_num, cell, box_lower, values)
+        valuesはidも含めたcolumnごとの原子の値, dict[str, np.ndarray]
+    """
+    f.seek(offset)
+    f.readline()  # ITEM: TIMESTEP
+    step_num = int(f.readline())
+    f.readline()  # ITEM: NUMBER OF ATOMS
+    atom_num = int(f.readline())
+    f.readline()  # ITEM: BOX BOUNDS
+    box_lower = np.empty(3)
+    cell = np.empty(3)
+    for dim in range(3):
+        spline = f.readline().split()
+        box_lower[dim] = float(spline[0])
+        cell[dim] = float(spline[1])
+    columns = [column.decode() for column in f.readline().split()[2:]]  # ITEM: ATOMS id ...
+    lines = [f.readline() for _ in range(atom_num)]
+    return step_num, cell, box_lower, decode_atom_columns(lines, columns)
+
+
+def decode_dump_frames_arrays(file_path: str, offsets: list[int]) -> list[tuple]:
+    """offsetsのフレームをまとめて読む, ProcessPoolExecutorのworkerで使う
+    """
+    with open_file(file_path, "rb") as f:
+        return [decode_dump_frame_arrays(f, offset) for offset in offsets]
+
+
+def set_dump_frame_arrays(sf: SimulationFrame, frame_arrays: tuple) -> None:
+    """decode_dump_frame_arraysの結果をsfに入れる
+    import_dumpposと同じく、atomsのindexはid-1で昇順に並べ、BOX BOUNDSの下限が原点になるように平行移動する
+    """
+    step_num, cell, box_lower, values = frame_arrays
+    atom_ids = values["id"].astype(np.int64) - 1
+    order = np.argsort(atom_ids, kind="stable")
+    sf.step_num = step_num
+    sf.cell = cell
+    sf.atoms = pd.DataFrame(
+        {column: column_values[order] for column, column_values in values.items() if column != "id"},
+        index=atom_ids[order])
+    for column in INT_COLUMNS:
+        if column in sf.atoms:
+            sf.atoms[column] = sf.atoms[column].astype(int)
+    sf.slide_atoms(-1 * box_lower)
+
+
+def load_dump_frame(sf: SimulationFrame, file_path: str, offset: int) -> None:
+    """複数フレームのdump fileのoffsetから1フレームを読み込むLazyFramesのloader
+    """
+    with open_file(file_path, "rb") as f:
+        set_dump_frame_arrays(sf, decode_dump_frame_arrays(f, offset))
+
+
+class LammpsDumpReader:
+    """export_lammps_dumpposesやconsolidate_dumpposes.pyで作った、複数フレームが連結されたdump file(md.pos)を読むクラス
+    最初に一度だけfileを走査してフレームごとのbyte offsetを記録し(sidecar fileに保存される)、
+    必要なフレームだけをseekして読み込む.
+    圧縮file(md.pos.gzなど)も読めるが、offsetは展開後の位置で、seekのたびに先頭から展開し直すので、
+    iter_framesのように前から順に読むときだけ速い.
+
+    Attributes
+    ----------
+    file_path : str
+        dump fileのpath
+    offsets : np.ndarray[int]
+        各フレームの"ITEM: TIMESTEP"の行のbyte offset
+    step_nums : np.ndarray[int]
+        各フレームのstep数
+
+    Example
+    -------
+        reader = LammpsDumpReader("md.pos", sfs)
+        sf = reader[10]
+        frames = reader[::100]
+        for sf in reader.iter_frames(step=100):
+            ...
+        frames = reader.read_frames(range(0, len(reader), 10), num_workers=4)
+    """
+    file_path: str
+    offsets: np.ndarray
+    step_nums: np.ndarray
+
+    def __init__(self, file_path: Union[str, pathlib.Path], para_source, use_index_file: bool = True):
+        """
+        Parameters
+        ----------
+            file_path: Union[str, pathlib.Path]
+                dump fileのpath
+            para_source: SimulationFrames
+                atom_symbol_to_typeなどを共有するsfs
+            use_index_file: bool
+                Trueならばindexをsidecar file(md.pos.idx.npz)に保存し、次回からはそれを使う
+        """
+        self.file_path = str(file_path)
+        self.para_source = para_source
+        self.offsets, self.step_nums = index_dump(file_path, use_index_file)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __getitem__(self, key: Union[int, slice]) -> Union[SimulationFrame, list[SimulationFrame]]:
+        """reader[10]はSimulationFrame, reader[::10]はSimulationFrameのlistを返す
+        """
+        if isinstance(key, slice):
+            return self.read_frames(range(len(self))[key])
+        assert isinstance(key, (int, np.integer)), "frame index must be int or slice"
+        return self.read_frame(key)
+
+    def __iter__(self) -> Iterator[SimulationFrame]:
+        return self.iter_frames()
+
+    def make_frame(self, frame_arrays: tuple) -> SimulationFrame:
+        sf = make_frame_sharing_para(self.para_source)
+        set_dump_frame_arrays(sf, frame_arrays)
+        return sf
+
+    def read_frame(self, frame_idx: int) -> SimulationFrame:
+        """frame_idx番目のフレームを読み込む
+        """
+        with open_file(self.file_path, "rb") as f:
+            return self.make_frame(decode_dump_frame_arrays(f, self.offsets[frame_idx]))
+
+    def iter_frames(self, start: int = None, stop: int = None, step: int = None) -> Iterator[SimulationFrame]:
+        """start番目からstop番目までstepおきにフレームを1つずつ読み込むgenerator
+        fileは開いたままにし、読み飛ばすフレームはparseしない
+        """
+        with open_file(self.file_path, "rb") as f:
+            for offset in self.offsets[start:stop:step]:
+                yield self.make_frame(decode_dump_frame_arrays(f, offset))
+
+    def read_frames(self, frame_indices=None, num_workers: int = 1) -> list[SimulationFrame]:
+        """frame_indicesのフレームを読み込み、listで返す
+        Parameters
+        ----------
+            frame_indices: list[int]
+                読み込むフレームのindex, Noneならば全フレーム
+            num_workers: int
+                2以上ならばフレームを連続した範囲に分け、プロセス並列で読み込む
+                返すlistの順番はframe_indicesの順番と同じ
+        """
+        if frame_indices is None:
+            frame_indices = range(len(self))
+        offsets = self.offsets[np.asarray(frame_indices, dtype=np.int64)].tolist()
+        if num_workers <= 1 or len(offsets) <= 1:
+            return [self.make_frame(frame_arrays)
+                    for frame_arrays in decode_dump_frames_arrays(self.file_path, offsets)]
+
+        chunk_size = -(-len(offsets) // num_workers)
+        offset_chunks = [offsets[i:i+chunk_size] for i in range(0, len(offsets), chunk_size)]
+        frames = []
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            for chunk in executor.map(decode_dump_frames_arrays,
+                                      [self.file_path] * len(offset_chunks), offset_chunks):
+                frames.extend(self.make_frame(frame_arrays) for frame_arrays in chunk)
+        return frames
+
+    def get_lazy_entries(self, frame_indices=None) -> list[tuple]:
+        """LazyFramesのentryを返す
+        """
+        if frame_indices is None:
+            frame_indices = range(len(self))
+        return [(load_dump_frame, (self.file_path, int(self.offsets[idx])), int(self.step_nums[idx]))
+                for idx in frame_indices]
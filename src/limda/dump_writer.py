@@ -0,0 +1,124 @@
+import pathlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Union, Iterable
+from tqdm import tqdm
+from .SimulationFrame import SimulationFrame
+from .text_format import format_lammps_dump_atoms
+from .compression import open_file
+
+
+def format_lammps_dump_frame(sf: SimulationFrame, step_num: int, out_columns: list[str]) -> str:
+    """sfをlammps形式のdumpposの1フレーム(headerとATOMS)の文字列にする
+    """
+    header = []
+    header.append(f'ITEM: TIMESTEP\n')
+    header.append(f'{step_num}\n')
+    header.append(f'ITEM: NUMBER OF ATOMS\n')
+    header.append(f'{sf.get_total_atoms()}\n')
+    header.append(f'ITEM: BOX BOUNDS xy xz yz pp pp pp\n')
+    header.append(
+        f'0.0000000000000000e+00 {sf.cell[0]:.16e} 0.0000000000000000e+00\n')
+    header.append(
+        f'0.0000000000000000e+00 {sf.cell[1]:.16e} 0.0000000000000000e+00\n')
+    header.append(
+        f'0.0000000000000000e+00 {sf.cell[2]:.16e} 0.0000000000000000e+00\n')
+    header.append(f'ITEM: ATOMS id {" ".join(out_columns)}\n')
+    return "".join(header) + format_lammps_dump_atoms(sf.atoms, out_columns)
+
+
+class LammpsDumpWriter:
+    """複数のフレームを1つのlammps形式のdump fileに書き込むクラス
+    fileは開いたままbufferを通して書き込み、フレームの文字列はthread poolで作るので、
+    あるフレームを書き込んでいる間に次のフレームの文字列を作れる.
+    書き込む順番はwrite_frameを呼んだ順番になる. with文で使うとcloseが呼ばれる.
+
+    Attributes
+    ----------
+    out_columns : list[str]
+        sf.atomsのどのカラムを出力するのか
+    frame_num : int
+        write_frameを呼んだフレーム数
+    """
+    out_columns: list[str]
+    frame_num: int
+
+    def __init__(self, ofn: Union[str, pathlib.Path], out_columns: list[str] = None,
+                 num_workers: int = 2, buffer_size: int = 1 << 22):
+        """
+        Parameters
+        ----------
+            ofn: Union[str, pathlib.Path]
+                出力先, .gz, .bz2, .xz, .zstで終わるときは圧縮しながら書き込む
+            out_columns: list[str]
+                sf.atomsのどのカラムを出力するのか, デフォルトは['type', 'x', 'y', 'z']
+            num_workers: int
+                フレームの文字列を作るthreadの数
+            buffer_size: int
+                fileのbufferの大きさ(byte), 圧縮しないときのみ使う
+        """
+        if out_columns is None:
+            out_columns = ['type', 'x', 'y', 'z']
+        self.out_columns = out_columns
+        self.frame_num = 0
+        self.f = open_file(ofn, 'w', buffering=buffer_size)
+        self.executor = ThreadPoolExecutor(max_workers=num_workers)
+        self.pending = deque()
+        self.max_pending = num_workers * 2
+
+    def write_frame(self, sf: SimulationFrame, step_num: int = None) -> None:
+        """sfを書き込む. 文字列を作り終わったフレームから順番に書き込まれる
+        Parameters
+        ----------
+            sf: SimulationFrame
+                書き込むフレーム, 書き込まれるまでは変更しないこと
+            step_num: int
+                TIMESTEPに書く値, Noneならばsf.step_num, それもNoneならばこれまでに書き込んだフレーム数
+        """
+        if step_num is None:
+            step_num = sf.step_num if sf.step_num is not None else self.frame_num
+        self.pending.append(self.executor.submit(format_lammps_dump_frame, sf, step_num, self.out_columns))
+        self.frame_num += 1
+        while len(self.pending) >= self.max_pending:
+            self.f.write(self.pending.popleft().result())
+
+    def write_frames(self, frames: Iterable[SimulationFrame], desc: str = None) -> None:
+        """framesを順番に書き込む
+        Parameters
+        ----------
+            frames: Iterable[SimulationFrame]
+                SimulationFrames, list[SimulationFrame], SimulationFrameを返すgeneratorなど
+            desc: str
+                tqdmに表示する文字列
+        """
+        if hasattr(frames, "sf"):
+            # SimulationFrames, sfがLazyFramesのときはここで1フレームずつ読み込まれる
+            sf_list = frames.sf
+            frames = (sf_list[step_idx] for step_idx in range(len(sf_list)))
+            total = len(sf_list)
+        else:
+            total = len(frames) if hasattr(frames, "__len__") else None
+        for sf in tqdm(frames, desc=desc, total=total):
+            self.write_frame(sf)
+
+    def flush(self) -> None:
+        """作成中のフレームを全て書き込む
+        """
+        while self.pending:
+            self.f.write(self.pending.popleft().result())
+        self.f.flush()
+
+    def close(self) -> None:
+        if self.f.closed:
+            return
+        try:
+            self.flush()
+        finally:
+            self.executor.shutdown()
+            self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -4,6 +4,8 @@ import pathlib
 import subprocess
 from typing import Union
 from datetime import datetime
+from .text_format import format_dumppos_atoms, iter_format_input_atoms, format_car_atoms, format_xsf_atoms
+from .compression import open_file, strip_compression_suffix
 
 
 class ExportFrame(
@@ -77,15 +79,14 @@ class ExportFrame(
         self.atoms['symbol'] = self.atoms['type'].replace(
             self.atom_type_to_symbol)
         self.atoms = self.atoms.sort_values('type').reset_index(drop=True)
-        with open(ofn, 'w') as ofp:
-            ofp.writelines(header_line)
-
         if flag_selective_dynamics:
             columns = ['x', 'y', 'z', 'fixx', 'fixy', 'fixz']
         else:
             columns = ['x', 'y', 'z']
-        self.atoms.to_csv(ofn, columns=columns, mode='a', header=False,
-                          sep=' ', float_format='%.10f', index=False)
+        with open_file(ofn, 'w') as ofp:
+            ofp.writelines(header_line)
+            self.atoms.to_csv(ofp, columns=columns, header=False,
+                              sep=' ', float_format='%.10f', index=False)
 
     def export_vasp_poscar_from_contcar(
         self,
@@ -269,17 +270,12 @@ class ExportFrame(
             " ".join(["ITEM: ATOMS"] + ['id'] + out_columns) + "\n"
         ]
 
-        with open(ofn, 'w') as ofp:
-            ofp.writelines(header_line)
+        # headerと原子の行を1つの文字列にして1度で書き込む, idは1-indexed
+        with open_file(ofn, 'w') as ofp:
+            ofp.write("".join(header_line) + format_dumppos_atoms(self.atoms, out_columns))
 
-        # 1-indexed
-        self.atoms.index = self.atoms.index + 1
-        self.atoms.to_csv(ofn, columns=out_columns, mode='a', header=False,
-                          sep=' ', float_format='%.6f')
-        # 0-indexed
-        self.atoms.index = self.atoms.index - 1
-
-    def export_input(self, ofn: Union[str, pathlib.Path] = "input.rd", mask_info: list[str] = []) -> None:
+    def export_input(self, ofn: Union[str, pathlib.Path] = "input.rd", mask_info: list[str] = [],
+                     chunk_size: int = None) -> None:
         """input.rdを作成する。
         Parameters
         ----------
@@ -288,6 +284,9 @@ class ExportFrame(
         mask_info: list[str]
             mask変数に対して、move,pressを行いたいときに出力する情報
             lax,laichの正しい書式で行ごとに要素にしてください。
+        chunk_size: int
+            指定したときは原子の行をchunk_size行ずつ文字列にして書き込み、fileの内容全体の文字列を作らない
+            Noneならば全体を1つの文字列にして1度で書き込む
         """
         for dim in range(3):
             if self.cell[dim] == 0:
@@ -323,23 +322,14 @@ class ExportFrame(
 
         self.wrap_atoms()
 
-        def make_coods_not_zero(axises: list[str]):
-            for axis in axises:
-                self.atoms[axis] = np.where(
-                    0, 0.0001, self.atoms[axis])
-        make_coods_not_zero(['x', 'y', 'z'])
-
-        self.atoms.index = self.atoms.index + 1  # 1-indexed
-        body_line = []
-        for row in self.atoms[out_columns].itertuples():
-            body_line.append('    '.join(map(str, row)))
-            body_line.append('\n')
-
-        with open(ofn, 'w') as ofs:
-            ofs.writelines(header_line)
-            ofs.writelines(body_line)
-
-        self.atoms.index = self.atoms.index - 1
+        # idは1-indexed, 値はstr(value)と同じ文字列になる
+        with open_file(ofn, 'w') as ofs:
+            if chunk_size is None:
+                ofs.write("".join(header_line) + "".join(iter_format_input_atoms(self.atoms, out_columns)))
+            else:
+                ofs.writelines(header_line)
+                for body in iter_format_input_atoms(self.atoms, out_columns, chunk_size):
+                    ofs.write(body)
 
     def export_xyz(self, ofn: Union[str, pathlib.Path],
                    out_columns: list[str] = None,
@@ -365,11 +355,11 @@ class ExportFrame(
             f"{structure_name}\n",
         ]
 
-        with open(ofn, 'w') as ofp:
+        with open_file(ofn, 'w') as ofp:
             ofp.writelines(header_line)
-        self.atoms.to_csv(ofn, columns=out_columns, sep='\t',
-                          mode='a', header=False, index=False,
-                          float_format='%.6f')
+            self.atoms.to_csv(ofp, columns=out_columns, sep='\t',
+                              header=False, index=False,
+                              float_format='%.6f')
 
     def export_car(self, export_filename: str):
         """
@@ -395,19 +385,9 @@ class ExportFrame(
                 f"PBC {self.cell[0]:8.4f} {self.cell[1]:8.4f} {self.cell[2]:8.4f}    90.0000   90.0000   90.0000 (P1)\n")
         else:
             header_line[1] = "PBC=OFF\n"
-        car_df = self.atoms.sort_values(by="type")
-        typ_cnt = np.array([0 for _ in range(len(self.atom_symbol_to_type))])
-
-        def make_atom_line_for_car(atom):
-            typ_cnt[int(atom['type']) - 1] += 1
-            symbol = self.atom_type_to_symbol[atom['type']]
-            return f"{symbol+str(typ_cnt[int(atom['type']) - 1]):5}  {atom['x']:13.9f}  {atom['y']:13.9f}  {atom['z']:13.9f}  XXXX 1      xx     {symbol:<3} 0.000\n"
-        atom_lines = car_df.apply(make_atom_line_for_car, axis=1).to_numpy()
-        with open(export_filename, 'w') as ofp:
-            ofp.writelines(header_line)
-            ofp.writelines(atom_lines)
-            ofp.writelines("end\n")
-            ofp.writelines("end\n")
+        atom_lines = format_car_atoms(self.atoms, self.atom_type_to_symbol)
+        with open_file(export_filename, 'w') as ofp:
+            ofp.write("".join(header_line) + atom_lines + "end\n" + "end\n")
 
     def export_xsf(self, ofn: str, out_columns=None) -> None:
         """xsf形式のファイルを出力する
@@ -421,9 +401,6 @@ class ExportFrame(
         """
         if out_columns is None:
             out_columns = ['symbol', 'x', 'y', 'z']
-        now = datetime.now()
-        f = open(ofn, 'w')
-
         header = []
         header.append(f'# total energy =   {self.potential_energy} \n')
         header.append("\n")
@@ -435,28 +412,21 @@ class ExportFrame(
             header.append(f"{0:>4.6f} {0:>4.6f} {self.cell[2]:>4.6f} \n")
         header.append("PRIMCOORD\n")
         header.append(f"{len(self)}\n")
-        f.writelines(header)
 
         # write xyz coordinates and forces
-        # 1-index
-        self.atoms['symbol'] = self.atoms['type'].replace(
-            self.atom_type_to_symbol)
-        self.atoms.index += 1
-        self.atoms.to_csv(f, columns=out_columns, sep=' ',
-                                        mode='a', header=False, index=False,
-                                        float_format='%.6f')
-        # 0-index
-        self.atoms.index -= 1
+        with open_file(ofn, 'w') as f:
+            f.write("".join(header) + format_xsf_atoms(self.atoms, out_columns, self.atom_type_to_symbol))
 
     def export_file(self, export_filename: str):
         """引数のfile名に合った種類の形式でfileを作成.
+        file名が.gz, .bz2, .xz, .zstで終わるときは、拡張子を除いたfile名で形式を判断し、圧縮しながら書き込む.
         Parameter
         ---------
         export_filename: str 
             作成するfile名
         """
         export_filename = pathlib.Path(export_filename)
-        export_file_basename = export_filename.name
+        export_file_basename = strip_compression_suffix(export_filename.name)
         if "input" in export_file_basename:
             self.export_input(export_filename)
         elif export_file_basename.endswith('xyz'):
@@ -1,9 +1,12 @@
 import pathlib
 import os
 import numpy as np
-import pickle
-from tqdm import trange
+from typing import Union
 from .export_frame import ExportFrame
+from .binary_trajectory import write_binary_trajectory
+from .npy_trajectory import write_npy_trajectory
+from .dump_writer import LammpsDumpWriter
+from .allegro_dataset import iter_allegro_data, AllegroPickleWriter, AllegroDatasetWriter
 
 
 class ExportFrames(
@@ -12,7 +15,7 @@ class ExportFrames(
     def __init__(self):
         pass
 
-    def export_dumpposes(self, output_folder: str = None, out_columns=None) -> None:
+    def export_dumpposes(self, output_folder: str = None, out_columns=None, compression_suffix: str = "") -> None:
         """SimulationFramesに入ってるSimulationFrameを出力する。
         Parameters
         ----------
@@ -20,6 +23,8 @@ class ExportFrames(
             出力する場所のパス
         out_columns: list[str]
             dumpposファイルに出力する列の名前の入ったlist
+        compression_suffix: str
+            ".gz", ".bz2", ".xz", ".zst"のどれかにすると、dump.pos.1000.gzのように圧縮して出力する
         """
         if output_folder is None:
             output_folder = pathlib.Path.cwd()
@@ -31,9 +36,48 @@ class ExportFrames(
                 step_num = idx
             else:
                 step_num = frame.step_num
-            frame.export_dumppos(ofn=output_folder / f'dump.pos.{step_num}',
+            frame.export_dumppos(ofn=output_folder / f'dump.pos.{step_num}{compression_suffix}',
                                  time_step=step_num, out_columns=out_columns)
 
+    def export_binary_trajectory(self, ofn: str, chunk_size: int = 100, compress_level: int = 6,
+                                 append: bool = False) -> None:
+        """sfs.sfをbinary trajectory file(.ltrj)に出力する
+        atomsの数値とboolのcolumn, cell, potential_energy, virial_tensor, step_numをchunk_sizeフレームごとに圧縮して保存する.
+        symbolなどの文字列のcolumnはwarningを出して保存しない. import_binary_trajectoryで読み込める.
+        Parameters
+        ----------
+            ofn: str
+                出力先
+            chunk_size: int
+                1つのchunkに入れるフレーム数
+            compress_level: int
+                zlibの圧縮レベル(0-9), 0ならば圧縮しない
+            append: bool
+                Trueならばofnの後ろにフレームを追加する
+                既存のbyte列は上書きしないので、途中で中断されてもappendする前の状態として読める
+        Note
+        ----
+            全フレームの原子数とcolumnが同じである必要がある.
+        """
+        write_binary_trajectory(ofn, self.sf, chunk_size, compress_level, append)
+
+    def export_npy_trajectory(self, output_dir: str, use_float32: bool = False) -> None:
+        """sfs.sfをpack_sfs()後のTrajectoryと同じ配列ごとの.npy file(pos.npy, force.npy, type.npy, cell.npy,
+        potential_energy.npyなど)とmeta.jsonとしてoutput_dirに出力する.
+        import_npy_trajectoryでnp.memmapとして読み込める.
+        Parameters
+        ----------
+            output_dir: str
+                出力先のdirectory
+            use_float32: bool
+                Trueならば座標, 力, 速度をfloat32で保存する
+        Note
+        ----
+            全フレームの原子数とcolumnが同じである必要がある.
+            sfs.sfがlistやLazyFramesのときは1フレームずつ書き込むので、全フレームをメモリに乗せる必要はない.
+        """
+        write_npy_trajectory(output_dir, self.sf, use_float32)
+
     def export_allegro_frames(self,
                               output_dir: str,
                               output_file_name: str,
@@ -46,6 +90,11 @@ class ExportFrames(
                               exclude_too_small_cell: bool = True,
                               exclude_too_large_force: bool = True,
                               max_allowable_force: float = 50.0,
+                              num_workers: int = 1,
+                              append: bool = False,
+                              source: Union[str, list[str]] = None,
+                              remove_duplicates: bool = False,
+                              duplicate_tolerance: float = 1e-3,
                               ):
         """
         allegro用のデータセットを保存する
@@ -73,6 +122,17 @@ class ExportFrames(
                 forceが基準値(max_allowable_force)より大きいフレームを除外するか
             max_allowable_force : float
                 フレームを除外する力の基準値 (exclude_unsuitable_force_frame == True のとき)
+            num_workers : int
+                2以上ならばプロセス並列でedge_indexを計算する. 出力されるフレームの順番は変わらない
+            append : bool
+                Trueならば既存のデータセットの後ろにフレームを追加する.
+                manifestに記録された構造(train, testのどちらか)と同じhashを持つフレームは読み飛ばす
+            source : Union[str, list[str]]
+                manifestに記録するフレームのsource(VASPの計算directoryなど), listならばフレームごとのsource
+            remove_duplicates : bool
+                Trueならばsfs内で重複した構造(get_unique_frame_indices)は最初のフレームだけを出力する
+            duplicate_tolerance : float
+                重複の判定で座標とcellを量子化する幅(Å)
         """
         if test_size is not None:
             assert 0.0 <= test_size <= 1.0
@@ -89,51 +149,15 @@ class ExportFrames(
         frames_path = output_dir / output_file_name
         os.makedirs(output_dir, exist_ok=True)
 
-        train_frames = []
-        test_frames = []
         if shuffle:
             self.shuffle_sfs(seed=seed)
-        for sf_idx in range(len(self)):
-            data = {}
-            data["cell"] = np.array(self.sf[sf_idx].cell, dtype=np.float32)
-            if exclude_too_small_cell and np.any(self.sf[sf_idx].cell < 2 * cut_off):
-                print(
-                    f"Exculuded frame : cellsize(={np.min(self.sf[sf_idx].cell)}) is smaller than 2 x cutoff(= {cut_off*2})", flush=True)
-                continue
-            data["pos"] = np.array(
-                self.sf[sf_idx].atoms[["x", "y", "z"]].values, dtype=np.float32)
-            data["force"] = np.array(
-                self.sf[sf_idx].atoms[["fx", "fy", "fz"]].values, dtype=np.float32)
-            if exclude_too_large_force and np.abs(data['force']).max().item() > max_allowable_force:
-                print(
-                    f"Exculuded frame : force(={np.abs(data['force']).max().item()}) is larger than reference value of force(={max_allowable_force})", flush=True)
-                continue
-            data["atom_types"] = np.array(self.sf[sf_idx].atoms["type"].values)
-            data["atom_types"] -= 1
-            data["cut_off"] = np.array(cut_off, dtype=np.float32)
-            data["potential_energy"] = np.array(
-                self.sf[sf_idx].potential_energy, dtype=np.float32)
-            data["virial"] = np.array(
-                self.sf[sf_idx].virial_tensor, dtype=np.float32)
-
-            edge_index = [[], []]
-            edge_index = self.sf[sf_idx].get_edge_index(cut_off=cut_off)
-
-            data["edge_index"] = np.array(edge_index)
-            if test_size is not None:
-                if sf_idx < len(self)*(1.0-test_size):
-                    train_frames.append(data)
-                else:
-                    test_frames.append(data)
-            else:
-                train_frames.append(data)
-
-        with open(frames_path, "wb") as f:
-            pickle.dump(train_frames, f)
-
-        if test_size is not None:
-            with open(test_frames_path, "wb") as f:
-                pickle.dump(test_frames, f)
+        with AllegroPickleWriter(frames_path, append) as train_writer:
+            test_writer = AllegroPickleWriter(test_frames_path, append) if test_size is not None else None
+            self.write_allegro_data(train_writer, test_writer, cut_off, test_size, exclude_too_small_cell,
+                                    exclude_too_large_force, max_allowable_force, False, num_workers, source,
+                                    duplicate_tolerance if remove_duplicates else None)
+            if test_writer is not None:
+                test_writer.close()
 
     def export_allegro_frames_for_triclinic_cell(self,
                               output_dir: str,
@@ -147,6 +171,11 @@ class ExportFrames(
                               exclude_too_small_cell: bool = True,
                               exclude_too_large_force: bool = True,
                               max_allowable_force: float = 50.0,
+                              num_workers: int = 1,
+                              append: bool = False,
+                              source: Union[str, list[str]] = None,
+                              remove_duplicates: bool = False,
+                              duplicate_tolerance: float = 1e-3,
                               ):
         """
         allegro用のデータセットを保存する
@@ -174,6 +203,17 @@ class ExportFrames(
                 forceが基準値(max_allowable_force)より大きいフレームを除外するか
             max_allowable_force : float
                 フレームを除外する力の基準値 (exclude_unsuitable_force_frame == True のとき)
+            num_workers : int
+                2以上ならばプロセス並列でedge_indexを計算する. 出力されるフレームの順番は変わらない
+            append : bool
+                Trueならば既存のデータセットの後ろにフレームを追加する.
+                manifestに記録された構造(train, testのどちらか)と同じhashを持つフレームは読み飛ばす
+            source : Union[str, list[str]]
+                manifestに記録するフレームのsource(VASPの計算directoryなど), listならばフレームごとのsource
+            remove_duplicates : bool
+                Trueならばsfs内で重複した構造(get_unique_frame_indices)は最初のフレームだけを出力する
+            duplicate_tolerance : float
+                重複の判定で座標とcellを量子化する幅(Å)
         """
         if test_size is not None:
             assert 0.0 <= test_size <= 1.0
@@ -190,106 +230,159 @@ class ExportFrames(
         frames_path = output_dir / output_file_name
         os.makedirs(output_dir, exist_ok=True)
 
-        train_frames = []
-        test_frames = []
         if shuffle:
             self.shuffle_sfs(seed=seed)
-        for sf_idx in range(len(self)):
-            data = {}
-            data["cell"] = np.array(self.sf[sf_idx].cell, dtype=np.float32)
-#triclinic            if exclude_too_small_cell and np.any(self.sf[sf_idx].cell < 2 * cut_off):
-#triclinic                print(
-#triclinic                    f"Exculuded frame : cellsize(={np.min(self.sf[sf_idx].cell)}) is smaller than 2 x cutoff(= {cut_off*2})", flush=True)
-#triclinic                continue
+        with AllegroPickleWriter(frames_path, append) as train_writer:
+            test_writer = AllegroPickleWriter(test_frames_path, append) if test_size is not None else None
+            self.write_allegro_data(train_writer, test_writer, cut_off, test_size, exclude_too_small_cell,
+                                    exclude_too_large_force, max_allowable_force, True, num_workers, source,
+                                    duplicate_tolerance if remove_duplicates else None)
+            if test_writer is not None:
+                test_writer.close()
 
-#Bgn triclinic ---------------------
-            if  exclude_too_small_cell and np.any(np.diag(self.sf[sf_idx].cell) < 2 * cut_off):
-                print(
-                    f"Exculuded frame : cellsize(={np.min(np.diag(self.sf[sf_idx].cell))}) is smaller than 2 x cutoff(= {cut_off*2})", flush=True)
-                continue
-#End triclinic----------------------
-
-            data["pos"] = np.array(
-                self.sf[sf_idx].atoms[["x", "y", "z"]].values, dtype=np.float32)
-            data["force"] = np.array(
-                self.sf[sf_idx].atoms[["fx", "fy", "fz"]].values, dtype=np.float32)
-            if exclude_too_large_force and np.abs(data['force']).max().item() > max_allowable_force:
-                print(
-                    f"Exculuded frame : force(={np.abs(data['force']).max().item()}) is larger than reference value of force(={max_allowable_force})", flush=True)
-                continue
-            data["atom_types"] = np.array(self.sf[sf_idx].atoms["type"].values)
-            data["atom_types"] -= 1
-            data["cut_off"] = np.array(cut_off, dtype=np.float32)
-            data["potential_energy"] = np.array(
-                self.sf[sf_idx].potential_energy, dtype=np.float32)
-            data["virial"] = np.array(
-                self.sf[sf_idx].virial_tensor, dtype=np.float32)
+    def export_allegro_dataset(self,
+                               output_dir: str,
+                               cut_off: float,
+                               shuffle: bool = False,
+                               seed: int = 1,
+                               test_size: float = None,
+                               test_output_dir: str = None,
+                               exclude_too_small_cell: bool = True,
+                               exclude_too_large_force: bool = True,
+                               max_allowable_force: float = 50.0,
+                               triclinic: bool = False,
+                               num_workers: int = 1,
+                               append: bool = False,
+                               source: Union[str, list[str]] = None,
+                               remove_duplicates: bool = False,
+                               duplicate_tolerance: float = 1e-3,
+                               ) -> None:
+        """
+        allegro用のデータセットをcolumnar形式(AllegroDatasetWriter)でdirectoryに保存する
+        中身はexport_allegro_framesのpickleと同じだが、全フレームのpos, force, atom_types, edge_indexを連結した配列と
+        フレームの先頭位置の配列として保存するので、AllegroDatasetでmmapして一瞬で開ける.
+        フレームは1つずつ書き込むので、全フレームのデータをメモリに乗せる必要はない.
+        Parameters
+        ----------
+            output_dir : str
+                出力するdirectory
+            cut_off : float
+                cutoff距離
+            shuffle : bool
+                フレームをシャッフルするか
+            seed : int
+                シャッフルするときのシード値
+            test_size : float
+                test用にする割合
+            test_output_dir : str
+                test用 : 出力するdirectory
+            exclude_too_small_cell : bool
+                cutoff x 2 以下のセルサイズを持つフレームを除外するか
+            exclude_too_large_force : bool
+                forceが基準値(max_allowable_force)より大きいフレームを除外するか
+            max_allowable_force : float
+                フレームを除外する力の基準値 (exclude_too_large_force == True のとき)
+            triclinic : bool
+                Trueならばexport_allegro_frames_for_triclinic_cellと同じくshiftも保存する
+            num_workers : int
+                2以上ならばプロセス並列でedge_indexを計算する. 出力されるフレームの順番は変わらない
+            append : bool
+                Trueならば既存のデータセットの後ろにフレームを追加する.
+                manifestに記録された構造(train, testのどちらか)と同じhashを持つフレームは読み飛ばす
+            source : Union[str, list[str]]
+                manifestに記録するフレームのsource(VASPの計算directoryなど), listならばフレームごとのsource
+            remove_duplicates : bool
+                Trueならばsfs内で重複した構造(get_unique_frame_indices)は最初のフレームだけを出力する
+            duplicate_tolerance : float
+                重複の判定で座標とcellを量子化する幅(Å)
+        """
+        if test_size is not None:
+            assert 0.0 <= test_size <= 1.0
+            assert test_output_dir is not None
+        if shuffle:
+            self.shuffle_sfs(seed=seed)
 
-#triclinic            edge_index = [[], []]
-#triclinic            edge_index = self.sf[sf_idx].get_edge_index(cut_off=cut_off)
-#Bgn triclinic ---------------------
-            edge_index, shift = self.sf[sf_idx].get_edge_index_for_triclinic_cell(cut_off=cut_off)
-#End triclinic----------------------
+        with AllegroDatasetWriter(output_dir, append) as train_writer:
+            test_writer = AllegroDatasetWriter(test_output_dir, append) if test_size is not None else None
+            self.write_allegro_data(train_writer, test_writer, cut_off, test_size, exclude_too_small_cell,
+                                    exclude_too_large_force, max_allowable_force, triclinic, num_workers, source,
+                                    duplicate_tolerance if remove_duplicates else None)
+            if test_writer is not None:
+                test_writer.close()
 
-            data["edge_index"] = np.array(edge_index)
-#Bgn triclinic ---------------------
-            data["shift"] = np.array(shift, dtype=np.float32)
-#End triclinic----------------------
-            if test_size is not None:
-                if sf_idx < len(self)*(1.0-test_size):
-                    train_frames.append(data)
-                else:
-                    test_frames.append(data)
-            else:
-                train_frames.append(data)
+    def write_allegro_data(self, train_writer, test_writer, cut_off: float, test_size: float,
+                           exclude_too_small_cell: bool, exclude_too_large_force: bool,
+                           max_allowable_force: float, triclinic: bool, num_workers: int = 1,
+                           source: Union[str, list[str]] = None, duplicate_tolerance: float = None) -> None:
+        """sfs.sfのフレームからallegro用のデータを作り、フレームの順番にtrain_writerかtest_writerに書き込む
+        sf_idx < len(self) * (1.0 - test_size)のフレームがtrain, それ以外がtestになる.
+        writerのmanifestに同じhashが記録されているフレームはedge_indexを計算せずに読み飛ばす.
+        hashの計算, manifestの確認, 重複の判定は、iter_allegro_dataがフレームを読み込むときに1度だけ行う.
+        Parameters
+        ----------
+            train_writer, test_writer : Union[AllegroPickleWriter, AllegroDatasetWriter]
+                書き込み先, test_sizeがNoneのときはtest_writerは使わない
+            num_workers : int
+                2以上ならばプロセス並列でedge_indexを計算する
+            source : Union[str, list[str]]
+                manifestに記録するフレームのsource, listならばフレームごとのsource
+            duplicate_tolerance : float
+                指定したときはsfs内で重複した構造を除く
+        """
+        if source is None or isinstance(source, str):
+            sources = [source or ""] * len(self)
+        else:
+            assert len(source) == len(self), "length of source must be equal to the number of frames"
+            sources = [str(src) for src in source]
+        manifests = [writer.manifest for writer in (train_writer, test_writer) if writer is not None]
+        frame_hashes = {}
+        structure_hashes = set()
+        skipped_frame_nums = {"in_dataset": 0, "duplicate": 0}
 
-        with open(frames_path, "wb") as f:
-            pickle.dump(train_frames, f)
+        def is_new_frame(sf_idx: int, sf) -> bool:
+            # iter_allegro_dataがフレームを読み込んだ直後に呼ばれるので、hashのためにフレームを読み直さない
+            frame_hash = sf.get_frame_hash()
+            in_dataset = any(frame_hash in manifest for manifest in manifests)
+            if duplicate_tolerance is not None:
+                # get_unique_frame_indicesと同じく、dataset内のフレームも含めて最初のフレームだけを残す
+                structure_hash = sf.get_structure_hash(duplicate_tolerance)
+                is_duplicate = structure_hash in structure_hashes
+                structure_hashes.add(structure_hash)
+                if is_duplicate and not in_dataset:
+                    skipped_frame_nums["duplicate"] += 1
+                    return False
+            if in_dataset:
+                skipped_frame_nums["in_dataset"] += 1
+                return False
+            frame_hashes[sf_idx] = frame_hash
+            return True
 
-        if test_size is not None:
-            with open(test_frames_path, "wb") as f:
-                pickle.dump(test_frames, f)
+        for sf_idx, data in iter_allegro_data(self.sf, cut_off, exclude_too_small_cell, exclude_too_large_force,
+                                              max_allowable_force, triclinic, num_workers,
+                                              frame_filter=is_new_frame):
+            frame_hash = frame_hashes.pop(sf_idx)
+            if data is None:
+                continue
+            if test_size is not None and sf_idx >= len(self)*(1.0-test_size):
+                test_writer.append(data, frame_hash, sources[sf_idx])
+            else:
+                train_writer.append(data, frame_hash, sources[sf_idx])
+        if skipped_frame_nums["in_dataset"] > 0:
+            print(f"Skipped {skipped_frame_nums['in_dataset']} frames already in the dataset", flush=True)
+        if skipped_frame_nums["duplicate"] > 0:
+            print(f"Excluded {skipped_frame_nums['duplicate']} duplicate frames", flush=True)
 
-    def export_lammps_dumpposes(self, ofn: str, out_columns=None) -> None:
+    def export_lammps_dumpposes(self, ofn: str, out_columns=None, num_workers: int = 2) -> None:
         """lammps形式のdumpposを出力する
         Parameters
         ----------
             ofn: str
-                lammps形式のdumpposの出力先
+                lammps形式のdumpposの出力先, .gz, .bz2, .xz, .zstで終わるときは圧縮しながら書き込む
             out_columns: List[str]
                 sdat.atomsのどのカラムを出力するのか
                 デフォルトは['type', 'x', 'y', 'z']
+            num_workers: int
+                フレームの文字列を作るthreadの数, 詳細はLammpsDumpWriterを参照
         """
-        if out_columns is None:
-            out_columns = ['type', 'x', 'y', 'z']
-
-        with open(ofn, 'w') as f:
-            f.write('')
-
-        for step_idx in trange(len(self.sf), desc='[exporting lammps dumpposes]'):
-            header = []
-            header.append(f'ITEM: TIMESTEP\n')
-            if self.sf[step_idx].step_num is None:
-                header.append(f'{step_idx}\n')
-            else:
-                header.append(f'{self.sf[step_idx].step_num}\n')
-            header.append(f'ITEM: NUMBER OF ATOMS\n')
-            header.append(f'{self.sf[step_idx].get_total_atoms()}\n')
-            header.append(f'ITEM: BOX BOUNDS xy xz yz pp pp pp\n')
-            header.append(
-                f'0.0000000000000000e+00 {self.sf[step_idx].cell[0]:.16e} 0.0000000000000000e+00\n')
-            header.append(
-                f'0.0000000000000000e+00 {self.sf[step_idx].cell[1]:.16e} 0.0000000000000000e+00\n')
-            header.append(
-                f'0.0000000000000000e+00 {self.sf[step_idx].cell[2]:.16e} 0.0000000000000000e+00\n')
-            header.append(f'ITEM: ATOMS id {" ".join(out_columns)}\n')
-
-            with open(ofn, 'a') as f:
-                f.writelines(header)
-
-            # 1-index
-            self.sf[step_idx].atoms.index += 1
-            self.sf[step_idx].atoms.to_csv(
-                ofn, columns=out_columns, sep=' ', header=None, mode='a')
-            # 0-index
-            self.sf[step_idx].atoms.index -= 1
+        with LammpsDumpWriter(ofn, out_columns, num_workers) as writer:
+            writer.write_frames(self, desc='[exporting lammps dumpposes]')
@@ -3,9 +3,11 @@ import numpy as np
 from typing import Union, Any
 import pathlib
 import re
+import io
 import sys
 import yaml
 import limda.const as C
+from .compression import open_file, strip_compression_suffix
 
 
 class ImportFrame(
@@ -52,7 +54,7 @@ class ImportFrame(
         if self.atom_symbol_to_type is None:
             raise RuntimeError("Import para first")
 
-        with open(file_path, 'r') as ifp:
+        with open_file(file_path, 'r') as ifp:
             lines = ifp.readlines()
 
         for idx, line in enumerate(lines):
@@ -150,11 +152,9 @@ class ImportFrame(
                     carfileのpath
         """
         input_cell = False  # car fileがcellの情報を含んでいるか
-        current_row = 0
-        with open(file_path, 'r') as f:
+        with open_file(file_path, 'r') as f:
             while True:
                 spline = f.readline().split()
-                current_row += 1
                 if len(spline) == 0:
                     continue
                 if spline[0] == "PBC=ON":  # 周期境界がある
@@ -164,13 +164,12 @@ class ImportFrame(
             if input_cell:
                 spline = f.readline().split()
                 self.cell = np.float_(spline[1:4])
-                current_row += 1
-        car_df = pd.read_csv(file_path,
-                             names=['symbol+id', 'x', 'y', 'z',
-                                    'XXXX', '1', 'xx', 'symbol', '0.000'],
-                             usecols=['x', 'y', 'z', "symbol"],
-                             skiprows=current_row,
-                             sep="\s+")
+            # headerを読んだ位置から続けて読むので、圧縮fileでも展開し直さない
+            car_df = pd.read_csv(f,
+                                 names=['symbol+id', 'x', 'y', 'z',
+                                        'XXXX', '1', 'xx', 'symbol', '0.000'],
+                                 usecols=['x', 'y', 'z', "symbol"],
+                                 sep="\s+")
         car_df = car_df.dropna()
         car_df.insert(0, 'type', car_df['symbol'].map(
             self.atom_symbol_to_type))  # type列を作成
@@ -185,10 +184,8 @@ class ImportFrame(
                 file_path: Union[str, Path]
                 dumpposfileのpath
         """
-        current_row = 0
-        with open(file_path, 'r') as ifp:
+        with open_file(file_path, 'r') as ifp:
             while True:
-                current_row += 1
                 spline = ifp.readline().split()
                 if len(spline) == 0:
                     continue
@@ -199,14 +196,13 @@ class ImportFrame(
                         spline = ifp.readline().split()
                         slide_cell_length[dim] = np.float64(spline[0])
                         self.cell[dim] = np.float64(spline[1])
-                    current_row += 3
                     continue
                 if spline[0] == "ITEM:" and spline[1] == 'ATOMS':
                     columns = spline[3:]
                     break
 
-        self.atoms = pd.read_csv(
-            file_path, skiprows=current_row, sep='\s+', names=columns)
+            # headerを読んだ位置から続けて読むので、圧縮fileでも展開し直さない
+            self.atoms = pd.read_csv(ifp, sep='\s+', names=columns)
         if 'type' in self.atoms:
             self.atoms['type'] = self.atoms['type'].astype(int)
         if 'mask' in self.atoms:
@@ -250,7 +246,7 @@ class ImportFrame(
             frameのatoms["type"]は原子の種類をtype listと照らし合した時の整数が入っています。
             速度や力がたとえ入っていたとしても、その情報は抜け落ちます。
         """
-        with open(poscar_path, "r") as f:
+        with open_file(poscar_path, "r") as f:
             f.readline()
             # cell
             scaling_factor = float(f.readline())
@@ -307,7 +303,7 @@ class ImportFrame(
             frameのatoms["type"]は原子の種類をtype listと照らし合した時の整数が入っています。
             速度や力がたとえ入っていたとしても、その情報は抜け落ちます。
         """
-        with open(poscar_path, "r") as f:
+        with open_file(poscar_path, "r") as f:
             f.readline()
             # cell
             scaling_factor = float(f.readline())
@@ -355,7 +351,7 @@ class ImportFrame(
         ifn: Union[str,Path]
             読み込むfile名
         """
-        with open(ifn, 'r') as ifp:
+        with open_file(ifn, 'r') as ifp:
             lines = ifp.readlines()
         total_atom = int(lines[0])
         lattice_value = re.search('Lattice="(.*?)"', lines[1])
@@ -419,7 +415,7 @@ class ImportFrame(
             import_filename : 読み込むxsf file
             atom_type : 元素種  
         """
-        with open(import_filename, "r") as f:
+        with open_file(import_filename, "r") as f:
             lines = f.readlines()
             for i, line in enumerate(lines):
                 if line.strip() == "PRIMVEC":
@@ -429,7 +425,7 @@ class ImportFrame(
                     primcoord_start = i + 2
                     break
         self.atoms = pd.read_csv(
-            import_filename, skiprows=primcoord_start, sep='\s+', usecols=[0, 1, 2, 3], names=["sym", "x", "y", "z"])
+            io.StringIO("".join(lines[primcoord_start:])), sep='\s+', usecols=[0, 1, 2, 3], names=["sym", "x", "y", "z"])
         self.atoms["type"] = np.array([self.atom_symbol_to_type[s] for s in self.atoms["sym"]])
         self.atoms = self.atoms.drop("sym", axis=1)
 
@@ -442,7 +438,7 @@ class ImportFrame(
         ---------
             import_filename : 読み込むcfg file
         """
-        with open(import_filename, "r") as f:
+        with open_file(import_filename, "r") as f:
             lines = f.readlines()
             current_line_id = 0
             for line in lines:
@@ -462,7 +458,7 @@ class ImportFrame(
                     break
         self.cell = np.array([cell_x, cell_y, cell_z])
         self.atoms = pd.read_csv(
-            import_filename, skiprows=current_line_id, sep='\s+', names=["x", "y", "z", "grain_id"])
+            io.StringIO("".join(lines[current_line_id:])), sep='\s+', names=["x", "y", "z", "grain_id"])
         self.atoms[["x", "y", "z"]] *= self.cell
         self.atoms["type"] = np.array(
             [atom_type for _ in range(total_atom_num)])
@@ -470,13 +466,14 @@ class ImportFrame(
     def import_file(self, import_filename: Union[str, pathlib.Path]):
         """
         file名から、適切な形式fileを読み込みます.
+        圧縮file(.gz, .bz2, .xz, .zst)は拡張子を除いたfile名で形式を判断し、展開しながら読み込みます.
         Parameters
         ----------
         import_filename: str 
             読み込むファイル名
         """
         import_filename = pathlib.Path(import_filename)
-        import_file_basename = import_filename.name
+        import_file_basename = strip_compression_suffix(import_filename.name)
 
         if "input" in import_file_basename:
             self.import_input(import_filename)
@@ -9,8 +9,32 @@ from tqdm import tqdm, trange
 from . import const as C
 from .import_frame import ImportFrame
 from .SimulationFrame import SimulationFrame
+from .lazy_frames import LazyFrames, load_dumppos_frame, load_xsf_frame, load_outcar_frame
+from .dump_reader import LammpsDumpReader
+from .trajectory import Trajectory, make_frame_sharing_para
+from .outcar import OutcarParser, get_outcar_identity, IDENTITY_SIZE, index_outcar
+from .vasprun import iter_vasprun_frames
+from .xdatcar import iter_xdatcar_frames
+from .binary_trajectory import BinaryTrajectory, make_frames, make_trajectory
+from .npy_trajectory import read_npy_trajectory
+from .allegro_dataset import AllegroDataset
+from .compression import open_file, find_file, get_compression, strip_compression_suffix
 import os
 import re
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+
+def read_frame_arrays(loader, file_path: str, atom_symbol_to_type: dict[str, int]) -> tuple:
+    """loaderで1つのfileを読み込み、(cell, atomsのindex, atomsのcolumnごとの配列)を返す
+    ProcessPoolExecutorのworkerで使う. DataFrameをpickleするより転送量が少ない.
+    """
+    sf = make_frame_sharing_para(SimpleNamespace(atom_symbol_to_type=atom_symbol_to_type,
+                                                 atom_type_to_symbol=None,
+                                                 atom_type_to_mass=None,
+                                                 limda_default={}))
+    loader(sf, file_path)
+    return sf.cell, sf.atoms.index.values, {col: sf.atoms[col].values for col in sf.atoms.columns}
 
 
 class ImportFrames(
@@ -33,15 +57,234 @@ class ImportFrames(
         else:
             self.limda_default = {}
 
-    def import_vasp(self, calc_directory: Union[str, pathlib.Path], NELM: int = None):
+    def extend_lazy_frames(self, entries: list[tuple], cache_size: int = 16):
+        """self.sfの後ろにLazyFramesのentryを追加する.
+        self.sfがLazyFramesでないときは、すでに読み込まれているフレームを保持したままLazyFramesにする.
+        Parameters
+        ----------
+            entries: list[tuple[Callable, tuple, int]]
+                (loader, loaderの引数, step_num)のlist
+            cache_size: int
+                読み込んだフレームを何個まで保持するか
+        """
+        if not isinstance(self.sf, LazyFrames):
+            loaded_entries = [(None, (sf,), sf.step_num) for sf in self.sf]
+            self.sf = LazyFrames(loaded_entries, self, cache_size)
+        self.sf.cache_size = cache_size
+        self.sf.extend(entries)
+
+    def append_frame(self, sf: SimulationFrame) -> None:
+        """self.sfの後ろにフレームを1つ追加する
+        self.sfがLazyFramesのときは、読み込み済みのentryとして追加する(cacheから外れても保持される).
+        pack_sfs()でTrajectoryにしたself.sfには追加できないので、unpack_sfs()してから読み込む
+        """
+        assert not isinstance(self.sf, Trajectory), "sfs.sf is packed, run unpack_sfs() before importing frames"
+        if isinstance(self.sf, LazyFrames):
+            self.sf.extend([(None, (sf,), sf.step_num)])
+        else:
+            self.sf.append(sf)
+
+    def import_files(self, loader, file_paths: list[str], step_nums: list[int],
+                     num_workers: int = 1, desc: str = None):
+        """loaderでfileを1つずつ読み込み、self.sfをstep_nums順のSimulationFrameのlistにする
+        Parameters
+        ----------
+            loader: Callable
+                load_dumppos_frameなど, loader(sf, file_path)でsfに読み込む関数
+            file_paths: list[str]
+                読み込むfileのpath
+            step_nums: list[int]
+                file_pathsのそれぞれのstep数
+            num_workers: int
+                2以上ならばプロセス並列でfileを読み込む
+            desc: str
+                tqdmに表示する文字列
+        """
+        self.sf = [make_frame_sharing_para(self) for _ in range(len(step_nums))]
+        if num_workers <= 1:
+            for step_idx, file_path in enumerate(tqdm(file_paths, desc=desc)):
+                self.sf[step_idx].step_num = step_nums[step_idx]
+                loader(self.sf[step_idx], file_path)
+            return
+
+        # mapは入力の順番で結果を返すので、step_numsの順番は保たれる
+        chunksize = max(1, len(file_paths) // (num_workers * 8))
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            results = executor.map(read_frame_arrays,
+                                   [loader] * len(file_paths),
+                                   file_paths,
+                                   [self.atom_symbol_to_type] * len(file_paths),
+                                   chunksize=chunksize)
+            for step_idx, (cell, index, columns) in enumerate(tqdm(results, total=len(file_paths), desc=desc)):
+                self.sf[step_idx].step_num = step_nums[step_idx]
+                self.sf[step_idx].cell = cell
+                self.sf[step_idx].atoms = pd.DataFrame(columns, index=index)
+
+    def append_outcar_frames(self, outcar_path: Union[str, pathlib.Path], atom_types: pd.Series,
+                             NELM: int, triclinic: bool = False, parser: OutcarParser = None) -> int:
+        """OUTCARを1度だけ読み、フレームをself.sfの後ろに追加する
+        fileをまとめて読み込まずOutcarParserで1ブロックずつ処理するので、大きなOUTCARでもメモリを使わない.
+        Parameters
+        ----------
+            outcar_path: Union[str, pathlib.Path]
+                OUTCARのpath
+            atom_types: pd.Series
+                POSCARから読み込んだ原子のtype
+            NELM: int
+                最大のIteration回数, 最大のiteration回数に達したframeはimportしない
+            triclinic: bool
+                Trueならばcellをshape:(3, 3)の格子ベクトルとして読み込む
+            parser: OutcarParser
+                前回の続きから読むときに渡す, Noneならば先頭から読む
+        Returns
+        -------
+            new_frame_num: int
+                追加したフレームの数
+        """
+        if parser is None:
+            parser = OutcarParser(len(atom_types), NELM, triclinic)
+        new_frame_num = 0
+        with open_file(outcar_path, "rb") as f:
+            for cell, potential_energy, virial_tensor, forces in parser.parse(f):
+                sf = make_frame_sharing_para(self)
+                sf.cell = cell
+                sf.atoms = pd.DataFrame({'type': atom_types,
+                                         'x': forces[:, 0], 'y': forces[:, 1], 'z': forces[:, 2],
+                                         'fx': forces[:, 3], 'fy': forces[:, 4], 'fz': forces[:, 5]})
+                sf.potential_energy = potential_energy
+                sf.virial_tensor = virial_tensor
+                self.append_frame(sf)
+                new_frame_num += 1
+        return new_frame_num
+
+    def import_xdatcar(self, xdatcar_path: Union[str, pathlib.Path], skip_num: int = None,
+                       start: int = 0, stop: int = None, triclinic: bool = False):
+        """XDATCARから原子の座標とcellを読み込み、self.sfの後ろに追加する
+        力やエネルギーは入っていないが、OUTCARより小さく速く読める.
+        cellが変わるXDATCAR(NPT, ISIF=3)にも対応している.
+        Parameters
+        ----------
+            xdatcar_path: Union[str, pathlib.Path]
+                XDATCARのpath
+            skip_num: int
+                いくつおきに構造を読み込むのか, 読み飛ばす構造はparseしない
+            start: int
+                最初に読み込む構造のindex(0-indexed)
+            stop: int
+                このindexの構造より前まで読み込む, Noneならば最後まで
+            triclinic: bool
+                Trueならばcellをshape:(3, 3)の格子ベクトルとして読み込む
+        Note
+        ----
+            sf.step_numにはXDATCARのconfiguration番号が入る
+            triclinic=Falseのとき、cellはimport_vaspと同じく格子ベクトルの対角成分(float32)
+        """
+        step = 1 if skip_num is None else skip_num
+        atom_types = None
+        for configuration_num, lattice, atom_symbols, pos in tqdm(
+                iter_xdatcar_frames(xdatcar_path, start, stop, step), desc='[importing xdatcar]'):
+            if atom_types is None:
+                atom_types = pd.Series([self.atom_symbol_to_type[atom_symbol] for atom_symbol in atom_symbols])
+            sf = make_frame_sharing_para(self)
+            sf.step_num = configuration_num
+            if triclinic:
+                sf.cell = lattice
+            else:
+                sf.cell = np.empty(3, dtype=np.float32)
+                for dim in range(3):
+                    sf.cell[dim] = lattice[dim][dim]
+            sf.atoms = pd.DataFrame({'type': atom_types, 'x': pos[:, 0], 'y': pos[:, 1], 'z': pos[:, 2]})
+            self.append_frame(sf)
+
+    def import_vasp_incremental(self, calc_directory: Union[str, pathlib.Path], NELM: int = None,
+                                on_restart: str = "keep") -> int:
+        """計算中のvaspのOUTCARから、前回の呼び出し以降に追記されたフレームだけを読み込み、self.sfの後ろに追加する
+        OUTCARごとに読み終わったbyte offsetとparserの状態(cell, energy, virial, iteration)をself.outcar_parsersに保持し、
+        次回はその位置から読む. 書き込み途中のブロックは読まずに、次回の呼び出しで読む.
+        OUTCARのinode番号と先頭のhashも保持し、vaspの再実行などでOUTCARが書き直されたときは先頭から読み直す.
+        POSCAR, OUTCARがなければ圧縮されたもの(OUTCAR.gzなど)を読む. 圧縮されたOUTCARは書き込み中でないものとして、
+        展開した先頭のhashのみで書き直されたかを判断するので、計算が終わったOUTCARを圧縮しても読み直さない.
+        Parameters
+        ----------
+            calc_directory: str
+                vaspで計算しているディレクトリ
+            NELM: int
+                最大のIteration回数, 最大のiteration回数に達したframeはimportしない
+            on_restart: str
+                OUTCARが書き直されていたときに、前の計算から追加したフレームをどうするか
+                "keep"ならばself.sfに残し、その後ろに新しいOUTCARのフレームを追加する
+                "replace"ならばself.sfから取り除いてから、新しいOUTCARのフレームを追加する
+        Returns
+        -------
+            new_frame_num: int
+                追加したフレームの数
+        Example
+        -------
+            while calculation is running:
+                sfs.import_vasp_incremental("vasp_calc")
+                time.sleep(60)
+        """
+        assert on_restart in ("keep", "replace"), "on_restart must be 'keep' or 'replace'"
+        if NELM is None:
+            if "NELM" in self.limda_default:
+                NELM = self.limda_default["NELM"]
+            else:
+                NELM = 1e6
+        assert isinstance(self.sf, list), "import_vasp_incremental supports only list sfs.sf"
+        calc_directory = pathlib.Path(calc_directory)
+        # OUTCARが後から圧縮されても同じkeyになるように、圧縮していないpathをkeyにする
+        parser_key = str((calc_directory / "OUTCAR").resolve())
+        outcar_path = find_file(calc_directory / "OUTCAR")
+        if not outcar_path.exists():
+            return 0
+        is_compressed = get_compression(outcar_path) is not None
+
+        if parser_key in self.outcar_parsers:
+            parser, atom_types, (inode, prefix_size, prefix_hash), frames = self.outcar_parsers[parser_key]
+            current_inode, current_prefix_hash = get_outcar_identity(outcar_path, prefix_size)
+            # 圧縮fileのsizeとinodeは展開後のoffsetや元のOUTCARと比べられないので、先頭のhashのみを比べる
+            if current_prefix_hash != prefix_hash or \
+                    (not is_compressed and (os.path.getsize(outcar_path) < parser.offset or current_inode != inode)):
+                print(f'warning : {outcar_path} has been rewritten since the last read')
+                print(f'warning : {outcar_path} is read again from the beginning')
+                if on_restart == "replace":
+                    frame_ids = {id(sf) for sf in frames}
+                    self.sf = [sf for sf in self.sf if id(sf) not in frame_ids]
+                    print(f'warning : {len(frames)} frames of the previous {outcar_path} have been removed')
+                del self.outcar_parsers[parser_key]
+        if parser_key not in self.outcar_parsers:
+            first_sf = SimulationFrame()
+            first_sf.atom_symbol_to_type = self.atom_symbol_to_type.copy()
+            first_sf.import_vasp_poscar(find_file(calc_directory / "POSCAR"))
+            atom_types = first_sf.atoms["type"]
+            parser = OutcarParser(len(atom_types), NELM)
+            frames = []
+
+        # 読む前の先頭のhashを記録する. 次回はこれと同じ長さの先頭を比べる
+        prefix_size = IDENTITY_SIZE if is_compressed else min(IDENTITY_SIZE, os.path.getsize(outcar_path))
+        inode, prefix_hash = get_outcar_identity(outcar_path, prefix_size)
+        parser.NELM = NELM
+        new_frame_num = self.append_outcar_frames(outcar_path, atom_types, NELM, parser=parser)
+        frames.extend(self.sf[len(self.sf) - new_frame_num:])
+        self.outcar_parsers[parser_key] = (parser, atom_types, (inode, prefix_size, prefix_hash), frames)
+        return new_frame_num
+
+    def import_vasp(self, calc_directory: Union[str, pathlib.Path], NELM: int = None,
+                    lazy: bool = False, cache_size: int = 16):
         """vaspで計算した第一原理MDファイルから、
         原子の座標, cellの大きさ, 原子にかかる力, ポテンシャルエネルギーを読み込む
         Parameters
         ----------
             calc_directory: str
                 vaspで計算したディレクトリ
+                POSCAR, OUTCARがなければ圧縮されたもの(OUTCAR.gz, OUTCAR.zstなど)を展開しながら読み込む
             NELM: int
                 最大のIteration回数, 最大のiteration回数に達したframeはimportしない
+            lazy: bool
+                Trueならばimport時にはOUTCAR内の各フレームの力のブロックのbyte offsetとcell, energy, virialのみを記録し、
+                sfs[step_idx]にアクセスしたときにそのフレームを読み込む
+            cache_size: int
+                lazy=Trueのとき、読み込んだフレームを何個まで保持するか
         Note
         ----
             読み込んだデータ
@@ -59,70 +302,60 @@ class ImportFrames(
         calc_directory = pathlib.Path(calc_directory)
         first_sf = SimulationFrame()
         first_sf.atom_symbol_to_type = self.atom_symbol_to_type.copy()
-        first_sf.import_vasp_poscar(f'{calc_directory}/POSCAR')
+        first_sf.import_vasp_poscar(find_file(calc_directory / "POSCAR"))
         atom_types = first_sf.atoms["type"]
+        outcar_path = find_file(calc_directory / "OUTCAR")
+
+        if lazy:
+            if get_compression(outcar_path) is not None:
+                print(f'warning : {outcar_path} is decompressed from the beginning for each frame')
+                print('warning : lazy=False is faster for compressed OUTCAR')
+            outcar_path = str(outcar_path)
+            atom_types = atom_types.values
+            entries = [(load_outcar_frame, (outcar_path, atom_types) + frame_index, None)
+                       for frame_index in index_outcar(outcar_path, len(atom_types), NELM)]
+            self.extend_lazy_frames(entries, cache_size)
+            return
 
-        with open(calc_directory / "OUTCAR", "r") as f:
-            lines = f.readlines()
-            splines = list(map(lambda l: l.split(), lines))
-
-        for line_idx, spline in enumerate(splines):
-            if len(spline) <= 1:
-                continue
-
-            if len(spline) == 3 and spline[0] == "POSITION" and spline[1] == "TOTAL-FORCE":
-                if iteration >= NELM:
-                    continue
-                sf = SimulationFrame()
-                sf.atom_symbol_to_type = self.atom_symbol_to_type
-                sf.atom_type_to_mass = self.atom_type_to_mass
-                sf.atom_type_to_symbol = self.atom_type_to_symbol
+        self.append_outcar_frames(outcar_path, atom_types, NELM)
 
-                sf.cell = np.empty(3, dtype=np.float32)
-                for dim in range(3):
-                    sf.cell[dim] = float(splines[cell_line_idx+dim+1][dim])
-
-                atoms_dict_keys = ['type', 'x', 'y', 'z', 'fx', 'fy', 'fz']
-                atoms_dict = {key: val for key, val in zip(
-                    atoms_dict_keys, [[] for i in range(7)])}
-                atoms_dict['type'] = atom_types
-                for atom_idx in range(len(atom_types)):
-                    for key_idx in range(len(atoms_dict_keys)-1):
-                        atoms_dict[atoms_dict_keys[key_idx+1]
-                                   ].append(float(splines[line_idx+2+atom_idx][key_idx]))
-
-                sf.atoms = pd.DataFrame(atoms_dict)
-                # potential_energy
-                sf.potential_energy = float(splines[potential_energy_idx][4])
-                # virial tensor
-                sf.virial_tensor = np.empty((3, 3), dtype=np.float32)
-                for i in range(3):
-                    sf.virial_tensor[i][i] = float(
-                        splines[virial_tensor_idx][i+1])
-                for i in range(3):
-                    sf.virial_tensor[i][(
-                        i+1) % 3] = float(splines[virial_tensor_idx][i+4])
-                    sf.virial_tensor[(
-                        i+1) % 3][i] = float(splines[virial_tensor_idx][i+4])
-
-                self.sf.append(sf)
-
-            if len(splines[line_idx]) == 6 and splines[line_idx][0] == "direct" \
-                    and splines[line_idx][1] == "lattice":
-                cell_line_idx = line_idx
-
-            if len(splines[line_idx]) >= 4 and \
-                    splines[line_idx][0] == "energy" and \
-                    splines[line_idx][1] == "without" and \
-                    splines[line_idx][2] == "entropy":
-                potential_energy_idx = line_idx
-
-            if len(splines[line_idx]) == 7 and splines[line_idx][0] == "Total":
-                virial_tensor_idx = line_idx
-
-            if len(splines[line_idx]) == 5 and splines[line_idx][0] == "---------------------------------------" \
-                    and splines[line_idx][1] == "Iteration":
-                iteration = int(splines[line_idx][3][:-1])
+    def import_vasprun(self, vasprun_path: Union[str, pathlib.Path], NELM: int = None, triclinic: bool = False):
+        """vasprun.xmlから、原子の座標, cellの大きさ, 原子にかかる力, ポテンシャルエネルギー, virialテンソルを読み込み、
+        self.sfの後ろに追加する.
+        XMLのtreeを作らずにイオンステップを1つずつ読み、eigenvalues, dosなどはbyte列の段階で読み飛ばす.
+        Parameters
+        ----------
+            vasprun_path: Union[str, pathlib.Path]
+                vasprun.xmlのpath
+            NELM: int
+                最大のIteration回数, <scstep>の数がNELMに達したframeはimportしない
+            triclinic: bool
+                Trueならばcellをshape:(3, 3)の格子ベクトルとして読み込む
+        Note
+        ----
+            import_vaspと同じ値が入るようにしている
+                potential_energy : energy without entropy (e_wo_entrp)
+                virial_tensor : stress(kB) * 体積 / 1602.1766208 (OUTCARのFORCE on cellのTotalと同じ)
+                cell : triclinic=Falseのときは格子ベクトルの対角成分(float32)
+        """
+        if NELM is None:
+            if "NELM" in self.limda_default:
+                NELM = self.limda_default["NELM"]
+            else:
+                NELM = 1e6
+        atom_types = None
+        for frame in tqdm(iter_vasprun_frames(vasprun_path, NELM, triclinic), desc='[importing vasprun]'):
+            if atom_types is None:
+                atom_types = pd.Series([self.atom_symbol_to_type[atom_symbol]
+                                        for atom_symbol in frame["atom_symbols"]])
+            sf = make_frame_sharing_para(self)
+            sf.cell = frame["cell"]
+            sf.atoms = pd.DataFrame({'type': atom_types,
+                                     'x': frame["pos"][:, 0], 'y': frame["pos"][:, 1], 'z': frame["pos"][:, 2],
+                                     'fx': frame["force"][:, 0], 'fy': frame["force"][:, 1], 'fz': frame["force"][:, 2]})
+            sf.potential_energy = frame["potential_energy"]
+            sf.virial_tensor = frame["virial_tensor"]
+            self.append_frame(sf)
 
     def import_vasp_for_triclinic_cell(self, calc_directory: Union[str, pathlib.Path], NELM: int = None):
         """vaspで計算した第一原理MDファイルから、
@@ -150,85 +383,20 @@ class ImportFrames(
         calc_directory = pathlib.Path(calc_directory)
         first_sf = SimulationFrame()
         first_sf.atom_symbol_to_type = self.atom_symbol_to_type.copy()
-        first_sf.import_vasp_poscar_for_triclinic_cell(f'{calc_directory}/POSCAR')
+        first_sf.import_vasp_poscar_for_triclinic_cell(find_file(calc_directory / "POSCAR"))
         atom_types = first_sf.atoms["type"]
 
-        with open(calc_directory / "OUTCAR", "r") as f:
-            lines = f.readlines()
-            splines = list(map(lambda l: l.split(), lines))
-
-        for line_idx, spline in enumerate(splines):
-            if len(spline) <= 1:
-                continue
+        self.append_outcar_frames(find_file(calc_directory / "OUTCAR"), atom_types, NELM, triclinic=True)
 
-            if len(spline) == 3 and spline[0] == "POSITION" and spline[1] == "TOTAL-FORCE":
-                if iteration >= NELM:
-                    continue
-                sf = SimulationFrame()
-                sf.atom_symbol_to_type = self.atom_symbol_to_type
-                sf.atom_type_to_mass = self.atom_type_to_mass
-                sf.atom_type_to_symbol = self.atom_type_to_symbol
-
-#triclinic                sf.cell = np.empty(3, dtype=np.float32)
-#triclinic                for dim in range(3):
-#triclinic                    sf.cell[dim] = float(splines[cell_line_idx+dim+1][dim])
-
-#Bgn triclinic ---------------------
-                sf.cell = []
-                for dim in range(3):
-                    sf.cell.append(list(map(float, splines[cell_line_idx+dim+1][:3])))
-                sf.cell = np.array(sf.cell)
-#End triclinic----------------------
-
-                atoms_dict_keys = ['type', 'x', 'y', 'z', 'fx', 'fy', 'fz']
-                atoms_dict = {key: val for key, val in zip(
-                    atoms_dict_keys, [[] for i in range(7)])}
-                atoms_dict['type'] = atom_types
-                for atom_idx in range(len(atom_types)):
-                    for key_idx in range(len(atoms_dict_keys)-1):
-                        atoms_dict[atoms_dict_keys[key_idx+1]
-                                   ].append(float(splines[line_idx+2+atom_idx][key_idx]))
-
-                sf.atoms = pd.DataFrame(atoms_dict)
-                # potential_energy
-                sf.potential_energy = float(splines[potential_energy_idx][4])
-                # virial tensor
-                sf.virial_tensor = np.empty((3, 3), dtype=np.float32)
-                for i in range(3):
-                    sf.virial_tensor[i][i] = float(
-                        splines[virial_tensor_idx][i+1])
-                for i in range(3):
-                    sf.virial_tensor[i][(
-                        i+1) % 3] = float(splines[virial_tensor_idx][i+4])
-                    sf.virial_tensor[(
-                        i+1) % 3][i] = float(splines[virial_tensor_idx][i+4])
-
-                self.sf.append(sf)
-
-            if len(splines[line_idx]) == 6 and splines[line_idx][0] == "direct" \
-                    and splines[line_idx][1] == "lattice":
-                cell_line_idx = line_idx
-
-            if len(splines[line_idx]) >= 4 and \
-                    splines[line_idx][0] == "energy" and \
-                    splines[line_idx][1] == "without" and \
-                    splines[line_idx][2] == "entropy":
-                potential_energy_idx = line_idx
-
-            if len(splines[line_idx]) == 7 and splines[line_idx][0] == "Total":
-                virial_tensor_idx = line_idx
-
-            if len(splines[line_idx]) == 5 and splines[line_idx][0] == "---------------------------------------" \
-                    and splines[line_idx][1] == "Iteration":
-                iteration = int(splines[line_idx][3][:-1])
-
-    def import_dumpposes(self, dir_name: Union[str, pathlib.Path] = None, step_nums: list[int] = None, skip_num: int = None):
+    def import_dumpposes(self, dir_name: Union[str, pathlib.Path] = None, step_nums: list[int] = None, skip_num: int = None,
+                         lazy: bool = False, cache_size: int = 16, num_workers: int = 1):
         """Laichで計算したdumpposを複数読み込む
         Parameters
         ----------
             dir_name: str
                 dumpposが入っているフォルダのパス
                 指定しないときは、current directryになる
+                圧縮されたdumppos(dump.pos.1000.gz, dump.pos.1000.zstなど)は展開しながら読み込む
             step_nums: listやイテレータ
                 指定したdumpposを読み込む, 
                 step_nums=range(0, 301, 100)とすると、
@@ -236,6 +404,13 @@ class ImportFrames(
             skip_num: int
                 いくつおきにdumpposを読み込むのか
                 skip_num = 10とすると、10個飛ばしでdumpposを読み込む
+            lazy: bool
+                Trueならばimport時にはfileのpathのみを記録し、
+                sfs[step_idx]にアクセスしたときにそのdumpposを読み込む
+            cache_size: int
+                lazy=Trueのとき、読み込んだフレームを何個まで保持するか
+            num_workers: int
+                2以上ならばnum_workers個のプロセスでdumpposを並列に読み込む
         """
         assert self.atom_symbol_to_type is not None, "import atom symbol first"
         assert self.atom_type_to_mass is not None, "import atom symbol first"
@@ -244,25 +419,105 @@ class ImportFrames(
         if dir_name is None:
             dir_name = os.getcwd()
 
+        # 圧縮されたdumppos(dump.pos.1000.gzなど)もstep数で探す
         file_names_in_current_dir = os.listdir(dir_name)
+        file_paths = {}
+        for file_name in file_names_in_current_dir:
+            dumppos_name = strip_compression_suffix(file_name)
+            if len(dumppos_name) >= 9 and dumppos_name[:9] == 'dump.pos.':
+                file_paths[int(dumppos_name[9:])] = f'{dir_name}/{file_name}'
         if step_nums is None:
-            step_nums = []
-            for file_name in file_names_in_current_dir:
-                if len(file_name) >= 9 and file_name[:9] == 'dump.pos.':
-                    step_nums.append(int(file_name[9:]))
+            step_nums = list(file_paths)
 
         step_nums.sort()
         if skip_num is not None:
             step_nums = step_nums[::skip_num]
+        file_paths = [file_paths.get(step_num, f'{dir_name}/dump.pos.{step_num}') for step_num in step_nums]
 
-        self.sf = [SimulationFrame() for _ in range(len(step_nums))]
+        if lazy:
+            entries = [(load_dumppos_frame, (file_path,), step_num)
+                       for file_path, step_num in zip(file_paths, step_nums)]
+            self.sf = LazyFrames(entries, self, cache_size)
+            return
+
+        self.import_files(load_dumppos_frame, file_paths,
+                          step_nums, num_workers, desc='[importing dumpposes]')
 
-        for step_idx, step_num in enumerate(tqdm(step_nums, desc='[importing dumpposes]')):
-            self.sf[step_idx].step_num = step_num
-            self.sf[step_idx].atom_symbol_to_type = self.atom_symbol_to_type
-            self.sf[step_idx].atom_type_to_mass = self.atom_type_to_mass
-            self.sf[step_idx].atom_type_to_symbol = self.atom_type_to_symbol
-            self.sf[step_idx].import_dumppos(f'{dir_name}/dump.pos.{step_num}')
+    def import_lammps_dump(self, file_path: Union[str, pathlib.Path], skip_num: int = None,
+                           frame_indices: list[int] = None, lazy: bool = False, cache_size: int = 16,
+                           num_workers: int = 1, use_index_file: bool = True):
+        """複数フレームが連結されたdump file(export_lammps_dumpposesで出力したmd.posなど)を読み込む
+        最初に一度だけfileを走査してフレームのbyte offsetを記録し、sidecar file(md.pos.idx.npz)に保存する.
+        2回目以降はsidecar fileを使うので走査しない.
+        Parameters
+        ----------
+            file_path: Union[str, pathlib.Path]
+                dump fileのpath
+            skip_num: int
+                いくつおきにフレームを読み込むのか
+            frame_indices: list[int]
+                読み込むフレームのindex(0-indexed), skip_numと同時には指定できない
+            lazy: bool
+                Trueならばimport時にはbyte offsetのみを記録し、
+                sfs[step_idx]にアクセスしたときにそのフレームを読み込む
+            cache_size: int
+                lazy=Trueのとき、読み込んだフレームを何個まで保持するか
+            num_workers: int
+                2以上ならばプロセス並列でフレームを読み込む
+            use_index_file: bool
+                Falseならばsidecar fileを使わない
+        Note
+        ----
+            フレームを1つずつ処理したいときは、LammpsDumpReader(file_path, sfs).iter_frames()を使う
+        """
+        assert self.atom_symbol_to_type is not None, "import atom symbol first"
+        assert skip_num is None or frame_indices is None, "skip_num and frame_indices cannot be used together"
+        reader = LammpsDumpReader(file_path, self, use_index_file)
+        if frame_indices is None:
+            frame_indices = range(0, len(reader), 1 if skip_num is None else skip_num)
+
+        if lazy:
+            self.sf = LazyFrames(reader.get_lazy_entries(frame_indices), self, cache_size)
+            return
+        self.sf = reader.read_frames(frame_indices, num_workers)
+
+    def import_binary_trajectory(self, file_path: Union[str, pathlib.Path], skip_num: int = None,
+                                 frame_indices: list[int] = None, pack: bool = False):
+        """export_binary_trajectoryで出力したbinary trajectory file(.ltrj)を読み込む
+        Parameters
+        ----------
+            file_path: Union[str, pathlib.Path]
+                binary trajectory fileのpath
+            skip_num: int
+                いくつおきにフレームを読み込むのか
+            frame_indices: list[int]
+                読み込むフレームのindex(0-indexed), skip_numと同時には指定できない
+                必要なchunkだけを読むので、一部のフレームだけを速く読み込める
+            pack: bool
+                Trueならばsfs.sfをDataFrameを作らずにTrajectory(pack_sfs()後と同じ)にする
+        """
+        assert skip_num is None or frame_indices is None, "skip_num and frame_indices cannot be used together"
+        binary_trajectory = BinaryTrajectory(file_path)
+        if frame_indices is None:
+            frame_indices = range(0, len(binary_trajectory), 1 if skip_num is None else skip_num)
+        arrays = binary_trajectory.read_arrays(frame_indices)
+        if pack:
+            self.sf = make_trajectory(arrays, binary_trajectory.meta, self)
+        else:
+            self.sf = make_frames(arrays, binary_trajectory.meta, self)
+
+    def import_npy_trajectory(self, input_dir: Union[str, pathlib.Path], mmap_mode: str = "r"):
+        """export_npy_trajectoryで出力したdirectoryを読み込み、sfs.sfをTrajectoryにする
+        mmap_mode="r"ならば配列はnp.memmapとして開かれ、アクセスした部分だけがOSのpage cache経由で読まれるので、
+        メモリに乗らない大きさのtrajectoryでもAnalyzeFramesのメソッドをそのまま使える.
+        Parameters
+        ----------
+            input_dir: Union[str, pathlib.Path]
+                .npy fileとmeta.jsonが入ったdirectory
+            mmap_mode: str
+                np.loadのmmap_mode, Noneならば全ての配列をメモリに読み込む
+        """
+        self.sf = read_npy_trajectory(input_dir, self, mmap_mode)
 
     def import_para_from_list(self, atom_symbol_list: list[str]):
         """原子のリストからatom_symbol_to_type, atom_type_to_symbol, atom_type_to_massを作成する.
@@ -337,17 +592,56 @@ class ImportFrames(
             sf.atoms[["x", "y", "z"]] = pd.DataFrame(frame["pos"])
             sf.atoms[["fx", "fy", "fz"]] = pd.DataFrame(frame["force"])
             sf.virial_tensor = frame["virial"]
-            self.sf.append(sf)
+            self.append_frame(sf)
 
         return frames
 
-    def import_xsfs(self, dir_name: Union[str, pathlib.Path] = None, step_nums: list[int] = None, skip_num: int = None):
+    def import_allegro_dataset(self, dataset_dir: Union[str, pathlib.Path], mmap_mode: str = "c") -> AllegroDataset:
+        """
+        export_allegro_datasetで出力したdirectoryを読み込み、sfsに入れます。
+        import_allegro_framesと同じく、cut_off, edge_indexの情報はsfs.sfには入らないため、
+        保持するためには返り値であるAllegroDatasetを受け取る必要があります.
+        学習などでフレームのデータだけが必要な場合は、sfsに入れずにAllegroDataset(dataset_dir)を直接使う方が速い.
+
+        Parameters
+        ----------
+            dataset_dir : Union[str, pathlib.Path]
+                importするdirectoryのパス
+            mmap_mode : str
+                np.memmapのmode
+        Return val
+        ----------
+            dataset : AllegroDataset
+                mmapで開いたデータセット
+        """
+        dataset = AllegroDataset(dataset_dir, mmap_mode)
+        for frame in dataset:
+            sf = SimulationFrame()
+            sf.cell = np.array(frame["cell"])
+            sf.potential_energy = np.array(frame["potential_energy"])
+            sf.atoms = pd.DataFrame(frame["atom_types"] + 1, columns=["type"])
+            sf.atoms[["x", "y", "z"]] = pd.DataFrame(np.array(frame["pos"]))
+            sf.atoms[["fx", "fy", "fz"]] = pd.DataFrame(np.array(frame["force"]))
+            sf.virial_tensor = np.array(frame["virial"])
+            self.append_frame(sf)
+
+        return dataset
+
+    def import_xsfs(self, dir_name: Union[str, pathlib.Path] = None, step_nums: list[int] = None, skip_num: int = None,
+                    lazy: bool = False, cache_size: int = 16, num_workers: int = 1):
         """xsfを複数読み込む
         Parameters
         ----------
             dir_name: str
                 xsfが入っているフォルダのパス
                 指定しないときは、current directryになる
+            lazy: bool
+                Trueならばimport時にはfileのpathのみを記録し、
+                sfs[step_idx]にアクセスしたときにそのxsfを読み込む
+            cache_size: int
+                lazy=Trueのとき、読み込んだフレームを何個まで保持するか
+            num_workers: int
+                2以上ならばnum_workers個のプロセスでxsfを並列に読み込む
         """
         assert self.atom_symbol_to_type is not None, "import atom symbol first"
         assert self.atom_type_to_mass is not None, "import atom symbol first"
@@ -368,11 +662,12 @@ class ImportFrames(
         if skip_num is not None:
             step_nums = step_nums[::skip_num]
 
-        self.sf = [SimulationFrame() for _ in range(len(step_nums))]
+        if lazy:
+            entries = [(load_xsf_frame, (f'{dir_name}/{step_num}.xsf',), step_num)
+                       for step_num in step_nums]
+            self.sf = LazyFrames(entries, self, cache_size)
+            return
 
-        for step_idx, step_num in enumerate(tqdm(step_nums, desc='[importing xsfs]')):
-            self.sf[step_idx].step_num = step_num
-            self.sf[step_idx].atom_symbol_to_type = self.atom_symbol_to_type
-            self.sf[step_idx].atom_type_to_mass = self.atom_type_to_mass
-            self.sf[step_idx].atom_type_to_symbol = self.atom_type_to_symbol
-            self.sf[step_idx].import_xsf(f'{dir_name}/{step_num}.xsf')
\ No newline at end of file
+        self.import_files(load_xsf_frame,
+                          [f'{dir_name}/{step_num}.xsf' for step_num in step_nums],
+                          step_nums, num_workers, desc='[importing xsfs]')
\ No newline at end of file
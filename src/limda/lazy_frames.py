@@ -0,0 +1,153 @@
+import pandas as pd
+import numpy as np
+from collections import OrderedDict
+from typing import Union, Any, Callable
+from .SimulationFrame import SimulationFrame
+from .trajectory import make_frame_sharing_para
+from .outcar import load_outcar_forces
+
+
+def load_dumppos_frame(sf: SimulationFrame, file_path: str) -> None:
+    """dumppos fileを読み込むLazyFramesのloader
+    """
+    sf.import_dumppos(file_path)
+
+
+def load_xsf_frame(sf: SimulationFrame, file_path: str) -> None:
+    """xsf fileを読み込むLazyFramesのloader
+    """
+    sf.import_xsf(file_path)
+
+
+def load_outcar_frame(sf: SimulationFrame, outcar_path: str, atom_types: np.ndarray, block_offset: int,
+                      cell: np.ndarray, potential_energy: float, virial_tensor: np.ndarray) -> None:
+    """index_outcar()で記録したbyte offsetからOUTCARの1フレームの力のブロックを読み込むLazyFramesのloader
+    cell, potential_energy, virial_tensorはindex_outcarがOutcarParserで読んだ値を使う
+    """
+    forces = load_outcar_forces(outcar_path, len(atom_types), block_offset)
+    sf.cell = cell.copy()
+    sf.potential_energy = potential_energy
+    sf.virial_tensor = virial_tensor.copy()
+    sf.atoms = pd.DataFrame({"type": atom_types,
+                             "x": forces[:, 0], "y": forces[:, 1], "z": forces[:, 2],
+                             "fx": forces[:, 3], "fy": forces[:, 4], "fz": forces[:, 5]})
+
+
+class LazyFrames:
+    """フレームを必要になったときに読み込むクラス
+    import時にはfileのpathやbyte offsetのみを記録し、
+    lazy_frames[frame_idx]にアクセスしたときにそのフレームを読み込む.
+    読み込んだフレームはcache_size個までLRU cacheに保持される.
+
+    sfs.import_dumpposes(lazy=True)などを実行すると、sfs.sfがLazyFramesになる.
+    sfs.sf[frame_idx]でSimulationFrameが得られるので、既存のメソッドはそのまま使える.
+
+    Attributes
+    ----------
+    entries : list[tuple[Callable, tuple, int]]
+        フレームごとの(loader, loaderの引数, step_num)
+        loaderがNoneのときは引数にSimulationFrameそのものが入っている
+    cache_size : int
+        cacheに保持するフレームの最大数
+    """
+    entries: list[tuple[Callable, tuple, int]]
+    cache_size: int
+    atom_symbol_to_type: dict[str, int]
+    atom_type_to_symbol: dict[int, str]
+    atom_type_to_mass: dict[int, float]
+    limda_default: dict[str, Any]
+
+    def __init__(self, entries: list[tuple[Callable, tuple, int]], para_source, cache_size: int = 16):
+        self.entries = entries
+        self.cache_size = cache_size
+        self.cache: OrderedDict[int, SimulationFrame] = OrderedDict()
+        self.set_para(para_source)
+
+    def set_para(self, para_source) -> None:
+        """para_sourceのatom_symbol_to_type, atom_type_to_symbol, atom_type_to_mass, limda_defaultを共有する
+        """
+        self.atom_symbol_to_type = para_source.atom_symbol_to_type
+        self.atom_type_to_symbol = para_source.atom_type_to_symbol
+        self.atom_type_to_mass = para_source.atom_type_to_mass
+        self.limda_default = para_source.limda_default
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __getitem__(self, key) -> Union[SimulationFrame, "LazyFrames"]:
+        """lazy_frames[frame_idx]でSimulationFrameを、
+        lazy_frames[start:stop:step]でLazyFramesを返す
+        """
+        if isinstance(key, slice):
+            return self.take(range(len(self))[key])
+        return self.get_frame(key)
+
+    def __iter__(self):
+        for frame_idx in range(len(self)):
+            yield self.get_frame(frame_idx)
+
+    def __getstate__(self) -> dict:
+        # cacheはpickleしない
+        state = self.__dict__.copy()
+        state["cache"] = OrderedDict()
+        return state
+
+    def extend(self, entries: list[tuple[Callable, tuple, int]]) -> None:
+        """フレームを後ろに追加する
+        """
+        self.entries.extend(entries)
+
+    def get_frame(self, frame_idx: int) -> SimulationFrame:
+        """frame_idx番目のフレームを読み込んで返す
+        Note
+        ----
+            cacheから外れたフレームは再度fileから読み込まれるので、
+            返されたSimulationFrameへの変更は保持されないことがある.
+        """
+        frame_num = len(self)
+        if frame_idx < 0:
+            frame_idx += frame_num
+        if not 0 <= frame_idx < frame_num:
+            raise IndexError(f"frame index {frame_idx} is out of range")
+
+        if frame_idx in self.cache:
+            self.cache.move_to_end(frame_idx)
+            return self.cache[frame_idx]
+
+        loader, args, step_num = self.entries[frame_idx]
+        if loader is None:
+            return args[0]
+        sf = make_frame_sharing_para(self)
+        sf.step_num = step_num
+        loader(sf, *args)
+
+        if self.cache_size > 0:
+            self.cache[frame_idx] = sf
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return sf
+
+    def take(self, indices) -> "LazyFrames":
+        """indicesで指定したフレームのみからなるLazyFramesを返す
+        フレームは読み込まれない
+        """
+        return LazyFrames([self.entries[idx] for idx in indices], self, self.cache_size)
+
+    def get_frames(self) -> list[SimulationFrame]:
+        """全フレームを読み込み、SimulationFrameのlistとして返す
+        """
+        frames = []
+        for loader, args, step_num in self.entries:
+            if loader is None:
+                frames.append(args[0])
+                continue
+            sf = make_frame_sharing_para(self)
+            sf.step_num = step_num
+            loader(sf, *args)
+            frames.append(sf)
+        return frames
+
+    def get_step_nums(self) -> list[int]:
+        """フレームを読み込まずにステップ数のリストを返す
+        """
+        return [step_num for _, _, step_num in self.entries]
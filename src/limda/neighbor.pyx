@@ -1,6 +1,7 @@
 # distutils: language = c++
 
 import numpy as np
+cimport numpy as cnp
 import queue
 from libc.stdlib cimport malloc
 from libcpp.vector cimport vector
@@ -139,3 +140,34 @@ def get_neighbor_list_using_cython(vector[int] atoms_type,
                                    vector[vector[double]] bond_length,
                                    vector[double] cell):
     return make_neighbor_list(atoms_type,atoms_pos,mesh_length,atom_num,bond_length,cell)
+
+def get_neighbor_csr_using_cython(vector[int] atoms_type,
+                                  vector[vector[double]] atoms_pos,
+                                  double mesh_length,
+                                  int atom_num,
+                                  vector[vector[double]] bond_length,
+                                  vector[double] cell):
+    # neighbor listをCSR形式(indptr, indices)のnumpy配列で返します。
+    # 原子iの近接原子はindices[indptr[i]:indptr[i+1]]に入ります。
+    cdef:
+        vector[vector[int]] neighbor_list
+        cnp.int64_t[:] indptr_view
+        cnp.int64_t[:] indices_view
+        long total, k
+        int i, j
+
+    neighbor_list = make_neighbor_list(atoms_type,atoms_pos,mesh_length,atom_num,bond_length,cell)
+    indptr = np.zeros(atom_num + 1, dtype=np.int64)
+    indptr_view = indptr
+    total = 0
+    for i in range(atom_num):
+        total += neighbor_list[i].size()
+        indptr_view[i + 1] = total
+    indices = np.empty(total, dtype=np.int64)
+    indices_view = indices
+    k = 0
+    for i in range(atom_num):
+        for j in range(neighbor_list[i].size()):
+            indices_view[k] = neighbor_list[i][j]
+            k += 1
+    return indptr, indices
@@ -0,0 +1,132 @@
+import numpy as np
+import json
+import pathlib
+from typing import Union
+from .trajectory import Trajectory, VECTOR_COLUMNS
+
+META_FILE_NAME: str = "meta.json"
+FRAME_VALUE_DTYPES: dict[str, type] = {"cell": np.float64, "potential_energy": np.float64,
+                                       "virial_tensor": np.float64, "step_num": np.int64}
+
+
+def write_npy_trajectory(output_dir: Union[str, pathlib.Path], frames, use_float32: bool = False) -> None:
+    """framesをTrajectoryと同じ配列ごとの.npy fileとmeta.jsonとしてoutput_dirに出力する
+    framesがTrajectoryのときは配列をそのまま保存する.
+    それ以外のときはnp.lib.format.open_memmapで作ったfileに1フレームずつ書き込むので、
+    全フレームをメモリに乗せる必要はない.
+    Parameters
+    ----------
+        output_dir: Union[str, pathlib.Path]
+            出力先のdirectory
+        frames: Union[list[SimulationFrame], Trajectory, LazyFrames]
+            出力するフレーム, 全フレームの原子数とcolumnが同じである必要がある
+        use_float32: bool
+            Trueならば座標, 力, 速度をfloat32で保存する
+    """
+    assert len(frames) > 0, "frames is empty"
+    output_dir = pathlib.Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    if isinstance(frames, Trajectory):
+        arrays = {"atom_arrays": frames.atom_arrays,
+                  "shared_arrays": frames.shared_arrays,
+                  "frame_arrays": frames.frame_arrays}
+        for group_arrays in arrays.values():
+            for name, array in group_arrays.items():
+                if use_float32 and name in VECTOR_COLUMNS:
+                    array = array.astype(np.float32)
+                np.save(output_dir / f"{name}.npy", array)
+        write_meta(output_dir, frames.columns, {group: list(group_arrays)
+                                                for group, group_arrays in arrays.items()})
+        return
+
+    first_frame = frames[0]
+    frame_num = len(frames)
+    atom_num = first_frame.get_total_atoms()
+    columns = list(first_frame.atoms.columns)
+    float_dtype = np.float32 if use_float32 else np.float64
+
+    atom_arrays = {}
+    grouped_columns = set()
+    for name, vector_columns in VECTOR_COLUMNS.items():
+        if all(column in columns for column in vector_columns):
+            atom_arrays[name] = np.lib.format.open_memmap(
+                output_dir / f"{name}.npy", mode="w+", dtype=float_dtype, shape=(frame_num, atom_num, 3))
+            grouped_columns.update(vector_columns)
+    for column in columns:
+        if column not in grouped_columns:
+            atom_arrays[column] = np.lib.format.open_memmap(
+                output_dir / f"{column}.npy", mode="w+", dtype=first_frame.atoms[column].dtype,
+                shape=(frame_num, atom_num))
+    frame_arrays = {}
+    for name, dtype in FRAME_VALUE_DTYPES.items():
+        if getattr(first_frame, name) is not None:
+            frame_arrays[name] = np.empty((frame_num,) + np.shape(getattr(first_frame, name)), dtype=dtype)
+
+    for frame_idx in range(frame_num):
+        frame = frames[frame_idx]
+        assert frame.get_total_atoms() == atom_num, "all frames must have the same number of atoms"
+        assert list(frame.atoms.columns) == columns, "all frames must have the same columns"
+        for name, vector_columns in VECTOR_COLUMNS.items():
+            if name in atom_arrays:
+                atom_arrays[name][frame_idx] = frame.atoms[vector_columns].values
+        for column in columns:
+            if column not in grouped_columns:
+                atom_arrays[column][frame_idx] = frame.atoms[column].values
+        for name in frame_arrays:
+            assert getattr(frame, name) is not None, f"{name} is not defined in some frames"
+            frame_arrays[name][frame_idx] = getattr(frame, name)
+
+    # Trajectory.from_framesと同じく、全フレームで同じ値を持つcolumnは(atoms,)の配列一つにする
+    shared_names = []
+    for column in columns:
+        if column in grouped_columns:
+            continue
+        array = atom_arrays.pop(column)
+        if np.all(array == array[0]):
+            shared_array = np.array(array[0])
+            del array
+            np.save(output_dir / f"{column}.npy", shared_array)
+            shared_names.append(column)
+        else:
+            array.flush()
+            atom_arrays[column] = array
+    for array in atom_arrays.values():
+        array.flush()
+    for name, array in frame_arrays.items():
+        np.save(output_dir / f"{name}.npy", array)
+
+    write_meta(output_dir, columns, {"atom_arrays": list(atom_arrays),
+                                     "shared_arrays": shared_names,
+                                     "frame_arrays": list(frame_arrays)})
+
+
+def write_meta(output_dir: pathlib.Path, columns: list[str], array_names: dict[str, list[str]]) -> None:
+    meta = {"columns": columns}
+    meta.update(array_names)
+    with open(output_dir / META_FILE_NAME, "w") as f:
+        json.dump(meta, f, indent=4)
+
+
+def read_npy_trajectory(input_dir: Union[str, pathlib.Path], para_source=None,
+                        mmap_mode: str = "r") -> Trajectory:
+    """write_npy_trajectoryで出力したdirectoryからTrajectoryを作る
+    Parameters
+    ----------
+        input_dir: Union[str, pathlib.Path]
+            .npy fileとmeta.jsonが入ったdirectory
+        para_source: SimulationFrames
+            atom_symbol_to_typeなどを共有するsfs
+        mmap_mode: str
+            np.loadのmmap_mode, "r"ならば配列はメモリに読み込まれずnp.memmapになる
+            Noneならば全ての配列をメモリに読み込む
+    """
+    input_dir = pathlib.Path(input_dir)
+    with open(input_dir / META_FILE_NAME, "r") as f:
+        meta = json.load(f)
+    arrays = {}
+    for group in ("atom_arrays", "shared_arrays", "frame_arrays"):
+        arrays[group] = {name: np.load(input_dir / f"{name}.npy", mmap_mode=mmap_mode)
+                         for name in meta[group]}
+    return Trajectory(arrays["atom_arrays"], arrays["shared_arrays"], arrays["frame_arrays"],
+                      meta["columns"], para_source)
@@ -0,0 +1,183 @@
+import numpy as np
+import hashlib
+import os
+import pathlib
+from typing import Iterator, Union
+from .compression import open_file
+
+# OUTCARが書き直されたかの判定に使う先頭のbyte数, vaspのversionと実行日時の行を含む
+IDENTITY_SIZE: int = 4096
+
+
+class OutcarParser:
+    """OUTCARを先頭から1行ずつ読み、POSITION/TOTAL-FORCEのブロックごとにフレームを返すクラス
+    fileをまとめて読み込まないので、大きなOUTCARでもメモリを使わない.
+    direct lattice vectors, energy without entropy, Total(virial), Iterationの行を見つけるたびに状態を更新し、
+    POSITION/TOTAL-FORCEのブロックに達したら、その時点の状態と力のブロックからフレームを作る.
+    力のブロックはまとめてnp.arrayで変換する.
+
+    Attributes
+    ----------
+    atom_num : int
+        原子数
+    NELM : int
+        最大のIteration回数, iteration回数がNELMに達したフレームは返さない
+    triclinic : bool
+        Trueならばcellをshape:(3, 3)の格子ベクトルで返す
+    offset : int
+        読み終わった位置のbyte offset
+        fileの末尾が書き込み途中のときは、そのブロックの先頭の位置になる
+    """
+    atom_num: int
+    NELM: int
+    triclinic: bool
+    offset: int
+
+    def __init__(self, atom_num: int, NELM: int, triclinic: bool = False):
+        self.atom_num = atom_num
+        self.NELM = NELM
+        self.triclinic = triclinic
+        self.offset = 0
+        self.cell_splines = None
+        self.potential_energy_spline = None
+        self.virial_tensor_spline = None
+        self.iteration = None
+
+    def read_lines(self, f, line_num: int) -> list[bytes]:
+        """fからline_num行読む. 書き込み途中で行が足りないときはNoneを返す
+        """
+        lines = []
+        for _ in range(line_num):
+            line = f.readline()
+            if not line.endswith(b"\n"):
+                return None
+            lines.append(line)
+        return lines
+
+    def parse(self, f) -> Iterator[tuple[np.ndarray, float, np.ndarray, np.ndarray]]:
+        """binary modeで開いたOUTCARをself.offsetから読み、フレームを1つずつ返すgenerator
+        Yields
+        ------
+            cell: np.ndarray, shape:[3](float32)またはshape:[3, 3](triclinic=True)
+            potential_energy: float
+            virial_tensor: np.ndarray[float32], shape:[3, 3]
+            forces: np.ndarray[float], shape:[atoms, 6], POSITION(x, y, z)とTOTAL-FORCE(fx, fy, fz)
+        """
+        for block_offset, cell, potential_energy, virial_tensor, atom_lines in self.parse_blocks(f):
+            yield cell, potential_energy, virial_tensor, parse_force_lines(atom_lines, self.atom_num, block_offset)
+
+    def parse_blocks(self, f) -> Iterator[tuple[int, np.ndarray, float, np.ndarray, list[bytes]]]:
+        """binary modeで開いたOUTCARをself.offsetから読み、POSITION/TOTAL-FORCEのブロックごとに
+        (ブロックの先頭のbyte offset, cell, potential_energy, virial_tensor, 原子ごとの行)を返すgenerator
+        原子ごとの行はparse_force_linesで配列にする. iteration回数がNELMに達したブロックは返さない.
+        """
+        f.seek(self.offset)
+        while True:
+            line = f.readline()
+            if not line.endswith(b"\n"):
+                # EOFまたは書き込み途中の行
+                return
+            spline = line.split()
+            if len(spline) <= 1:
+                self.offset += len(line)
+                continue
+
+            if len(spline) == 3 and spline[0] == b"POSITION" and spline[1] == b"TOTAL-FORCE":
+                block = self.read_lines(f, self.atom_num + 1)
+                if block is None:
+                    return
+                block_offset = self.offset
+                self.offset += len(line) + sum(map(len, block))
+                if self.iteration >= self.NELM:
+                    continue
+                yield block_offset, self.make_cell(), float(self.potential_energy_spline[4]), \
+                    self.make_virial_tensor(), block[1:]
+                continue
+
+            if len(spline) == 6 and spline[0] == b"direct" and spline[1] == b"lattice":
+                cell_lines = self.read_lines(f, 3)
+                if cell_lines is None:
+                    return
+                self.offset += len(line) + sum(map(len, cell_lines))
+                self.cell_splines = [cell_line.split() for cell_line in cell_lines]
+                continue
+
+            if len(spline) >= 4 and spline[0] == b"energy" and spline[1] == b"without" \
+                    and spline[2] == b"entropy":
+                self.potential_energy_spline = spline
+            elif len(spline) == 7 and spline[0] == b"Total":
+                self.virial_tensor_spline = spline
+            elif len(spline) == 5 and spline[0] == b"---------------------------------------" \
+                    and spline[1] == b"Iteration":
+                self.iteration = int(spline[3][:-1])
+            self.offset += len(line)
+
+    def make_cell(self) -> np.ndarray:
+        if self.triclinic:
+            return np.array([list(map(float, self.cell_splines[dim][:3])) for dim in range(3)])
+        cell = np.empty(3, dtype=np.float32)
+        for dim in range(3):
+            cell[dim] = float(self.cell_splines[dim][dim])
+        return cell
+
+    def make_virial_tensor(self) -> np.ndarray:
+        spline = self.virial_tensor_spline
+        virial_tensor = np.empty((3, 3), dtype=np.float32)
+        for i in range(3):
+            virial_tensor[i][i] = float(spline[i+1])
+        for i in range(3):
+            virial_tensor[i][(i+1) % 3] = float(spline[i+4])
+            virial_tensor[(i+1) % 3][i] = float(spline[i+4])
+        return virial_tensor
+
+
+def parse_force_lines(atom_lines: list[bytes], atom_num: int, block_offset: int = None) -> np.ndarray:
+    """POSITION/TOTAL-FORCEのブロックの原子ごとの行をまとめてshape:[atoms, 6]の配列にする
+    """
+    forces = np.array(b" ".join(atom_lines).split(), dtype=np.float64)
+    if len(forces) != atom_num * 6:
+        raise ValueError(f"unexpected POSITION/TOTAL-FORCE block at byte {block_offset}")
+    return forces.reshape(atom_num, 6)
+
+
+def index_outcar(outcar_path: Union[str, pathlib.Path], atom_num: int, NELM: int,
+                 triclinic: bool = False) -> list[tuple[int, np.ndarray, float, np.ndarray]]:
+    """OutcarParserでOUTCARを1度だけ走査し、フレームごとに
+    (POSITION/TOTAL-FORCEの行のbyte offset, cell, potential_energy, virial_tensor)を返す.
+    力のブロックは配列にしないので、load_outcar_forcesでoffsetから読む.
+    """
+    parser = OutcarParser(atom_num, NELM, triclinic)
+    with open_file(outcar_path, "rb") as f:
+        return [(block_offset, cell, potential_energy, virial_tensor)
+                for block_offset, cell, potential_energy, virial_tensor, _ in parser.parse_blocks(f)]
+
+
+def load_outcar_forces(outcar_path: Union[str, pathlib.Path], atom_num: int, block_offset: int) -> np.ndarray:
+    """index_outcarで記録したbyte offsetから、POSITION/TOTAL-FORCEのブロックをshape:[atoms, 6]の配列として読む
+    """
+    with open_file(outcar_path, "rb") as f:
+        f.seek(block_offset)
+        f.readline()  # POSITION TOTAL-FORCE
+        f.readline()  # -----
+        atom_lines = [f.readline() for _ in range(atom_num)]
+    return parse_force_lines(atom_lines, atom_num, block_offset)
+
+
+def iter_outcar_frames(outcar_path: str, atom_num: int, NELM: int,
+                       triclinic: bool = False) -> Iterator[tuple[np.ndarray, float, np.ndarray, np.ndarray]]:
+    """OUTCARのフレームを1つずつ返すgenerator
+    (cell, potential_energy, virial_tensor, forces)を返す. 詳細はOutcarParser.parseを参照
+    """
+    parser = OutcarParser(atom_num, NELM, triclinic)
+    with open_file(outcar_path, "rb") as f:
+        yield from parser.parse(f)
+
+
+def get_outcar_identity(outcar_path: Union[str, pathlib.Path], prefix_size: int) -> tuple[int, str]:
+    """OUTCARのinode番号と先頭prefix_size byteのhashを返す
+    vaspを再実行してOUTCARが書き直されると、inode番号か先頭の実行日時の行が変わる.
+    圧縮されたOUTCARでは展開した先頭のhashを返す.
+    """
+    with open_file(outcar_path, "rb") as f:
+        prefix = f.read(prefix_size)
+    return os.stat(outcar_path).st_ino, hashlib.sha1(prefix).hexdigest()
@@ -0,0 +1,58 @@
+import numpy as np
+from tqdm import trange
+
+
+def farthest_point_sampling(features: np.ndarray, sample_num: int, first_idx: int = 0,
+                            chunk_size: int = 65536, rtol: float = None) -> list[int]:
+    """featuresの行からfarthest point sampling(k-center法の貪欲解)でsample_num個を選び、そのindexを返す
+    既に選んだ点までの最小距離が最も大きい点を1つずつ選ぶ.
+    各点の最小距離はshape:[rows]の配列1つだけで持ち、新しく選んだ点との距離はchunk_size行ずつ
+    |x|^2 - 2 x・c + |c|^2 で計算するので、距離行列を作らず、featuresがnp.memmapでも使える.
+    Parameters
+    ----------
+        features: np.ndarray, shape:[rows, features]
+            各点の特徴量
+        sample_num: int
+            選ぶ点の数
+        first_idx: int
+            最初に選ぶ点のindex
+        chunk_size: int
+            一度に距離を計算する行数
+        rtol: float
+            最小距離の2乗がrtol * max(|x|^2)以下の点は選んだ点と同じとみなす
+            Noneならばfeaturesのdtypeの計算誤差(float32ならば約1e-5, float64ならば約2e-14)を使う
+    Note
+    ----
+        残りの点が全て選んだ点と同じ特徴量になったときは、sample_num個より少ない点を返す.
+        |x|^2 - 2 x・c + |c|^2 は桁落ちで同じ点でも0にならないので、rtolで判定する.
+    """
+    row_num = len(features)
+    assert 0 < sample_num <= row_num, "sample_num must be in [1, rows]"
+    assert 0 <= first_idx < row_num, "first_idx must be in [0, rows)"
+    if rtol is None:
+        dtype = features.dtype if np.issubdtype(features.dtype, np.floating) else np.float64
+        rtol = 100 * np.finfo(dtype).eps
+    chunks = [(start, min(start + chunk_size, row_num)) for start in range(0, row_num, chunk_size)]
+    squared_norms = np.empty(row_num, dtype=np.float64)
+    for start, end in chunks:
+        chunk = np.asarray(features[start:end], dtype=np.float64)
+        squared_norms[start:end] = np.einsum("ij,ij->i", chunk, chunk)
+    tolerance = rtol * np.max(squared_norms)
+
+    min_distances = np.full(row_num, np.inf)
+    selected_indices = [first_idx]
+    for _ in trange(sample_num - 1, desc="[farthest point sampling]"):
+        center = np.asarray(features[selected_indices[-1]])
+        center_squared_norm = squared_norms[selected_indices[-1]]
+        for start, end in chunks:
+            # 内積はfeaturesのdtypeのまま計算し、float64の配列へのコピーを作らない
+            distances = squared_norms[start:end] - 2 * (np.asarray(features[start:end]) @ center) \
+                + center_squared_norm
+            np.maximum(distances, 0.0, out=distances)
+            np.minimum(min_distances[start:end], distances, out=min_distances[start:end])
+        min_distances[selected_indices[-1]] = 0.0
+        next_idx = int(np.argmax(min_distances))
+        if min_distances[next_idx] <= tolerance:
+            break
+        selected_indices.append(next_idx)
+    return selected_indices
@@ -0,0 +1,273 @@
+import numpy as np
+
+DIRECTION_TO_DIM: dict[str, int] = {"x": 0, "y": 1, "z": 2}
+
+
+def sum_in_slabs(axis_pos: np.ndarray, lowers, uppers, weights: np.ndarray = None,
+                 axis_order: np.ndarray = None) -> np.ndarray:
+    """複数のslab(axis_posがlower以上upper以下)について、含まれる原子のweightsの和を返す
+    meshは使わず、座標を一度だけ並べ替えてslabの端を二分探索するので、slabの数が多くても速い
+    Parameters
+    ----------
+        axis_pos: np.ndarray[float], shape:[atoms]
+            slabの方向の原子の座標
+        lowers: array_like[float], shape:[slabs]
+        uppers: array_like[float], shape:[slabs]
+        weights: np.ndarray[float], shape:[atoms]
+            原子ごとの重み, Noneならば原子数を数える
+        axis_order: np.ndarray[int], shape:[atoms]
+            axis_posを昇順に並べるindex(np.argsort(axis_pos)), Noneならばここで並べ替える
+    Returns
+    -------
+        sums: np.ndarray[float], shape:[slabs]
+    """
+    axis_pos = np.asarray(axis_pos, dtype=np.float64)
+    if axis_order is None:
+        axis_order = np.argsort(axis_pos, kind="stable")
+    sorted_pos = axis_pos[axis_order]
+    if weights is None:
+        cumulative = np.arange(len(sorted_pos) + 1, dtype=np.float64)
+    else:
+        cumulative = np.zeros(len(sorted_pos) + 1, dtype=np.float64)
+        np.cumsum(np.asarray(weights, dtype=np.float64)[axis_order], out=cumulative[1:])
+    starts = np.searchsorted(sorted_pos, np.asarray(lowers, dtype=np.float64), side="left")
+    stops = np.searchsorted(sorted_pos, np.asarray(uppers, dtype=np.float64), side="right")
+    return cumulative[np.maximum(stops, starts)] - cumulative[starts]
+
+
+class SpatialIndex:
+    """原子をmesh(cell list)に分けて保持し、領域に含まれる原子を探すクラス
+    neighbor.pyxと同じ方法でmeshを切り、原子をmesh_id(z, y, xの順に大きい桁)順に並べて保持する.
+    box, slab, sphereの問い合わせでは、領域にかかるmeshの原子だけを調べる.
+
+    sf.get_spatial_index()で作成する.
+    返すindexはsf.atomsの行番号(0-indexed, ilocで使う番号)で、昇順に並んでいる.
+
+    Attributes
+    ----------
+    pos : np.ndarray[float], shape:[atoms, 3]
+        原子の座標
+    atom_types : np.ndarray[int], shape:[atoms]
+        原子のtype
+    cell : np.ndarray[float], shape:[3]
+        cellの大きさ
+    mesh_size : np.ndarray[int], shape:[3]
+        x, y, z方向のmeshの個数
+    mesh_length : np.ndarray[float], shape:[3]
+        x, y, z方向のmeshの大きさ
+    order : np.ndarray[int], shape:[atoms]
+        mesh_id順に並べた原子の行番号
+    mesh_start : np.ndarray[int], shape:[meshes+1]
+        mesh_idのmeshの原子は order[mesh_start[mesh_id]:mesh_start[mesh_id+1]] に入る
+    """
+    pos: np.ndarray
+    atom_types: np.ndarray
+    cell: np.ndarray
+    mesh_size: np.ndarray
+    mesh_length: np.ndarray
+    order: np.ndarray
+    mesh_start: np.ndarray
+
+    def __init__(self, pos: np.ndarray, atom_types: np.ndarray, cell: np.ndarray, mesh_length: float = 3.0):
+        """
+        Parameters
+        ----------
+            pos: np.ndarray[float], shape:[atoms, 3]
+                原子の座標
+            atom_types: np.ndarray[int], shape:[atoms]
+                原子のtype
+            cell: np.ndarray[float], shape:[3]
+                cellの大きさ, 直方体のcellのみ対応
+            mesh_length: float
+                meshの大きさの目安, 実際の大きさはcellを割り切れるように調整される
+        """
+        cell = np.asarray(cell, dtype=np.float64)
+        assert cell.shape == (3,), "SpatialIndex supports only orthogonal cells"
+        assert mesh_length > 0, "mesh_length must be positive"
+        self.pos = np.ascontiguousarray(pos, dtype=np.float64)
+        self.atom_types = np.asarray(atom_types)
+        self.cell = cell
+        # neighbor.pyxのmake_mesh_sizeと同じくmeshは各方向3個以上
+        self.mesh_size = np.maximum((cell / mesh_length).astype(np.int64), 3)
+        self.mesh_length = cell / self.mesh_size
+        self._axis_orders = {}
+
+        mesh_nums = self.get_mesh_nums(self.pos)
+        mesh_ids = self.get_mesh_ids(mesh_nums)
+        self.order = np.argsort(mesh_ids, kind="stable")
+        self.mesh_start = np.zeros(np.prod(self.mesh_size) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(mesh_ids, minlength=np.prod(self.mesh_size)),
+                  out=self.mesh_start[1:])
+
+    def __len__(self) -> int:
+        return len(self.pos)
+
+    def get_mesh_nums(self, pos: np.ndarray) -> np.ndarray:
+        """座標がx, y, z方向の何番目のmeshに入るかを返す
+        cellの外の座標は端のmeshに入る
+        """
+        mesh_nums = np.floor(pos / self.mesh_length).astype(np.int64)
+        return np.clip(mesh_nums, 0, self.mesh_size - 1)
+
+    def get_mesh_ids(self, mesh_nums: np.ndarray) -> np.ndarray:
+        """x, y, z方向のmesh番号からmesh_idを返す
+        """
+        return (mesh_nums[..., 2] * self.mesh_size[1] + mesh_nums[..., 1]) * self.mesh_size[0] \
+            + mesh_nums[..., 0]
+
+    def get_candidates(self, mesh_lower: np.ndarray, mesh_upper: np.ndarray) -> np.ndarray:
+        """x, y, z方向のmesh番号がmesh_lower以上mesh_upper以下のmeshに入っている原子の行番号を返す
+        mesh_id順に並んでいるので、x方向の範囲は(z, y)ごとに連続した区間になる
+        """
+        zs, ys = np.meshgrid(np.arange(mesh_lower[2], mesh_upper[2] + 1),
+                             np.arange(mesh_lower[1], mesh_upper[1] + 1), indexing="ij")
+        row_ids = (zs.ravel() * self.mesh_size[1] + ys.ravel()) * self.mesh_size[0]
+        return self.get_atoms_in_mesh_ranges(row_ids + mesh_lower[0], row_ids + mesh_upper[0])
+
+    def get_atoms_in_mesh_ranges(self, first_mesh_ids: np.ndarray, last_mesh_ids: np.ndarray,
+                                 return_range_ids: bool = False):
+        """mesh_idがfirst_mesh_ids[i]以上last_mesh_ids[i]以下のmeshに入っている原子の行番号をまとめて返す
+        return_range_ids=Trueならば、各原子がどの区間iから来たかも返す
+        """
+        starts = self.mesh_start[first_mesh_ids]
+        lengths = self.mesh_start[last_mesh_ids + 1] - starts
+        total = lengths.sum()
+        # 区間[starts, starts+lengths)をつなげたindexを作る
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        indices = self.order[offsets + np.arange(total, dtype=np.int64)]
+        if return_range_ids:
+            return indices, np.repeat(np.arange(len(lengths)), lengths)
+        return indices
+
+    def query_box(self, lower, upper) -> np.ndarray:
+        """lower <= pos <= upperを満たす原子の行番号を返す
+        Parameters
+        ----------
+            lower: array_like[float], shape:[3]
+                x, y, zの下限, Noneの成分は下限なし
+            upper: array_like[float], shape:[3]
+                x, y, zの上限, Noneの成分は上限なし
+        Returns
+        -------
+            indices: np.ndarray[int]
+        """
+        return self.query_boxes([lower], [upper])[0]
+
+    def query_slab(self, direction: str, lower: float = None, upper: float = None) -> np.ndarray:
+        """direction方向の座標がlower以上upper以下の原子の行番号を返す
+        """
+        assert direction in DIRECTION_TO_DIM, "Incorrect direction"
+        box_lower = [None, None, None]
+        box_upper = [None, None, None]
+        box_lower[DIRECTION_TO_DIM[direction]] = lower
+        box_upper[DIRECTION_TO_DIM[direction]] = upper
+        return self.query_box(box_lower, box_upper)
+
+    def query_sphere(self, center, radius: float, periodic: bool = True) -> np.ndarray:
+        """centerからの距離がradius以下の原子の行番号を返す
+        Parameters
+        ----------
+            center: array_like[float], shape:[3]
+                球の中心
+            radius: float
+                球の半径
+            periodic: bool
+                Trueならば周期境界条件を考慮する(最近接像の距離を使う)
+        """
+        center = np.asarray(center, dtype=np.float64)
+        if periodic:
+            assert 2 * radius < np.min(self.cell), "radius must be smaller than half of the cell"
+            mesh_center = np.floor(center / self.mesh_length).astype(np.int64)
+            mesh_reach = np.ceil(radius / self.mesh_length).astype(np.int64)
+            mesh_ranges = []
+            for dim in range(3):
+                mesh_nums = np.arange(mesh_center[dim] - mesh_reach[dim],
+                                      mesh_center[dim] + mesh_reach[dim] + 1)
+                mesh_ranges.append(np.unique(mesh_nums % self.mesh_size[dim]))
+            zs, ys, xs = np.meshgrid(mesh_ranges[2], mesh_ranges[1], mesh_ranges[0], indexing="ij")
+            mesh_ids = (zs.ravel() * self.mesh_size[1] + ys.ravel()) * self.mesh_size[0] + xs.ravel()
+            candidates = self.get_atoms_in_mesh_ranges(mesh_ids, mesh_ids)
+            diff = self.pos[candidates] - center
+            diff -= np.round(diff / self.cell) * self.cell
+        else:
+            mesh_lower = self.get_mesh_nums(np.maximum(center - radius, 0.0))
+            mesh_upper = self.get_mesh_nums(np.minimum(center + radius, self.cell))
+            candidates = self.get_candidates(mesh_lower, mesh_upper)
+            diff = self.pos[candidates] - center
+        is_inside = np.einsum("ij,ij->i", diff, diff) <= radius * radius
+        return np.sort(candidates[is_inside])
+
+    def query_boxes(self, lowers, uppers) -> list[np.ndarray]:
+        """複数のboxについてquery_boxを行い、行番号のlistを返す
+        全てのboxにかかるmeshの原子をまとめて集め、1回の比較で絞り込むので、boxの数が多くても速い
+        Parameters
+        ----------
+            lowers: array_like[float], shape:[boxes, 3]
+                x, y, zの下限, Noneの成分は下限なし
+            uppers: array_like[float], shape:[boxes, 3]
+                x, y, zの上限, Noneの成分は上限なし
+        Returns
+        -------
+            indices_list: list[np.ndarray[int]]
+                boxごとの原子の行番号(昇順)
+        """
+        assert len(lowers) == len(uppers), "lowers and uppers must have the same length"
+        box_num = len(lowers)
+        if box_num == 0:
+            return []
+        lowers = np.array([[-np.inf if l is None else l for l in lower] for lower in lowers],
+                          dtype=np.float64).reshape(box_num, 3)
+        uppers = np.array([[np.inf if u is None else u for u in upper] for upper in uppers],
+                          dtype=np.float64).reshape(box_num, 3)
+        mesh_lowers = self.get_mesh_nums(np.maximum(lowers, 0.0))
+        mesh_uppers = self.get_mesh_nums(np.minimum(uppers, self.cell))
+
+        # boxごとに(z, y)のmeshの行を列挙する, 空のboxは行を持たない
+        is_empty = np.any(uppers < lowers, axis=1)
+        y_nums = mesh_uppers[:, 1] - mesh_lowers[:, 1] + 1
+        row_nums = np.where(is_empty, 0, (mesh_uppers[:, 2] - mesh_lowers[:, 2] + 1) * y_nums)
+        row_boxes = np.repeat(np.arange(box_num), row_nums)
+        row_in_box = np.arange(row_nums.sum()) - np.repeat(np.cumsum(row_nums) - row_nums, row_nums)
+        zs = mesh_lowers[row_boxes, 2] + row_in_box // y_nums[row_boxes]
+        ys = mesh_lowers[row_boxes, 1] + row_in_box % y_nums[row_boxes]
+        row_ids = (zs * self.mesh_size[1] + ys) * self.mesh_size[0]
+        candidates, candidate_rows = self.get_atoms_in_mesh_ranges(
+            row_ids + mesh_lowers[row_boxes, 0], row_ids + mesh_uppers[row_boxes, 0], return_range_ids=True)
+        candidate_boxes = row_boxes[candidate_rows]
+
+        candidate_pos = self.pos[candidates]
+        is_inside = np.all((lowers[candidate_boxes] <= candidate_pos)
+                           & (candidate_pos <= uppers[candidate_boxes]), axis=1)
+        candidate_boxes = candidate_boxes[is_inside]
+        # boxの番号, 行番号の順に並べる
+        keys = np.sort(candidate_boxes * len(self.pos) + candidates[is_inside])
+        splits = np.cumsum(np.bincount(candidate_boxes, minlength=box_num))[:-1]
+        return np.split(keys % max(len(self.pos), 1), splits)
+
+    def get_axis_order(self, dim: int) -> np.ndarray:
+        """dim方向の座標で並べた原子の行番号を返す
+        一度作ったものは保持しておく
+        """
+        if dim not in self._axis_orders:
+            self._axis_orders[dim] = np.argsort(self.pos[:, dim], kind="stable")
+        return self._axis_orders[dim]
+
+    def sum_in_slabs(self, direction: str, lowers, uppers, weights: np.ndarray = None) -> np.ndarray:
+        """複数のslab(direction方向の座標がlower以上upper以下)について、含まれる原子のweightsの和を返す
+        slabの和はmeshではなく、direction方向の座標の並べ替え(一度作ったものは保持する)と二分探索で求める.
+        原子の行番号が必要なければ、query_slabを繰り返すよりこちらを使う.
+        Parameters
+        ----------
+            direction: str
+                "x" or "y" or "z"
+            lowers: array_like[float], shape:[slabs]
+            uppers: array_like[float], shape:[slabs]
+            weights: np.ndarray[float], shape:[atoms]
+                原子ごとの重み, Noneならば原子数を数える
+        Returns
+        -------
+            sums: np.ndarray[float], shape:[slabs]
+        """
+        assert direction in DIRECTION_TO_DIM, "Incorrect direction"
+        dim = DIRECTION_TO_DIM[direction]
+        return sum_in_slabs(self.pos[:, dim], lowers, uppers, weights, self.get_axis_order(dim))
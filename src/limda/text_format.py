@@ -0,0 +1,149 @@
+import numpy as np
+import pandas as pd
+
+FORMAT_CHUNK_SIZE: int = 65536
+
+
+def get_column_format(array: np.ndarray, float_format: str) -> str:
+    """配列のdtypeから%形式のformatを決める
+    整数は"%d", 浮動小数点数はfloat_formatを返す.
+    DataFrame.to_csvと同じ文字列にならない配列(bool, object, NaNを含む浮動小数点数など)はNoneを返す.
+    """
+    if array.dtype.kind in "iu":
+        return "%d"
+    if array.dtype.kind == "f" and not np.isnan(array).any():
+        return float_format
+    return None
+
+
+def iter_format_columns(columns: list[np.ndarray], formats: list[str], sep: str = " ",
+                        chunk_size: int = FORMAT_CHUNK_SIZE):
+    """列ごとの配列をchunk_size行ずつ文字列にして返すgenerator
+    chunk_size行ごとに、行のformatをつなげた1つのformat文字列に全ての値を%で渡すので、
+    1行ずつformatするより速い. 各値は"%.6f" % valueなどと同じ文字列になる.
+    Parameters
+    ----------
+        columns: list[np.ndarray]
+            列ごとの配列, 全て同じ長さ
+        formats: list[str]
+            列ごとの%形式のformat, "%s"ならばstr(value)と同じ文字列になる
+        sep: str
+            列の区切り文字
+        chunk_size: int
+            一度に文字列にする行数
+    """
+    row_format = sep.join(formats) + "\n"
+    row_num = len(columns[0]) if len(columns) > 0 else 0
+    for start in range(0, row_num, chunk_size):
+        column_values = [column[start:start + chunk_size].tolist() for column in columns]
+        values = [value for row in zip(*column_values) for value in row]
+        yield (row_format * len(column_values[0])) % tuple(values)
+
+
+def format_columns(columns: list[np.ndarray], formats: list[str], sep: str = " ",
+                   chunk_size: int = FORMAT_CHUNK_SIZE) -> str:
+    """列ごとの配列を1行ずつsepでつなげた文字列にする. 詳細はiter_format_columnsを参照
+    """
+    return "".join(iter_format_columns(columns, formats, sep, chunk_size))
+
+
+def format_dumppos_atoms(atoms: pd.DataFrame, out_columns: list[str]) -> str:
+    """dumpposのATOMSの部分(1-indexedのidとout_columns)の文字列を作る
+    atoms.to_csv(sep=' ', float_format='%.6f', header=False)でindexを+1したものと同じ文字列になる.
+    atomsは変更しない.
+    """
+    columns = [atoms.index.to_numpy() + 1] + [atoms[column].to_numpy() for column in out_columns]
+    formats = [get_column_format(column, "%.6f") for column in columns]
+    if None in formats:
+        return atoms[out_columns].set_axis(atoms.index + 1).to_csv(
+            header=False, sep=' ', float_format='%.6f', lineterminator="\n")
+    return format_columns(columns, formats)
+
+
+def get_str_format(array: np.ndarray) -> str:
+    """str(value)と同じ文字列になる%形式のformatを配列のdtypeから決める
+    整数は"%d", 浮動小数点数は"%r"(float64のreprと同じ), それ以外は"%s"を返す.
+    "%s"よりstrの呼び出しが少ない分速い.
+    """
+    if array.dtype.kind in "iu":
+        return "%d"
+    if array.dtype.kind == "f":
+        return "%r"
+    return "%s"
+
+
+def format_lammps_dump_atoms(atoms: pd.DataFrame, out_columns: list[str]) -> str:
+    """lammps形式のdumpposのATOMSの部分(1-indexedのidとout_columns)の文字列を作る
+    float_formatを指定しないatoms.to_csv(sep=' ', header=None)でindexを+1したものと同じ文字列になる.
+    to_csvはfloat64をrepr, float32などをnumpyの最短表記で書くので、それに合わせる. atomsは変更しない.
+    """
+    columns = [atoms.index.to_numpy() + 1]
+    formats = ["%d" if columns[0].dtype.kind in "iu" else None]
+    for column in out_columns:
+        array = atoms[column].to_numpy()
+        if array.dtype.kind in "iu":
+            formats.append("%d")
+        elif array.dtype.kind == "f" and not np.isnan(array).any():
+            if array.dtype != np.float64:
+                array = array.astype(str)
+            formats.append("%r" if array.dtype == np.float64 else "%s")
+        else:
+            formats.append(None)
+        columns.append(array)
+    if None in formats:
+        return atoms[out_columns].set_axis(atoms.index + 1).to_csv(sep=' ', header=None, lineterminator="\n")
+    return format_columns(columns, formats)
+
+
+def iter_format_input_atoms(atoms: pd.DataFrame, out_columns: list[str], chunk_size: int = FORMAT_CHUNK_SIZE):
+    """input.rdの#atomsの部分(1-indexedのidとout_columns)をchunk_size行ずつ文字列にして返すgenerator
+    atoms.itertuples()の各行を'    '.join(map(str, row))でつなげたものと同じ文字列になる.
+    atomsは変更しない.
+    """
+    columns = [atoms.index.to_numpy() + 1] + [atoms[column].to_numpy() for column in out_columns]
+    return iter_format_columns(columns, [get_str_format(column) for column in columns], "    ", chunk_size)
+
+
+def get_atom_symbols(atom_types: np.ndarray, atom_type_to_symbol: dict[int, str]) -> np.ndarray:
+    """原子ごとのtypeから元素記号のobject配列を作る. dictを引くのはtypeの種類数だけ
+    """
+    unique_types, inverse = np.unique(atom_types, return_inverse=True)
+    unique_symbols = np.empty(len(unique_types), dtype=object)
+    unique_symbols[:] = [atom_type_to_symbol[atom_type] for atom_type in unique_types.tolist()]
+    return unique_symbols[inverse.reshape(-1)]
+
+
+def format_car_atoms(atoms: pd.DataFrame, atom_type_to_symbol: dict[int, str]) -> str:
+    """car fileの原子の行を作る
+    原子はtypeでsort_values(by="type")と同じ順番に並べ、名前は元素記号と元素ごとの通し番号(1から)にする.
+    """
+    atom_types = atoms["type"].to_numpy()
+    order = np.argsort(atom_types, kind="quicksort")  # sort_values(by="type")と同じ順番
+    sorted_types = atom_types[order]
+    # 同じtypeの中での通し番号, sorted_typesの中でそのtypeが最初に現れる位置からの距離
+    type_counts = np.arange(len(sorted_types)) - np.searchsorted(sorted_types, sorted_types, side="left") + 1
+    symbols = get_atom_symbols(sorted_types, atom_type_to_symbol)
+    names = symbols + type_counts.astype(str).astype(object)
+    columns = [names] + [atoms[column].to_numpy(dtype=np.float64)[order] for column in ["x", "y", "z"]] + [symbols]
+    formats = ["%-5s", "%13.9f", "%13.9f", "%13.9f", "XXXX 1      xx     %-3s 0.000"]
+    return format_columns(columns, formats, sep="  ")
+
+
+def format_xsf_atoms(atoms: pd.DataFrame, out_columns: list[str], atom_type_to_symbol: dict[int, str]) -> str:
+    """xsf fileのPRIMCOORDの原子の行を作る
+    "symbol"はtypeから作った元素記号, それ以外はatomsのcolumnで、
+    atoms.to_csv(sep=' ', header=False, index=False, float_format='%.6f')と同じ文字列になる. atomsは変更しない.
+    """
+    columns = []
+    formats = []
+    for column in out_columns:
+        if column == "symbol":
+            columns.append(atoms["type"].replace(atom_type_to_symbol).to_numpy())
+            formats.append("%s")
+        else:
+            columns.append(atoms[column].to_numpy())
+            formats.append(get_column_format(columns[-1], "%.6f"))
+    if None in formats:
+        return pd.DataFrame(dict(zip(out_columns, columns))).to_csv(
+            sep=' ', header=False, index=False, float_format='%.6f', lineterminator="\n")
+    return format_columns(columns, formats)
@@ -0,0 +1,262 @@
+import pandas as pd
+import numpy as np
+from typing import Union, Any
+from .SimulationFrame import SimulationFrame
+
+# 3列をまとめて(frames, atoms, 3)の配列で保持するcolumnの組
+VECTOR_COLUMNS: dict[str, list[str]] = {
+    "pos": ["x", "y", "z"],
+    "force": ["fx", "fy", "fz"],
+    "velocity": ["vx", "vy", "vz"],
+}
+
+
+def make_frame_sharing_para(para_source) -> SimulationFrame:
+    """para_sourceとatom_symbol_to_type, atom_type_to_symbol, atom_type_to_mass, limda_defaultを共有する
+    空のSimulationFrameを作る.
+    SimulationFrame()と違い.limda.yamlを読み込まないので、大量のフレームを作るときに使う.
+    """
+    sf = SimulationFrame.__new__(SimulationFrame)
+    sf.atoms = None
+    sf.cell = None
+    sf.atom_symbol_to_type = para_source.atom_symbol_to_type
+    sf.atom_type_to_symbol = para_source.atom_type_to_symbol
+    sf.atom_type_to_mass = para_source.atom_type_to_mass
+    sf.step_num = None
+    sf.potential_energy = None
+    sf.virial_tensor = None
+    sf.pred_potential_energy = None
+    sf.pred_virial_tensor = None
+    sf.limda_default = para_source.limda_default
+    return sf
+
+
+class Trajectory:
+    """SimulationFramesのフレームを連続した配列として保持するクラス
+    原子数が全フレームで同じときに使用できる.
+
+    sfs.pack_sfs()を実行すると、sfs.sfはlist[SimulationFrame]からTrajectoryに置き換わる.
+    trajectory[frame_idx]はそのフレームのSimulationFrame(view)を返すので、
+    sfs.sf[frame_idx]を用いている既存のメソッドはそのまま使える.
+
+    Attributes
+    ----------
+    atom_arrays : dict[str, np.ndarray]
+        原子ごとの値が入った配列
+        "pos", "force", "velocity"はshape:(frames, atoms, 3)
+        それ以外のcolumnはshape:(frames, atoms)
+    shared_arrays : dict[str, np.ndarray]
+        全フレームで同じ値を持つcolumn(typeなど), shape:(atoms,)
+    frame_arrays : dict[str, np.ndarray]
+        フレームごとの値が入った配列
+        "cell" shape:(frames, 3)または(frames, 3, 3), "potential_energy" shape:(frames,),
+        "virial_tensor" shape:(frames, 3, 3), "step_num" shape:(frames,)
+    columns : list[str]
+        viewのatomsのcolumnの順番
+    """
+    atom_arrays: dict[str, np.ndarray]
+    shared_arrays: dict[str, np.ndarray]
+    frame_arrays: dict[str, np.ndarray]
+    columns: list[str]
+    atom_symbol_to_type: dict[str, int]
+    atom_type_to_symbol: dict[int, str]
+    atom_type_to_mass: dict[int, float]
+    limda_default: dict[str, Any]
+
+    def __init__(self,
+                 atom_arrays: dict[str, np.ndarray],
+                 shared_arrays: dict[str, np.ndarray],
+                 frame_arrays: dict[str, np.ndarray],
+                 columns: list[str],
+                 para_source=None):
+        self.atom_arrays = atom_arrays
+        self.shared_arrays = shared_arrays
+        self.frame_arrays = frame_arrays
+        self.columns = columns
+        self.atom_symbol_to_type = None
+        self.atom_type_to_symbol = None
+        self.atom_type_to_mass = None
+        self.limda_default = {}
+        if para_source is not None:
+            self.set_para(para_source)
+
+    @classmethod
+    def from_frames(cls, frames, para_source=None, use_float32: bool = False):
+        """SimulationFrameのlistからTrajectoryを作る
+        Parameters
+        ----------
+            frames: list[SimulationFrame]
+                まとめるフレーム, 原子数はすべて同じである必要がある
+            para_source: SimulationFrames
+                atom_symbol_to_typeなどを共有するsfs
+            use_float32: bool
+                Trueならば座標, 力, 速度をfloat32で保持する
+        """
+        assert len(frames) > 0, "frames is empty"
+        first_frame = frames[0]
+        frame_num = len(frames)
+        atom_num = first_frame.get_total_atoms()
+        columns = list(first_frame.atoms.columns)
+
+        float_dtype = np.float32 if use_float32 else np.float64
+        atom_arrays = {}
+        grouped_columns = set()
+        for name, vector_columns in VECTOR_COLUMNS.items():
+            if not all(col in columns for col in vector_columns):
+                continue
+            atom_arrays[name] = np.empty(
+                (frame_num, atom_num, 3), dtype=float_dtype)
+            grouped_columns.update(vector_columns)
+        for col in columns:
+            if col not in grouped_columns:
+                atom_arrays[col] = np.empty(
+                    (frame_num, atom_num), dtype=first_frame.atoms[col].dtype)
+
+        frame_values = {"cell": [], "potential_energy": [],
+                        "virial_tensor": [], "step_num": []}
+        # lazyなsfsでも各フレームを一度だけ読み込むように1回のloopで詰める
+        for frame_idx in range(frame_num):
+            frame = frames[frame_idx]
+            assert frame.get_total_atoms() == atom_num, \
+                "all frames must have the same number of atoms"
+            assert list(frame.atoms.columns) == columns, \
+                "all frames must have the same columns"
+            for name, vector_columns in VECTOR_COLUMNS.items():
+                if name in atom_arrays:
+                    atom_arrays[name][frame_idx] = frame.atoms[vector_columns].values
+            for col in columns:
+                if col not in grouped_columns:
+                    atom_arrays[col][frame_idx] = frame.atoms[col].values
+            for key in frame_values:
+                frame_values[key].append(getattr(frame, key))
+
+        # 全フレームで同じ値を持つcolumnは(atoms,)の配列一つにまとめる
+        shared_arrays = {}
+        for col in columns:
+            if col in grouped_columns:
+                continue
+            if np.all(atom_arrays[col] == atom_arrays[col][0]):
+                shared_arrays[col] = atom_arrays.pop(col)[0].copy()
+
+        frame_arrays = {}
+        frame_dtypes = {"cell": np.float64, "potential_energy": np.float64,
+                        "virial_tensor": np.float64, "step_num": np.int64}
+        for key, values in frame_values.items():
+            if all(value is not None for value in values):
+                frame_arrays[key] = np.array(values, dtype=frame_dtypes[key])
+
+        return cls(atom_arrays, shared_arrays, frame_arrays, columns, para_source)
+
+    def set_para(self, para_source) -> None:
+        """para_sourceのatom_symbol_to_type, atom_type_to_symbol, atom_type_to_mass, limda_defaultを共有する
+        """
+        self.atom_symbol_to_type = para_source.atom_symbol_to_type
+        self.atom_type_to_symbol = para_source.atom_type_to_symbol
+        self.atom_type_to_mass = para_source.atom_type_to_mass
+        self.limda_default = para_source.limda_default
+
+    def __len__(self) -> int:
+        for arrays in (self.frame_arrays, self.atom_arrays):
+            for array in arrays.values():
+                return len(array)
+        return 0
+
+    def __getitem__(self, key) -> Union[SimulationFrame, "Trajectory"]:
+        """trajectory[frame_idx]でSimulationFrame(view)を、
+        trajectory[start:stop:step]でTrajectory(配列のview)を返す
+        """
+        if isinstance(key, slice):
+            return self.take(key)
+        return self.get_frame(key)
+
+    def __iter__(self):
+        for frame_idx in range(len(self)):
+            yield self.get_frame(frame_idx)
+
+    def get_atom_num(self) -> int:
+        """1フレームあたりの原子数を返す
+        """
+        for array in self.atom_arrays.values():
+            return array.shape[1]
+        for array in self.shared_arrays.values():
+            return len(array)
+        return 0
+
+    def take(self, indices) -> "Trajectory":
+        """indicesで指定したフレームのみからなるTrajectoryを返す
+        indicesがsliceのときは配列のviewになり、コピーされない
+        Parameters
+        ----------
+            indices: Union[slice, list[int], np.ndarray]
+                取り出すフレームのindex
+        """
+        if not isinstance(indices, slice):
+            indices = np.asarray(indices, dtype=np.int64)
+        atom_arrays = {name: array[indices]
+                       for name, array in self.atom_arrays.items()}
+        frame_arrays = {name: array[indices]
+                        for name, array in self.frame_arrays.items()}
+        trajectory = Trajectory(atom_arrays, self.shared_arrays,
+                                frame_arrays, self.columns)
+        trajectory.set_para(self)
+        return trajectory
+
+    def get_frame(self, frame_idx: int, copy: bool = False) -> SimulationFrame:
+        """frame_idx番目のフレームをSimulationFrameとして返す
+        Parameters
+        ----------
+            frame_idx: int
+                フレームのindex
+            copy: bool
+                Falseのときはsf.atomsの値がTrajectoryの配列と共有されることがある
+                Trueのときはsf.atomsはTrajectoryと独立になる
+        Note
+        ----
+            sf.atomsを変更してもTrajectoryには反映されません.
+        """
+        frame_num = len(self)
+        if frame_idx < 0:
+            frame_idx += frame_num
+        if not 0 <= frame_idx < frame_num:
+            raise IndexError(f"frame index {frame_idx} is out of range")
+
+        atom_data = {}
+        for name, vector_columns in VECTOR_COLUMNS.items():
+            if name not in self.atom_arrays:
+                continue
+            values = self.atom_arrays[name][frame_idx]
+            for dim, col in enumerate(vector_columns):
+                atom_data[col] = values[:, dim]
+        for col in self.columns:
+            if col in atom_data:
+                continue
+            if col in self.shared_arrays:
+                atom_data[col] = self.shared_arrays[col]
+            else:
+                atom_data[col] = self.atom_arrays[col][frame_idx]
+
+        sf = make_frame_sharing_para(self)
+        sf.atoms = pd.DataFrame(
+            {col: atom_data[col] for col in self.columns}, copy=copy)
+        if "cell" in self.frame_arrays:
+            sf.cell = self.frame_arrays["cell"][frame_idx].copy()
+        if "step_num" in self.frame_arrays:
+            sf.step_num = int(self.frame_arrays["step_num"][frame_idx])
+        if "potential_energy" in self.frame_arrays:
+            sf.potential_energy = float(
+                self.frame_arrays["potential_energy"][frame_idx])
+        if "virial_tensor" in self.frame_arrays:
+            sf.virial_tensor = self.frame_arrays["virial_tensor"][frame_idx].copy()
+        return sf
+
+    def get_frames(self) -> list[SimulationFrame]:
+        """全フレームを独立したSimulationFrameのlistとして返す
+        """
+        return [self.get_frame(frame_idx, copy=True) for frame_idx in range(len(self))]
+
+    def get_step_nums(self) -> list[int]:
+        """viewを作らずにステップ数のリストを返す
+        """
+        if "step_num" in self.frame_arrays:
+            return self.frame_arrays["step_num"].tolist()
+        return [None for _ in range(len(self))]
@@ -0,0 +1,159 @@
+import numpy as np
+import pathlib
+from typing import Union, Iterator
+from xml.etree.ElementTree import XMLPullParser
+from . import const as C
+from .compression import open_file
+
+# byte列の段階で読み飛ばす要素, 大きいがフレームの作成には使わない
+SKIP_TAGS: tuple[bytes, ...] = (b"eigenvalues", b"eigenvalues_kpoints_opt",
+                                b"projected", b"projected_kpoints_opt", b"dos")
+TAG_END_CHARS: bytes = b"> \t\r\n/"
+READ_SIZE: int = 1 << 22
+
+
+def find_skip_tag(buffer: bytes, skip_tags: tuple[bytes, ...],
+                  start_patterns: list[bytes]) -> tuple[int, bytes]:
+    """buffer内で最初に現れるskip_tagsの開始tagの位置とtag名を返す. 見つからなければ(-1, None)
+    """
+    start_idx = -1
+    start_tag = None
+    for tag, pattern in zip(skip_tags, start_patterns):
+        idx = buffer.find(pattern)
+        while idx >= 0:
+            end_char = buffer[idx + len(pattern):idx + len(pattern) + 1]
+            if end_char in TAG_END_CHARS and end_char != b"":
+                break
+            idx = buffer.find(pattern, idx + 1)
+        if idx >= 0 and (start_idx < 0 or idx < start_idx):
+            start_idx = idx
+            start_tag = tag
+    return start_idx, start_tag
+
+
+def iter_skipped_chunks(f, skip_tags: tuple[bytes, ...] = SKIP_TAGS,
+                        read_size: int = READ_SIZE) -> Iterator[bytes]:
+    """fからbyte列を読み、skip_tagsの要素(開始tagから終了tagまで)を取り除いたbyte列を返すgenerator
+    取り除いた部分はXMLとしてparseしないので、eigenvaluesやdosが大きくてもdiskの読み込み速度で読める.
+    """
+    start_patterns = [b"<" + tag for tag in skip_tags]
+    keep_size = max(map(len, start_patterns)) + 1
+    buffer = b""
+    skipping_end = None
+    while True:
+        data = f.read(read_size)
+        buffer += data
+        while True:
+            if skipping_end is not None:
+                end_idx = buffer.find(skipping_end)
+                if end_idx < 0:
+                    # 終了tagがchunkの境目にかかっても見つけられるように末尾だけ残す
+                    buffer = buffer[-len(skipping_end):]
+                    break
+                buffer = buffer[end_idx + len(skipping_end):]
+                skipping_end = None
+                continue
+
+            start_idx, start_tag = find_skip_tag(buffer, skip_tags, start_patterns)
+            if start_tag is not None:
+                yield buffer[:start_idx]
+                buffer = buffer[start_idx:]
+                skipping_end = b"</" + start_tag + b">"
+                continue
+            # 開始tagがchunkの境目にかかっている可能性がある部分は残す
+            if data:
+                split_idx = max(len(buffer) - keep_size, 0)
+            else:
+                split_idx = len(buffer)
+            yield buffer[:split_idx]
+            buffer = buffer[split_idx:]
+            break
+        if not data:
+            return
+
+
+def parse_varray(element) -> np.ndarray:
+    """<varray><v>..</v>...</varray>をshape:[vの数, 列数]の配列にする
+    """
+    rows = [v.text for v in element.iter("v")]
+    values = np.array(" ".join(rows).split(), dtype=np.float64)
+    return values.reshape(len(rows), -1)
+
+
+def iter_vasprun_frames(file_path: Union[str, pathlib.Path], NELM: int = 1e6,
+                        triclinic: bool = False) -> Iterator[dict]:
+    """vasprun.xmlの<calculation>(イオンステップ)を1つずつ読み、配列にして返すgenerator
+    XMLPullParserで少しずつparseし、読み終わった要素は捨てるのでDOM全体は作らない.
+    Parameters
+    ----------
+        file_path: Union[str, pathlib.Path]
+            vasprun.xmlのpath
+        NELM: int
+            最大のIteration回数, <scstep>の数がNELMに達したイオンステップは返さない
+        triclinic: bool
+            Trueならばcellをshape:(3, 3)の格子ベクトルで返す
+    Yields
+    ------
+        frame: dict
+            "atom_symbols": list[str], 原子の元素記号
+            "cell": np.ndarray, shape:[3](float32)またはshape:[3, 3](triclinic=True)
+            "pos": np.ndarray[float], shape:[atoms, 3], cartesian座標
+            "force": np.ndarray[float], shape:[atoms, 3]
+            "potential_energy": float, energy without entropy
+            "virial_tensor": np.ndarray[float32], shape:[3, 3], stress(kB) * 体積 / 1602.1766208
+    """
+    parser = XMLPullParser(events=("start", "end"))
+    atom_symbols = None
+    path = []
+    root = None
+    with open_file(file_path, "rb") as f:
+        for chunk in iter_skipped_chunks(f):
+            parser.feed(chunk)
+            for event, element in parser.read_events():
+                if event == "start":
+                    if root is None:
+                        root = element
+                    path.append(element.tag)
+                    if element.tag == "calculation":
+                        scstep_num = 0
+                        basis = positions = force = stress = potential_energy = None
+                    continue
+
+                path.pop()
+                tag = element.tag
+                if tag == "array" and element.get("name") == "atoms" and path[-1] == "atominfo":
+                    atom_symbols = [rc[0].text.strip() for rc in element.iter("rc")]
+                if tag != "calculation" and "calculation" not in path:
+                    continue
+
+                if tag == "scstep" and path[-1] == "calculation":
+                    scstep_num += 1
+                    element.clear()
+                elif tag == "varray" and path[-1] == "crystal" and element.get("name") == "basis":
+                    basis = parse_varray(element)
+                elif tag == "varray" and path[-1] == "structure" and element.get("name") == "positions":
+                    positions = parse_varray(element)
+                elif tag == "varray" and path[-1] == "calculation" and element.get("name") == "forces":
+                    force = parse_varray(element)
+                elif tag == "varray" and path[-1] == "calculation" and element.get("name") == "stress":
+                    stress = parse_varray(element)
+                elif tag == "i" and path[-1] == "energy" and path[-2] == "calculation" \
+                        and element.get("name") == "e_wo_entrp":
+                    potential_energy = float(element.text)
+                elif tag == "calculation":
+                    root.clear()
+                    if scstep_num >= NELM:
+                        continue
+                    if triclinic:
+                        cell = basis
+                    else:
+                        cell = np.empty(3, dtype=np.float32)
+                        for dim in range(3):
+                            cell[dim] = basis[dim][dim]
+                    volume = abs(np.linalg.det(basis))
+                    yield {"atom_symbols": atom_symbols,
+                           "cell": cell,
+                           "pos": positions @ basis,
+                           "force": force,
+                           "potential_energy": potential_energy,
+                           "virial_tensor": (stress * volume / C.EV_PER_ANGSTROM3_TO_KBAR).astype(np.float32)}
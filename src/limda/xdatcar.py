@@ -0,0 +1,76 @@
+import numpy as np
+import pathlib
+from typing import Union, Iterator
+from .compression import open_file
+
+
+def read_xdatcar_header(f) -> tuple[np.ndarray, list[str], list[int]]:
+    """XDATCARのheader(comment行の次のscaleの行から原子数の行まで)を読み、(格子ベクトル, 元素記号, 元素ごとの原子数)を返す
+    """
+    scale = float(f.readline().split()[0])
+    lattice = np.array([f.readline().split()[:3] for _ in range(3)], dtype=np.float64)
+    symbol_spline = f.readline().split()
+    assert not symbol_spline[0].isdigit(), "XDATCAR without element symbols (VASP 4 format) is not supported"
+    atom_symbols = [symbol.decode() for symbol in symbol_spline]
+    atom_nums = [int(atom_num) for atom_num in f.readline().split()]
+    if scale < 0:
+        # 負のscaleは体積を表す
+        scale = (-scale / abs(np.linalg.det(lattice))) ** (1 / 3)
+    return lattice * scale, atom_symbols, atom_nums
+
+
+def iter_xdatcar_frames(file_path: Union[str, pathlib.Path], start: int = 0, stop: int = None,
+                        step: int = 1) -> Iterator[tuple[int, np.ndarray, list[str], np.ndarray]]:
+    """XDATCARの構造をstart番目からstop番目までstepおきに1つずつ読むgenerator
+    読み飛ばす構造の行はparseしない.
+    NPT(ISIF=3)などでcellが変わるXDATCARでは構造ごとにheaderが入っているので、そのheaderを読んでcellを更新する.
+    Parameters
+    ----------
+        file_path: Union[str, pathlib.Path]
+            XDATCARのpath
+        start: int
+            最初に読む構造のindex(0-indexed)
+        stop: int
+            このindexの構造より前まで読む, Noneならば最後まで
+        step: int
+            いくつおきに構造を読むのか
+    Yields
+    ------
+        (configuration番号, 格子ベクトル shape:[3, 3], 原子ごとの元素記号, cartesian座標 shape:[atoms, 3])
+    """
+    assert start >= 0 and step >= 1, "start must be >= 0 and step must be >= 1"
+    with open_file(file_path, "rb") as f:
+        f.readline()  # comment
+        lattice, atom_symbols, atom_nums = read_xdatcar_header(f)
+        atom_num = sum(atom_nums)
+        symbols = [atom_symbol for atom_symbol, num in zip(atom_symbols, atom_nums) for _ in range(num)]
+        frame_idx = 0
+        while stop is None or frame_idx < stop:
+            line = f.readline()
+            if not line:
+                return
+            spline = line.split()
+            if len(spline) == 0:
+                continue
+            if spline[0] not in (b"Direct", b"Cartesian"):
+                # cellが変わるXDATCARでは構造ごとにheaderがある
+                lattice, _, _ = read_xdatcar_header(f)
+                continue
+
+            if frame_idx < start or (frame_idx - start) % step != 0:
+                for _ in range(atom_num):
+                    f.readline()
+                frame_idx += 1
+                continue
+
+            lines = [f.readline() for _ in range(atom_num)]
+            values = np.array(b" ".join(lines).split(), dtype=np.float64)
+            if len(values) != atom_num * 3:
+                # 書き込み途中の構造
+                return
+            pos = values.reshape(atom_num, 3)
+            if spline[0] == b"Direct":
+                pos = pos @ lattice
+            configuration_num = int(spline[-1].split(b"=")[-1])
+            yield configuration_num, lattice.copy(), symbols, pos
+            frame_idx += 1
@@ -19,6 +19,9 @@ if __name__ == "__main__":
     parser.add_argument(
         "-s", "--skip_num", default=None, type=int,  help="いくつおきにdumpposを読み込むのか"
     )
+    parser.add_argument(
+        "-n", "--num_workers", default=2, type=int, help="書き込み中に次のフレームの文字列を作るthreadの数"
+    )
     args = parser.parse_args()
 
     assert args.dir_path is not None, "dir_pathを設定してください"
@@ -26,5 +29,6 @@ if __name__ == "__main__":
     sfs = SimulationFrames()
     if args.para_str:
         sfs.import_para_from_str(args.para_str)
-    sfs.import_dumpposes(dir_name=args.dir_path, skip_num=args.skip_num)
-    sfs.export_lammps_dumpposes(args.output_file_name)
+    # 全フレームをメモリに乗せず、1フレームずつ読み込みながら書き込む
+    sfs.import_dumpposes(dir_name=args.dir_path, skip_num=args.skip_num, lazy=True, cache_size=1)
+    sfs.export_lammps_dumpposes(args.output_file_name, num_workers=args.num_workers)